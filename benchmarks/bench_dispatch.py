@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Measures how many transactions per second Decode.update can dispatch. The
+transactions from docs/SAMPLE_INPUT.txt are parsed once and then replayed
+SCALE times (1000 by default) through two decoders:
+
+    legacy    The three dictionary lookups and getattr() that were used before
+              the 256-entry dispatch table was added
+    table     The current Decode.update
+
+USAGE:    python bench_dispatch.py [-s SCALE] [-i INPUT_FILE]
+
+"""
+from __future__ import print_function
+
+import argparse
+import imp
+import os.path
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DECODER_PATH = os.path.join(ROOT_DIR, 'nrf24l01p-decode', 'nrf24l01p-decode.py')
+SAMPLE_INPUT_PATH = os.path.join(ROOT_DIR, 'docs', 'SAMPLE_INPUT.txt')
+
+nrf = imp.load_source('nrf24l01p_decode', DECODER_PATH)
+
+
+class LegacyDecode(nrf.Decode):
+    """Dispatches commands the way Decode.update did before the table."""
+
+    def update(self, ts, transaction_id, mosi_data, miso_data, end_ts=None):
+        cmd = mosi_data[0]
+        mosi_data = mosi_data[1:]
+
+        status = miso_data[0]
+        miso_data = miso_data[1:]
+
+        if (len(mosi_data) != len(miso_data)):
+            sys.stderr.write('ERROR: MISO and MOSI data lengths do not match\r\n')
+            return
+
+        if ((cmd & self.RW_REGISTER_CMD_MASK) in (0x00, 0x20)):
+            cmd_props = self.COMMANDS.get(cmd & self.RW_REGISTER_CMD_MASK)
+            return self._legacy_update(ts, transaction_id, cmd_props, status,
+                                       mosi_data, miso_data,
+                                       (cmd & self.RW_REGISTER_VALUE_MASK))
+
+        cmd_props = self.COMMANDS.get(cmd & self.W_ACK_PAYLOAD_CMD_MASK)
+        if ((cmd_props is not None) and (0xA8 == (cmd & self.W_ACK_PAYLOAD_CMD_MASK))):
+            return self._legacy_update(ts, transaction_id, cmd_props, status,
+                                       mosi_data, miso_data,
+                                       (cmd & self.W_ACK_PAYLOAD_VALUE_MASK))
+
+        cmd_props = self.COMMANDS.get(cmd)
+        if (cmd_props is not None):
+            return self._legacy_update(ts, transaction_id, cmd_props, status,
+                                       mosi_data, miso_data)
+
+        raise nrf.DecodeError('ERROR: Failed to process command: 0x%X' % cmd)
+
+    def _legacy_update(self, ts, transaction_id, cmd_props, status, mosi_data,
+                       miso_data, packed_index=None):
+        cmd_name = cmd_props[0]
+        min_data_len, max_data_len = cmd_props[1]
+
+        self.reg_values[self.REGISTER_LOOKUP['STATUS']][0] = status
+
+        func = getattr(self, ('_' + cmd_name.lower()))
+        if (min_data_len <= len(mosi_data) <= max_data_len):
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+
+
+def load_transactions(file_name):
+    with open(file_name) as in_file:
+        return list(nrf._iter_transactions(in_file))
+
+
+def run(decoder_class, transactions, scale):
+    """Returns the number of transactions that were dispatched per second."""
+    decoder = decoder_class()
+    update = decoder.update
+    log = decoder.transactions
+
+    # Errors for malformed transactions in the sample would flood the console.
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        for _ in range(scale):
+            for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+                update(ts, packet_id, mosi_data, miso_data, end_ts)
+            log.clear()
+        elapsed = time.time() - start
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+    return ((len(transactions) * scale) / elapsed)
+
+
+if ("__main__" == __name__):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_file', dest='input_file_name',
+                        default=SAMPLE_INPUT_PATH)
+    parser.add_argument('-s', '--scale', dest='scale', type=int, default=1000)
+    args = parser.parse_args()
+
+    transactions = load_transactions(args.input_file_name)
+    print('{:<25s} {:d} x {:d}'.format('Transactions:', len(transactions), args.scale))
+
+    legacy_tps = run(LegacyDecode, transactions, args.scale)
+    print('{:<25s} {:,.0f} transactions/s'.format('Legacy dispatch:', legacy_tps))
+
+    table_tps = run(nrf.Decode, transactions, args.scale)
+    print('{:<25s} {:,.0f} transactions/s'.format('Dispatch table:', table_tps))
+
+    print('{:<25s} {:.2f}x'.format('Speedup:', (table_tps / legacy_tps)))
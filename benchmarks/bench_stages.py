@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""Measures the throughput and peak memory usage of each stage of a decode.
+A synthetic capture with COUNT transactions (100000 by default) is generated
+with gen_capture.py unless an input file is given. Each stage is then run in
+a fresh interpreter so that its peak RSS isn't affected by the others:
+
+    parse     Parsing the input file into transactions (as parse_file does)
+    dispatch  Decode.update for every transaction
+    render    Decode.render for every decoded transaction
+    collapse  Decode.iter_collapsed for all decoded transactions (as
+              --collapse does)
+    write     Writing the rendered lines to the output file
+    total     parse_file followed by writing the output file (as the
+              command line does)
+    summary   summarize_file (as the command line does without -o)
+
+The results are printed (or written to RESULTS_FILE) as JSON so they can be
+compared between versions:
+
+    {"transactions": 100000, "input_size": 7718294, "numpy": true, ...
+     "stages": {"parse": {"seconds": 0.62, "transactions_per_s": 161290.3,
+                          "start_rss_kb": 9632, "peak_rss_kb": 10012}, ...}}
+
+peak_rss_kb includes the memory used to prepare the stage's input, which is
+start_rss_kb.
+
+USAGE:    python bench_stages.py [-n COUNT] [-i INPUT_FILE] [-o RESULTS_FILE]
+                                 [--mix status=50,tx=25] [--stages parse,render]
+
+"""
+from __future__ import print_function
+
+import argparse
+import imp
+import json
+import os
+import os.path
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import gen_capture
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DECODER_PATH = os.path.join(ROOT_DIR, 'nrf24l01p-decode', 'nrf24l01p-decode.py')
+
+STAGES = ('parse', 'dispatch', 'render', 'collapse', 'write', 'total', 'summary')
+
+
+def load_decoder():
+    return imp.load_source('nrf24l01p_decode', DECODER_PATH)
+
+
+def get_peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if ('darwin' == sys.platform):
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        rss //= 1024
+    return rss
+
+
+def run_stage(stage, file_name, scratch_dir):
+    """Runs one stage and returns (seconds, transaction_count, start_rss_kb).
+    The transaction_count is None if the stage doesn't know it.
+
+    """
+    nrf = load_decoder()
+
+    if ('parse' == stage):
+        start_rss = get_peak_rss_kb()
+        start = time.time()
+        count = 0
+        for transaction in nrf._iter_input_transactions(file_name):
+            count += 1
+        return ((time.time() - start), count, start_rss)
+
+    if ('total' == stage):
+        start_rss = get_peak_rss_kb()
+        start = time.time()
+        decoder = nrf.parse_file(file_name)
+        with open(os.path.join(scratch_dir, 'total.txt'), 'wb') as out_file:
+            nrf._write_header(out_file, file_name)
+            nrf._write_summary(out_file, decoder)
+            out_file.write(decoder.__repr__())
+        return ((time.time() - start), len(decoder.transactions), start_rss)
+
+    if ('summary' == stage):
+        start_rss = get_peak_rss_kb()
+        start = time.time()
+        decoder = nrf.summarize_file(file_name)
+        return ((time.time() - start), None, start_rss)
+
+    transactions = list(nrf._iter_input_transactions(file_name))
+    decoder = nrf.Decode()
+    if ('dispatch' == stage):
+        start_rss = get_peak_rss_kb()
+        update = decoder.update
+        start = time.time()
+        for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+            update(ts, packet_id, mosi_data, miso_data, end_ts)
+        return ((time.time() - start), len(transactions), start_rss)
+
+    for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+        decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+    del transactions
+
+    render = decoder.render
+    if ('render' == stage):
+        start_rss = get_peak_rss_kb()
+        start = time.time()
+        for transaction in decoder.transactions:
+            render(transaction)
+        return ((time.time() - start), len(decoder.transactions), start_rss)
+
+    if ('collapse' == stage):
+        start_rss = get_peak_rss_kb()
+        start = time.time()
+        for msg in decoder.iter_collapsed(decoder.transactions):
+            pass
+        return ((time.time() - start), len(decoder.transactions), start_rss)
+
+    if ('write' == stage):
+        msgs = [render(transaction) for transaction in decoder.transactions]
+        start_rss = get_peak_rss_kb()
+        start = time.time()
+        with open(os.path.join(scratch_dir, 'write.txt'), 'wb') as out_file:
+            for msg in msgs:
+                out_file.write(msg + os.linesep)
+        return ((time.time() - start), len(msgs), start_rss)
+
+    raise ValueError('Unknown stage: %s' % stage)
+
+
+def measure_stage(stage, file_name, scratch_dir, transaction_count):
+    """Runs a stage in a new interpreter and returns its results."""
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                      '--run_stage', stage,
+                                      '-i', file_name,
+                                      '--scratch_dir', scratch_dir])
+    result = json.loads(output)
+
+    count = result.pop('count')
+    if (count is None):
+        count = transaction_count
+    seconds = result['seconds']
+    result['transactions_per_s'] = ((count / seconds) if seconds else None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', dest='count', type=int, default=100000)
+    parser.add_argument('-i', '--input_file', dest='input_file_name')
+    parser.add_argument('-o', '--output_file', dest='output_file_name')
+    parser.add_argument('--mix', dest='mix', type=gen_capture.parse_mix,
+                        default=gen_capture.DEFAULT_MIX)
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    parser.add_argument('--stages', dest='stages', default=','.join(STAGES))
+    parser.add_argument('--run_stage', dest='run_stage', help=argparse.SUPPRESS)
+    parser.add_argument('--scratch_dir', dest='scratch_dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if (args.run_stage is not None):
+        # Sends the results of a single stage back to measure_stage.
+        seconds, count, start_rss = run_stage(args.run_stage, args.input_file_name,
+                                              args.scratch_dir)
+        json.dump(dict(seconds=seconds,
+                       count=count,
+                       start_rss_kb=start_rss,
+                       peak_rss_kb=get_peak_rss_kb()),
+                  sys.stdout)
+        return
+
+    stages = args.stages.split(',')
+    for stage in stages:
+        if (not stage in STAGES):
+            parser.error('Unknown stage: %s' % stage)
+
+    scratch_dir = tempfile.mkdtemp(prefix='nrf24l01p-bench-')
+    try:
+        file_name = args.input_file_name
+        if (file_name is None):
+            file_name = os.path.join(scratch_dir, 'capture.txt')
+            with open(file_name, 'w') as out_file:
+                gen_capture.generate(out_file, args.count, args.mix, args.seed)
+
+        nrf = load_decoder()
+        results = dict(version=nrf.VERSION[0],
+                       python=platform.python_version(),
+                       numpy=(nrf.numpy is not None),
+                       input_file=args.input_file_name,
+                       input_size=os.path.getsize(file_name),
+                       transactions=sum(1 for _ in nrf._iter_input_transactions(file_name)),
+                       stages={})
+        if (args.input_file_name is None):
+            results.update(mix=dict(args.mix), seed=args.seed)
+
+        for stage in stages:
+            results['stages'][stage] = measure_stage(stage, file_name, scratch_dir,
+                                                     results['transactions'])
+    finally:
+        shutil.rmtree(scratch_dir)
+
+    if (args.output_file_name is None):
+        print(json.dumps(results, indent=4, sort_keys=True))
+    else:
+        with open(args.output_file_name, 'w') as out_file:
+            json.dump(results, out_file, indent=4, sort_keys=True)
+
+
+if ("__main__" == __name__):
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Checks that -f survives the SIGUSR1 refresh while it follows stdin. The
+first LINES lines of the input file (docs/SAMPLE_INPUT.txt by default) are
+piped into the decoder, SIGUSR1 is sent while it waits for more, and then the
+rest of the file is piped in. The summary has to be printed to stderr and the
+decoded lines on stdout have to match the output of a sequential decode.
+
+USAGE:    python check_follow.py [-i INPUT_FILE] [-n LINES]
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import os.path
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DECODER_PATH = os.path.join(ROOT_DIR, 'nrf24l01p-decode', 'nrf24l01p-decode.py')
+SAMPLE_INPUT_PATH = os.path.join(ROOT_DIR, 'docs', 'SAMPLE_INPUT.txt')
+
+
+def read_decoded_lines(file_name):
+    """Returns the decoded lines of an output file (after the summary)."""
+    with open(file_name) as in_file:
+        lines = in_file.read().splitlines()
+    return lines[(lines.index('-' * 80, 4) + 1):]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_file', dest='input_file_name',
+                        default=SAMPLE_INPUT_PATH)
+    parser.add_argument('-n', '--lines', dest='lines', type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.input_file_name) as in_file:
+        lines = in_file.readlines()
+
+    scratch_dir = tempfile.mkdtemp(prefix='nrf24l01p-check-')
+    try:
+        output_name = os.path.join(scratch_dir, 'sequential.txt')
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, DECODER_PATH,
+                                   '-i', args.input_file_name, '-o', output_name],
+                                  stderr=devnull)
+        expected = read_decoded_lines(output_name)
+
+        stdout_name = os.path.join(scratch_dir, 'stdout.txt')
+        stderr_name = os.path.join(scratch_dir, 'stderr.txt')
+        with open(stdout_name, 'w') as stdout, open(stderr_name, 'w') as stderr:
+            process = subprocess.Popen([sys.executable, DECODER_PATH, '-i', '-', '-f'],
+                                       stdin=subprocess.PIPE, stdout=stdout, stderr=stderr)
+            process.stdin.write(''.join(lines[:args.lines]))
+            process.stdin.flush()
+            # Gives the decoder time to start waiting in select.
+            time.sleep(1.0)
+            process.send_signal(signal.SIGUSR1)
+            time.sleep(0.5)
+            try:
+                process.stdin.write(''.join(lines[args.lines:]))
+                process.stdin.close()
+            except IOError as e:
+                print('FAILED: writing to the decoder failed: %s' % e)
+            returncode = process.wait()
+
+        with open(stderr_name) as in_file:
+            errors = in_file.read()
+        with open(stdout_name) as in_file:
+            decoded = in_file.read().splitlines()
+
+        failures = []
+        if (0 != returncode):
+            failures.append('exit code %d' % returncode)
+        if (errors.count('Packet format:') < 2):
+            failures.append('the summary was not printed on SIGUSR1')
+        if (decoded != expected):
+            failures.append('the decoded lines differ from the sequential decode')
+    finally:
+        shutil.rmtree(scratch_dir)
+
+    for failure in failures:
+        print('FAILED: ' + failure)
+    if (failures):
+        print(errors)
+        sys.exit(1)
+    print('OK')
+
+
+if ("__main__" == __name__):
+    main()
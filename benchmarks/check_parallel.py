@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Checks that decoding with -j produces the same output file and the same
+errors as the sequential decode. The captures are generated with
+gen_capture.py (plus docs/SAMPLE_INPUT.txt) and each one is decoded with and
+without -s. The mixes cover sections that have to be decoded again from the
+real state (the configuration is only written at the start), sections that
+converge with the worker's checkpoints (the configuration is written again),
+Beken bank switches, and errors, which are only reported by the workers.
+
+The number of sections that converged is counted by reconciling the sections
+in this process as well.
+
+USAGE:    python check_parallel.py [-n COUNT] [-j JOBS] [--seeds 0,1]
+
+"""
+from __future__ import print_function
+
+import argparse
+import imp
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import gen_capture
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DECODER_PATH = os.path.join(ROOT_DIR, 'nrf24l01p-decode', 'nrf24l01p-decode.py')
+SAMPLE_INPUT_PATH = os.path.join(ROOT_DIR, 'docs', 'SAMPLE_INPUT.txt')
+
+# Each case is (name, mix, whether some sections are expected to converge).
+CASES = (
+    ('default', gen_capture.DEFAULT_MIX, False),
+    ('config', gen_capture.parse_mix('status=40,tx=25,rx=10,hop=10,config=10,error=5'), True),
+    ('beken', gen_capture.parse_mix('status=30,tx=20,rx=10,hop=10,beken=20,config=10'), True),
+)
+
+
+def decode(input_file_name, output_file_name, options):
+    """Returns (output lines without the date, sorted stderr lines)."""
+    process = subprocess.Popen([sys.executable, DECODER_PATH, '-i', input_file_name,
+                                '-o', output_file_name] + options,
+                               stderr=subprocess.PIPE)
+    errors = process.communicate()[1]
+    if (0 != process.returncode):
+        raise RuntimeError('%s failed: %s' % (' '.join(options), errors))
+
+    with open(output_file_name) as in_file:
+        lines = in_file.read().splitlines()
+    del lines[1]
+    return (lines, sorted(errors.splitlines()))
+
+
+def count_converged(decoder_module, file_name, jobs):
+    """Returns (converged, total) for the sections of the input file."""
+    m = decoder_module
+    interval = m.PARALLEL_CHECKPOINT_INTERVAL
+    sections = m._split_file(file_name, (jobs * m.PARALLEL_SECTIONS_PER_PROCESS))
+
+    decoder = m.Decode()
+    set_decode_state = decoder._set_decode_state
+    converged = [0]
+
+    # _set_decode_state is only called when a section converges.
+    def counted_set_decode_state(decode_state):
+        converged[0] += 1
+        set_decode_state(decode_state)
+
+    decoder._set_decode_state = counted_set_decode_state
+
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        for start, end in sections:
+            result = m._decode_section((file_name, start, end, interval))
+            for text in m._reconcile_section(decoder, file_name, start, end, result,
+                                             interval):
+                pass
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+    return (converged[0], len(sections))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', dest='count', type=int, default=20000)
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=2)
+    parser.add_argument('--seeds', dest='seeds', default='0,1')
+    args = parser.parse_args()
+
+    decoder_module = imp.load_source('nrf24l01p_decode', DECODER_PATH)
+
+    scratch_dir = tempfile.mkdtemp(prefix='nrf24l01p-check-')
+    failures = []
+    try:
+        inputs = [('sample', SAMPLE_INPUT_PATH, False)]
+        for seed in [int(seed) for seed in args.seeds.split(',')]:
+            for name, mix, converges in CASES:
+                file_name = os.path.join(scratch_dir, '%s_%d.txt' % (name, seed))
+                with open(file_name, 'w') as out_file:
+                    gen_capture.generate(out_file, args.count, mix, seed)
+                inputs.append(('%s seed %d' % (name, seed), file_name, converges))
+
+        output_name = os.path.join(scratch_dir, 'output.txt')
+        for name, file_name, converges in inputs:
+            for options in ([], ['-s']):
+                expected = decode(file_name, output_name, options)
+                result = decode(file_name, output_name, (['-j', str(args.jobs)] + options))
+                label = ' '.join([name] + options)
+                if (result[0] != expected[0]):
+                    failures.append('%s: the output differs from the sequential decode' % label)
+                if (result[1] != expected[1]):
+                    failures.append('%s: the errors differ from the sequential decode' % label)
+
+            converged, total = count_converged(decoder_module, file_name, args.jobs)
+            print('%-16s %d of %d sections converged' % (name, converged, total))
+            if (converges and (0 == converged)):
+                failures.append('%s: no section converged' % name)
+    finally:
+        shutil.rmtree(scratch_dir)
+
+    for failure in failures:
+        print('FAILED: ' + failure)
+    if (failures):
+        sys.exit(1)
+    print('OK')
+
+
+if ("__main__" == __name__):
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""Generates a synthetic SPI capture in the same format as the Saleae export in
+docs/SAMPLE_INPUT.txt. The capture starts with a typical configuration and is
+followed by COUNT transactions that are randomly chosen from the following
+kinds (the relative weights can be changed with --mix):
+
+    status    R_REGISTER(STATUS) polling
+    tx        Bursts of 1-4 W_TX_PAYLOAD commands with 1-32 byte payloads
+    rx        R_RX_PAYLOAD with a 1-32 byte payload
+    hop       W_REGISTER(RF_CH) to a random channel
+    beken     ACTIVATE bank switch, a write to the Beken register bank, and
+              an ACTIVATE back to the nRF24L01+ registers
+    config    The configuration writes from the start of the capture again
+              (not in the default mix)
+    error     W_REGISTER with too many data bytes, which the decoder reports
+              as an error (not in the default mix)
+
+USAGE:    python gen_capture.py -n COUNT -o out.txt [--mix status=50,tx=25] [--seed SEED]
+
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import sys
+
+HEADER = 'Time [s],Packet ID,MOSI,MISO\n'
+
+DEFAULT_MIX = (('status', 50), ('tx', 25), ('rx', 10), ('hop', 10), ('beken', 5))
+KINDS = ('status', 'tx', 'rx', 'hop', 'beken', 'config', 'error')
+
+# Timing of the sample capture: one byte every 35.7us and 47us from the end of
+# one transaction to the start of the next.
+BYTE_PERIOD = 0.0000356666667
+TRANSACTION_GAP = 0.0000471666667
+
+STATUS = 0x0E
+
+# PWR_UP with 16-bit CRC, 5-byte addresses, 250KBPS, and auto retransmit.
+CONFIG_TRANSACTIONS = (
+    (0x20, 0x0E),
+    (0x21, 0x3F),
+    (0x22, 0x3F),
+    (0x23, 0x03),
+    (0x24, 0x3F),
+    (0x26, 0x27),
+    (0x30, 0xE7, 0xE7, 0xE7, 0xE7, 0xE7),
+    (0x2A, 0xE7, 0xE7, 0xE7, 0xE7, 0xE7),
+)
+
+HEX_STRS = ['0x%02X' % i for i in range(256)]
+
+
+def parse_mix(s):
+    """Parses a str like 'status=50,tx=25' into a list of (kind, weight)."""
+    mix = []
+    for item in s.split(','):
+        kind, weight = item.split('=')
+        if (not kind in KINDS):
+            raise ValueError('Unknown transaction kind: %s' % kind)
+        mix.append((kind, int(weight)))
+    return mix
+
+
+class CaptureWriter(object):
+    """Writes transactions to a file in the Saleae format."""
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.ts = 0.000002166666667
+        self.packet_id = 0
+        self._lines = []
+
+    def write(self, mosi_data, miso_data):
+        lines = self._lines
+        ts = self.ts
+        packet_id = str(self.packet_id)
+        for mosi, miso in zip(mosi_data, miso_data):
+            lines.append('%.15f,%s,%s,%s\n' % (ts, packet_id, HEX_STRS[mosi], HEX_STRS[miso]))
+            ts += BYTE_PERIOD
+        self.ts = (ts + TRANSACTION_GAP)
+        self.packet_id += 1
+
+        if (len(lines) > 65536):
+            self.flush()
+
+    def idle(self, seconds):
+        self.ts += seconds
+
+    def flush(self):
+        self.out_file.write(''.join(self._lines))
+        del self._lines[:]
+
+
+def generate(out_file, count, mix=DEFAULT_MIX, seed=0):
+    """Writes a capture with the configuration transactions followed by count
+    randomly chosen transactions to out_file.
+
+    """
+    rand = random.Random(seed)
+    writer = CaptureWriter(out_file)
+    out_file.write(HEADER)
+
+    for mosi_data in CONFIG_TRANSACTIONS:
+        writer.write(mosi_data, ([STATUS] + [0x00] * (len(mosi_data) - 1)))
+
+    kinds = []
+    for kind, weight in mix:
+        kinds.extend([kind] * weight)
+
+    n = 0
+    while (n < count):
+        kind = rand.choice(kinds)
+        if ('status' == kind):
+            writer.write((0x07, 0xFF), (STATUS, STATUS))
+            n += 1
+        elif ('tx' == kind):
+            for _ in range(min(rand.randint(1, 4), (count - n))):
+                payload = [rand.randint(0, 255) for _ in range(rand.randint(1, 32))]
+                writer.write(([0xA0] + payload), ([STATUS] * (len(payload) + 1)))
+                n += 1
+            writer.idle(rand.uniform(0.001, 0.005))
+        elif ('rx' == kind):
+            payload = [rand.randint(0, 255) for _ in range(rand.randint(1, 32))]
+            writer.write(([0x61] + [0xFF] * len(payload)), ([0x40 | STATUS] + payload))
+            n += 1
+        elif ('hop' == kind):
+            writer.write((0x25, rand.randint(0, 125)), (STATUS, 0x00))
+            n += 1
+        elif ('beken' == kind):
+            for mosi_data in ((0x50, 0x53), (0x24, 0x00, 0x00, 0x00, 0x00), (0x50, 0x53)):
+                if (n >= count):
+                    break
+                writer.write(mosi_data, ([STATUS] + [0x00] * (len(mosi_data) - 1)))
+                n += 1
+        elif ('config' == kind):
+            for mosi_data in CONFIG_TRANSACTIONS:
+                if (n >= count):
+                    break
+                writer.write(mosi_data, ([STATUS] + [0x00] * (len(mosi_data) - 1)))
+                n += 1
+        elif ('error' == kind):
+            writer.write((0x20, 0x0E, 0x00, 0x00, 0x00, 0x00, 0x00), ([STATUS] + [0x00] * 6))
+            n += 1
+
+    writer.flush()
+
+
+if ("__main__" == __name__):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', dest='count', type=int, default=10000)
+    parser.add_argument('-o', '--output_file', dest='output_file_name')
+    parser.add_argument('--mix', dest='mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if (args.output_file_name is None):
+        generate(sys.stdout, args.count, args.mix, args.seed)
+    else:
+        with open(args.output_file_name, 'w') as out_file:
+            generate(out_file, args.count, args.mix, args.seed)
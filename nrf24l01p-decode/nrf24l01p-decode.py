@@ -36,15 +36,166 @@ that have been gleaned from the input file. Here is an example summary:
 
 """
 import argparse
+import array
+import bisect
+import bz2
+import collections
+import select
+import signal
+import stat
 import sys
+import time
 import datetime
+import errno
+import glob
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
 import os
 import os.path
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import timeit
+import warnings
+import zipfile
+import zlib
+import Queue
+
+# NumPy is optional. When it is available the input file is parsed in large
+# blocks instead of one line at a time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# pyarrow is optional. It is only needed to export decoded transactions as
+# Parquet files.
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# backports.lzma and zstandard are optional. They are only needed to read
+# input files that are compressed with xz or zstd.
+try:
+    from backports import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 VERSION = (0.1, (14, 4, 2015))
 
 COL_SEPARATOR = ','
-EXPECTED_COL_NAMES = ('Time [s]', 'Packet ID', 'MOSI', 'MISO')
+
+# The number of bytes that are read from the input file at a time when NumPy
+# is used to parse it.
+NUMPY_BLOCK_SIZE = (1 << 22)
+
+# Compressed input files are recognized by their first bytes and read
+# DECOMPRESS_READ_SIZE bytes at a time. If DECOMPRESS_THREAD is True (see
+# --decompress_thread), they are decompressed in parallel with the parser by
+# a DECOMPRESS_COMMANDS child process (if it is installed), and a separate
+# thread stays at most DECOMPRESS_QUEUE_SIZE blocks ahead of the parser.
+COMPRESSION_MAGIC = (('gzip', '\x1f\x8b'),
+                     ('bz2', 'BZh'),
+                     ('xz', '\xfd7zXZ\x00'),
+                     ('zstd', '\x28\xb5\x2f\xfd'))
+COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+DECOMPRESS_COMMANDS = {'gzip': ('gzip', '-dc'),
+                       'bz2': ('bzip2', '-dc'),
+                       'xz': ('xz', '-dc'),
+                       'zstd': ('zstd', '-dc')}
+DECOMPRESS_READ_SIZE = (1 << 20)
+DECOMPRESS_QUEUE_SIZE = 16
+DECOMPRESS_THREAD = False
+
+# The number of samples that are read at a time when the transactions are
+# decoded from raw logic samples (see LogicCapture).
+LOGIC_BLOCK_SIZE = (1 << 22)
+
+# When decoding in parallel, the input file is split into this many sections
+# per process and each worker records a state checkpoint every
+# PARALLEL_CHECKPOINT_INTERVAL transactions.
+PARALLEL_SECTIONS_PER_PROCESS = 4
+PARALLEL_CHECKPOINT_INTERVAL = 256
+
+# A StateIndex stores a full snapshot of the decoder's state every
+# STATE_INDEX_INTERVAL transactions.
+STATE_INDEX_INTERVAL = 4096
+STATE_INDEX_VERSION = 3
+
+# A SeekIndex records the byte offset of every SEEK_INDEX_INTERVAL-th
+# transaction in the input file and the decoder's state at that point. It is
+# stored next to the input file with SEEK_INDEX_SUFFIX appended to the name
+# unless another path is given.
+SEEK_INDEX_INTERVAL = 16384
+SEEK_INDEX_VERSION = 1
+SEEK_INDEX_SUFFIX = '.idx'
+
+# A Checkpoint records where the decode of an input file that is still growing
+# stopped so that it can be resumed. It is stored next to the output file with
+# CHECKPOINT_SUFFIX appended to the name unless another path is given. The end
+# of the input file is read in blocks of CHECKPOINT_TAIL_SIZE bytes to find
+# its last transaction.
+CHECKPOINT_VERSION = 1
+CHECKPOINT_SUFFIX = '.ckpt'
+CHECKPOINT_TAIL_SIZE = 65536
+
+# Parsed transactions are written to the cache in blocks of this many
+# transactions. Once the cache directory grows beyond CACHE_MAX_SIZE bytes
+# the least recently used entries are deleted.
+CACHE_BLOCK_SIZE = 65536
+CACHE_MAX_SIZE = (4 << 30)
+CACHE_VERSION = 2
+
+# In follow mode the input is polled every FOLLOW_POLL_INTERVAL seconds once
+# all of it has been read, and the output is flushed at least every
+# FOLLOW_LATENCY seconds.
+FOLLOW_POLL_INTERVAL = 0.05
+FOLLOW_LATENCY = 0.1
+
+# The percentiles of timing statistics are estimated to within this relative
+# accuracy. Intervals that are shorter than TIMING_MIN_VALUE seconds are
+# counted as zero.
+TIMING_RELATIVE_ACCURACY = 0.01
+TIMING_MIN_VALUE = 1e-9
+
+# In batch mode the output file and micro-esb init code of each input file are
+# written to the output directory using these suffixes.
+BATCH_OUTPUT_SUFFIX = '.decoded.txt'
+BATCH_UESB_SUFFIX = '.uesb.txt'
+BATCH_TIMELINE_SUFFIX = '.timeline.txt'
+
+# When the transactions of several radios are split into one input file per
+# device, this many lines are buffered for each device before writing them.
+DEMUX_BLOCK_SIZE = 65536
+
+# Exported records are buffered and written this many at a time.
+EXPORT_BLOCK_SIZE = 16384
+
+# A sequence of up to this many transactions that repeats at least
+# COLLAPSE_MIN_COUNT times in a row is rendered as a single line (see
+# collapse_runs).
+COLLAPSE_MAX_PERIOD = 8
+COLLAPSE_MIN_COUNT = 3
+
+# A hop sequence of up to this many channels that is repeated at least
+# HOP_MIN_COUNT times in a row is detected as the hop cycle (see ChannelStats).
+HOP_MAX_PERIOD = 64
+HOP_MIN_COUNT = 2
 
 
 class DecodeError(Exception):
@@ -52,6 +203,226 @@ class DecodeError(Exception):
     pass
 
 
+class Transaction(object):
+    """A single decoded transaction. The data is the MISO data for commands
+    that read from the radio and the MOSI data for all others.
+
+    """
+    __slots__ = ('ts',
+                 'transaction_id',
+                 'cmd',
+                 'packed_index',
+                 'note',
+                 'delta',
+                 'data')
+
+    def __init__(self, ts, transaction_id, cmd, packed_index, note, delta, data):
+        self.ts = ts
+        self.transaction_id = transaction_id
+        self.cmd = cmd
+        self.packed_index = packed_index
+        self.note = note
+        self.delta = delta
+        self.data = data
+
+
+class TransactionRun(object):
+    """A sequence of transactions that is repeated count times in a row. The
+    transactions are the first repetition and the last_transaction_id is the
+    ID of the last transaction of the last one.
+
+    """
+    __slots__ = ('transactions',
+                 'count',
+                 'last_transaction_id')
+
+    def __init__(self, transactions, count, last_transaction_id):
+        self.transactions = transactions
+        self.count = count
+        self.last_transaction_id = last_transaction_id
+
+
+class TransactionLog(object):
+    """Stores decoded transactions in a set of typed arrays (one per field)
+    instead of as individual objects. The data of all transactions is kept in
+    a single shared bytearray.
+
+    """
+
+    # Stored in place of a packed index for commands that don't have one.
+    NO_PACKED_INDEX = 0xFF
+
+    def __init__(self):
+        self.ts = array.array('d')
+        self.transaction_ids = array.array('l')
+        self.cmds = array.array('B')
+        self.packed_indexes = array.array('B')
+        self.notes = array.array('B')
+        self.deltas = array.array('d')
+        self.offsets = array.array('L')
+        self.lengths = array.array('B')
+        self.payload = bytearray()
+
+    def append(self, ts, transaction_id, cmd, packed_index, note, delta, data):
+        """Adds a transaction. Expects the following params:
+            ts                [float]            Timestamp of transaction in seconds
+            transaction_id    [int]              Transaction ID
+            cmd               [int]              Command value from Decode.COMMANDS
+            packed_index      [int or None]      Index packed into the command byte
+            note              [int]              One of the Decode.NOTE_* values
+            delta             [float or None]    Time since the previous payload
+            data              [seq of ints]      Data bytes
+
+        """
+        self.ts.append(ts)
+        self.transaction_ids.append(transaction_id)
+        self.cmds.append(cmd)
+        self.packed_indexes.append(self.NO_PACKED_INDEX if (packed_index is None)
+                                   else packed_index)
+        self.notes.append(note)
+        self.deltas.append(float('nan') if (delta is None) else delta)
+        self.offsets.append(len(self.payload))
+        self.lengths.append(len(data))
+        self.payload.extend(data)
+
+    def clear(self):
+        """Removes all of the transactions."""
+        for column in (self.ts,
+                       self.transaction_ids,
+                       self.cmds,
+                       self.packed_indexes,
+                       self.notes,
+                       self.deltas,
+                       self.offsets,
+                       self.lengths,
+                       self.payload):
+            del column[:]
+
+    def __len__(self):
+        return len(self.transaction_ids)
+
+    def __getitem__(self, i):
+        if (i < 0):
+            i += len(self)
+        packed_index = self.packed_indexes[i]
+        if (self.NO_PACKED_INDEX == packed_index):
+            packed_index = None
+        delta = self.deltas[i]
+        if (delta != delta):
+            delta = None
+        offset = self.offsets[i]
+        return Transaction(self.ts[i],
+                           self.transaction_ids[i],
+                           self.cmds[i],
+                           packed_index,
+                           self.notes[i],
+                           delta,
+                           self.payload[offset:(offset + self.lengths[i])])
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+def collapse_runs(transactions, max_period=COLLAPSE_MAX_PERIOD,
+                  min_count=COLLAPSE_MIN_COUNT):
+    """Yields the given Transactions, except that a sequence of up to
+    max_period transactions that is repeated at least min_count times in a row
+    (e.g. polling of the STATUS register) is yielded as a single
+    TransactionRun. Transactions are repeated if everything but their
+    timestamps and IDs is the same. The shortest sequence that repeats is
+    used. Only transactions with consecutive IDs are combined, so a run ends
+    wherever transactions are missing (e.g. filtered out).
+
+    Runs are found as the transactions stream by, so at most
+    max_period * min_count transactions are held back (plus the repetition of
+    a run that is in progress).
+
+    """
+    pending = []
+    pending_keys = []
+    # matched[period] is the number of the last pending transactions that are
+    # the same as the one that is period transactions before them.
+    matched = [0] * (max_period + 1)
+    periods = range(1, (max_period + 1))
+    max_pending = (max_period * min_count)
+
+    run = None
+    run_keys = None
+    partial = []
+
+    prev_transaction_id = None
+    queue = collections.deque()
+    for transaction in transactions:
+        if ((prev_transaction_id is not None) and
+                (transaction.transaction_id != (prev_transaction_id + 1))):
+            # Transactions are missing so nothing before them can repeat.
+            if (run is not None):
+                yield run
+                run = None
+            for pending_transaction in (partial + pending):
+                yield pending_transaction
+            partial = []
+            pending = []
+            pending_keys = []
+            matched = [0] * (max_period + 1)
+        prev_transaction_id = transaction.transaction_id
+
+        queue.append(transaction)
+        while (queue):
+            transaction = queue.popleft()
+            key = (transaction.cmd, transaction.packed_index, transaction.note,
+                   transaction.delta, str(transaction.data))
+
+            if (run is not None):
+                if (key == run_keys[len(partial)]):
+                    partial.append(transaction)
+                    if (len(partial) == len(run_keys)):
+                        run.count += 1
+                        run.last_transaction_id = transaction.transaction_id
+                        partial = []
+                    continue
+                # The run is over, so the start of an incomplete repetition
+                # and this transaction might start another one.
+                yield run
+                run = None
+                queue.appendleft(transaction)
+                queue.extendleft(reversed(partial))
+                partial = []
+                continue
+
+            pending.append(transaction)
+            pending_keys.append(key)
+            count = len(pending_keys)
+            for period in periods:
+                if ((period < count) and (key == pending_keys[-1 - period])):
+                    matched[period] += 1
+                else:
+                    matched[period] = 0
+
+            for period in periods:
+                if (matched[period] >= (period * (min_count - 1))):
+                    start = (count - (period * min_count))
+                    for transaction in pending[:start]:
+                        yield transaction
+                    run = TransactionRun(pending[start:(start + period)], min_count,
+                                         pending[-1].transaction_id)
+                    run_keys = pending_keys[start:(start + period)]
+                    pending = []
+                    pending_keys = []
+                    matched = [0] * (max_period + 1)
+                    break
+            else:
+                if (count > max_pending):
+                    yield pending.pop(0)
+                    pending_keys.pop(0)
+
+    if (run is not None):
+        yield run
+    for transaction in (partial + pending):
+        yield transaction
+
+
 class Decode(object):
     """A simple class for parsing nRF24L01+ SPI traffic."""
 
@@ -212,6 +583,35 @@ class Decode(object):
         0xFF: ('NOP',                 (0, 0))
     }
 
+    COMMAND_LOOKUP = dict([(props[0], cmd) for cmd, props in COMMANDS.iteritems()])
+
+    # These commands have a register index packed into the command byte.
+    REGISTER_COMMANDS = (0x00, 0x20)
+
+    # Each transaction is stored with one of these notes. Except for
+    # NOTE_INVALID_INDEX, they are used as a prefix when the transaction is
+    # rendered as text.
+    NOTE_NONE = 0
+    NOTE_INVALID_INDEX = 1
+    NOTE_BEKEN = 2
+    NOTE_INVALID_DATA_LEN = 3
+    NOTE_INVALID_OPERATIONAL_MODE = 4
+
+    NOTE_PREFIXES = ('',
+                     '',
+                     '[IGNORED: BEKEN-SPECIFIC COMMAND]',
+                     '[IGNORED: INVALID DATA LEN]',
+                     '[IGNORED: INVALID OPERATIONAL MODE]')
+    NOTE_NAMES = (None,
+                  'INVALID_INDEX',
+                  'BEKEN',
+                  'INVALID_DATA_LEN',
+                  'INVALID_OPERATIONAL_MODE')
+
+    # The names of the values that to_record returns.
+    RECORD_COLUMNS = ('ts', 'transaction_id', 'cmd', 'register', 'fields', 'data', 'mode',
+                      'delta', 'note')
+
     REGISTER_LOOKUP = {
         'CONFIG':      0x00,
         'EN_AA':       0x01,
@@ -362,11 +762,15 @@ class Decode(object):
 
     PACKET_FORMAT = ('ESB', 'SB', 'ESB_DPL')
 
+    # Every possible byte value formatted as hex.
+    HEX_STRS = tuple(['0x%02X' % i for i in range(256)])
+
     def __init__(self, **kwargs):
         """Creates a new object. Does not expect any arguments."""
         self.reg_values = {}
-        self.messages = []
+        self.transactions = TransactionLog()
         self.used_channels = []
+        self._used_channel_set = set()
 
         self.tx_count = 0
         self.rx_count = 0
@@ -378,6 +782,21 @@ class Decode(object):
         self._beken_bank_switch_active = False
         self.beken_detected = False
 
+        # A TimingStats object is stored here when one is attached.
+        self.timing = None
+
+        # A ModeTimeline object is stored here when one is attached.
+        self.mode_timeline = None
+
+        # A ChannelStats object is stored here when one is attached.
+        self.channel_stats = None
+
+        self._status_reg = None
+        self._reg_fields_strs = self._get_reg_fields_table()
+        self._dispatch = [None if (cmd_props is None) else
+                          ((getattr(self, cmd_props[0]),) + cmd_props[1:])
+                          for cmd_props in self._get_dispatch_table()]
+
         self.reset()
 
     def reset(self):
@@ -388,8 +807,9 @@ class Decode(object):
         default_rf_ch = self.REGISTERS[self.REGISTER_LOOKUP['RF_CH']][1][0]
 
         self.reg_values = {}
-        self.messages = []
+        self.transactions = TransactionLog()
         self.used_channels = [default_rf_ch]
+        self._used_channel_set = set(self.used_channels)
 
         self.tx_count = 0
         self.rx_count = 0
@@ -403,12 +823,81 @@ class Decode(object):
             desc, init_value, writable_mask = props
             self.reg_values[addr] = list(init_value)
 
-    def update(self, ts, transaction_id, mosi_data, miso_data):
+        self._status_reg = self.reg_values[self.REGISTER_LOOKUP['STATUS']]
+
+    @classmethod
+    def _get_reg_fields_table(cls):
+        """Returns a dict that maps each register's addr to a tuple containing
+        the str that _reg_fields_str returns for each of the 256 possible
+        register values. The table is built once per class.
+
+        """
+        table = cls.__dict__.get('_reg_fields_table')
+        if (table is not None):
+            return table
+
+        table = {}
+        for reg in cls.REGISTERS:
+            if (reg in cls.REGISTER_FIELDS):
+                table[reg] = tuple([cls._render_reg_fields(reg, value)
+                                    for value in range(256)])
+            else:
+                table[reg] = cls.HEX_STRS
+
+        setattr(cls, '_reg_fields_table', table)
+        return table
+
+    @classmethod
+    def _get_dispatch_table(cls):
+        """Returns a tuple with an entry for each of the 256 possible command
+        bytes. Each entry is either None (unknown command) or a tuple of:
+            func_name         [str]              Name of the handler method
+            cmd_name          [str]              Name of the command
+            packed_index      [int or None]      Index packed into the command byte
+            min_data_len      [int]              Minimum number of data bytes
+            max_data_len      [int]              Maximum number of data bytes
+
+        The table is built once per class.
+
+        """
+        table = cls.__dict__.get('_dispatch_table')
+        if (table is not None):
+            return table
+
+        table = []
+        for cmd in range(256):
+            # The register commands carry an index in their low bits so they
+            # have to be matched before falling back to the plain command values.
+            if ((cmd & cls.RW_REGISTER_CMD_MASK) in (0x00, 0x20)):
+                cmd_value = (cmd & cls.RW_REGISTER_CMD_MASK)
+                packed_index = (cmd & cls.RW_REGISTER_VALUE_MASK)
+            elif (0xA8 == (cmd & cls.W_ACK_PAYLOAD_CMD_MASK)):
+                cmd_value = (cmd & cls.W_ACK_PAYLOAD_CMD_MASK)
+                packed_index = (cmd & cls.W_ACK_PAYLOAD_VALUE_MASK)
+            elif (cmd in cls.COMMANDS):
+                cmd_value = cmd
+                packed_index = None
+            else:
+                table.append(None)
+                continue
+
+            cmd_name, data_lens = cls.COMMANDS[cmd_value]
+            func_name = ('_' + cmd_name.lower())
+            if (not hasattr(cls, func_name)):
+                raise DecodeError('ERROR: Failed to lookup func: %s' % cmd_name)
+            table.append((func_name, cmd_name, packed_index) + tuple(data_lens))
+
+        table = tuple(table)
+        setattr(cls, '_dispatch_table', table)
+        return table
+
+    def update(self, ts, transaction_id, mosi_data, miso_data, end_ts=None):
         """Updates the internal state of the object. Expects the following params:
             ts                [float]            Timestamp of transaction in seconds
             transaction_id    [int]              Transaction ID
             mosi_data         [tuple of ints]    MOSI bytes
             miso_data         [tuple of ints]    MISO bytes
+            end_ts            [float or None]    Timestamp of the last byte in seconds
 
         """
         cmd = mosi_data[0]
@@ -418,41 +907,68 @@ class Decode(object):
         miso_data = miso_data[1:]
 
         if (len(mosi_data) != len(miso_data)):
-            sys.stderr.write('ERROR: MISO and MOSI data lengths do not match\r\n')
+            self._error('ERROR: MISO and MOSI data lengths do not match')
             return
 
-        cmd_props = self.COMMANDS.get(cmd & self.RW_REGISTER_CMD_MASK)
-        if (cmd_props is not None):
-            packed_index = (cmd & self.RW_REGISTER_VALUE_MASK)
-            self._update(ts,
-                         transaction_id,
-                         cmd_props,
-                         status,
-                         mosi_data,
-                         miso_data,
-                         packed_index)
-
-        cmd_props = self.COMMANDS.get(cmd & self.W_ACK_PAYLOAD_CMD_MASK)
-        if (cmd_props is not None):
-            packed_index = (cmd & self.W_ACK_PAYLOAD_VALUE_MASK)
-            self._update(ts,
-                         transaction_id,
-                         cmd_props,
-                         status,
-                         mosi_data,
-                         miso_data,
-                         packed_index)
-
-        cmd_props = self.COMMANDS.get(cmd)
-        if (cmd_props is not None):
-            self._update(ts,
-                         transaction_id,
-                         cmd_props,
-                         status,
-                         mosi_data,
-                         miso_data)
-
-        raise DecodeError('ERROR: Failed to process command: 0x%X' % cmd)
+        cmd_props = self._dispatch[cmd]
+        if (cmd_props is None):
+            raise DecodeError('ERROR: Failed to process command: 0x%X' % cmd)
+        func, cmd_name, packed_index, min_data_len, max_data_len = cmd_props
+
+        self._status_reg[0] = status
+
+        if (min_data_len <= len(mosi_data) <= max_data_len):
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+        else:
+            self._error('ERROR: Invalid data len for command ' +
+                        '%s: %d' % (cmd_name, len(mosi_data)))
+
+    def _error(self, msg):
+        sys.stderr.write(msg + '\r\n')
+
+    def get_state(self):
+        """Returns a dict containing a copy of the internal state of the
+        object. It can be restored with set_state.
+
+        """
+        return {'reg_values': dict([(addr, list(val)) for addr, val in self.reg_values.iteritems()]),
+                'used_channels': list(self.used_channels),
+                'tx_count': self.tx_count,
+                'rx_count': self.rx_count,
+                'timestamps': dict(self._timestamps),
+                'beken_bank_switch_active': self._beken_bank_switch_active,
+                'beken_detected': self.beken_detected}
+
+    def set_state(self, state):
+        """Restores the internal state from a dict returned by get_state. The
+        decoded transactions are not affected.
+
+        """
+        self.reg_values = dict([(addr, list(val)) for addr, val in state['reg_values'].iteritems()])
+        self.used_channels = list(state['used_channels'])
+        self._used_channel_set = set(self.used_channels)
+        self.tx_count = state['tx_count']
+        self.rx_count = state['rx_count']
+        self._timestamps = dict(state['timestamps'])
+        self._beken_bank_switch_active = state['beken_bank_switch_active']
+        self.beken_detected = state['beken_detected']
+        self._status_reg = self.reg_values[self.REGISTER_LOOKUP['STATUS']]
+
+    def _get_decode_state(self):
+        """Returns the part of the internal state that affects how the
+        following transactions are decoded as a hashable tuple.
+
+        """
+        return (tuple([tuple(self.reg_values[addr]) for addr in sorted(self.reg_values)]),
+                tuple(sorted(self._timestamps.iteritems())),
+                self._beken_bank_switch_active)
+
+    def _set_decode_state(self, decode_state):
+        regs, timestamps, beken_bank_switch_active = decode_state
+        for addr, val in zip(sorted(self.reg_values), regs):
+            self.reg_values[addr][:] = val
+        self._timestamps = dict(timestamps)
+        self._beken_bank_switch_active = beken_bank_switch_active
 
     def get_data_rate(self):
         """Returns one of the following strs: '250KBPS', '1MBPS', '2MBPS'."""
@@ -725,6 +1241,125 @@ class Decode(object):
 
         return os.linesep.join(result)
 
+    @property
+    def messages(self):
+        """Returns a list containing each decoded transaction as a str."""
+        return list(self.iter_messages())
+
+    def iter_messages(self, collapse=False):
+        """Yields each decoded transaction as a str. If collapse is True then
+        repeated transactions are yielded as a single str (see iter_collapsed).
+
+        """
+        if (collapse):
+            for msg in self.iter_collapsed(self.transactions):
+                yield msg
+            return
+
+        for transaction in self.transactions:
+            yield self.render(transaction)
+
+    def iter_collapsed(self, transactions):
+        """Yields each of the given Transactions as a str, except that repeated
+        sequences of transactions are rendered with render_run (see
+        collapse_runs).
+
+        """
+        render = self.render
+        render_run = self.render_run
+        for item in collapse_runs(transactions):
+            if (isinstance(item, TransactionRun)):
+                yield render_run(item)
+            else:
+                yield render(item)
+
+    def render(self, transaction):
+        """Returns a Transaction as a human-readable str."""
+        return ('{:04d}:'.format(transaction.transaction_id) + self._render_msg(transaction))
+
+    def render_run(self, run):
+        """Returns a TransactionRun as a human-readable str with the range of
+        transaction IDs that it covers and its count, e.g.:
+            0100-0899:R_REGISTER(STATUS) x800: (RX_P_NO_2|RX_P_NO_1|RX_P_NO_0)
+            0100-0899:[R_REGISTER(STATUS):(TX_FULL); NOP] x400
+
+        """
+        id_str = '{:04d}-{:04d}:'.format(run.transactions[0].transaction_id,
+                                         run.last_transaction_id)
+        if (1 == len(run.transactions)):
+            return (id_str + self._render_msg(run.transactions[0], (' x%d' % run.count)))
+        return (id_str + '[' +
+                '; '.join([self._render_msg(transaction, width=0)
+                           for transaction in run.transactions]) +
+                '] x%d' % run.count)
+
+    def _render_msg(self, transaction, suffix='', width=25):
+        """Returns a Transaction as a human-readable str without its ID. The
+        suffix is added to the command name and the data is aligned to the
+        given width.
+
+        """
+        cmd_name = self.COMMANDS[transaction.cmd][0]
+
+        if (self.NOTE_INVALID_INDEX == transaction.note):
+            return ('[ERROR: Invalid index found in %s command byte: %d]' %
+                    (cmd_name, transaction.packed_index) + suffix)
+
+        if (transaction.cmd in self.REGISTER_COMMANDS):
+            msg = ('%s(%s)' % (cmd_name, self.REGISTERS[transaction.packed_index][0]))
+            strs = self._reg_fields_strs[transaction.packed_index]
+        else:
+            msg = cmd_name
+            strs = self.HEX_STRS
+
+        if (transaction.delta is not None):
+            msg += ('(delta:%.4fs)' % transaction.delta)
+        msg = (self.NOTE_PREFIXES[transaction.note] + msg + suffix)
+
+        data = transaction.data
+        if (0 == len(data)):
+            return msg
+        elif (1 == len(data)):
+            return ((msg + ':').ljust(width) + strs[data[0]])
+        else:
+            return ((msg + ':').ljust(width) + '{' + ','.join([strs[x] for x in data]) + '}')
+
+    def to_record(self, transaction):
+        """Returns a Transaction as a tuple with the values of RECORD_COLUMNS:
+            ts                [float]            Timestamp of transaction in seconds
+            transaction_id    [int]              Transaction ID
+            cmd               [str]              Name of the command
+            register          [str or None]      Name of the register
+            fields            [str or None]      Register fields that are set,
+                                                 separated by '|'
+            data              [str]              Data bytes
+            mode              [str]              Operational mode (the current one,
+                                                 so it has to be called right after
+                                                 the transaction is decoded)
+            delta             [float or None]    Time since the previous payload
+            note              [str or None]      Name of the NOTE_* value
+
+        """
+        register = None
+        fields = None
+        packed_index = transaction.packed_index
+        if ((transaction.cmd in self.REGISTER_COMMANDS) and
+                (self.NOTE_INVALID_INDEX != transaction.note)):
+            register = self.REGISTERS[packed_index][0]
+            if ((packed_index in self.REGISTER_FIELDS) and (1 == len(transaction.data))):
+                fields = self._reg_fields_strs[packed_index][transaction.data[0]]
+                fields = (fields[1:-1] if fields.startswith('(') else '')
+
+        return (transaction.ts,
+                transaction.transaction_id,
+                self.COMMANDS[transaction.cmd][0],
+                register,
+                fields,
+                str(transaction.data),
+                self.get_operational_mode(),
+                transaction.delta,
+                self.NOTE_NAMES[transaction.note])
+
     def _bit_is_set(self, val, bit):
         if (isinstance(bit, str)):
             bit = self.REGISTER_FIELD_LOOKUP[bit]
@@ -769,31 +1404,17 @@ class Decode(object):
             raise DecodeError('ERROR: Ambiguous _clear_state_reg_bit operation')
         self.reg_values[reg][0] |= (1 << bit)
 
-    def _update(self, ts, transaction_id, cmd_props, status, mosi_data, miso_data, packed_index=None):
-        cmd_name = cmd_props[0]
-        min_data_len, max_data_len = cmd_props[1]
-
-        self.reg_values[self.REGISTER_LOOKUP['STATUS']][0] = status
-
-        try:
-            func = getattr(self, ('_' + cmd_name.lower()))
-            if (min_data_len <= len(mosi_data) <= max_data_len):
-                func(ts, transaction_id, mosi_data, miso_data, packed_index)
-            else:
-                sys.stderr.write('ERROR: Invalid data len for command ' +
-                                 '%s: %d\r\n' % (cmd_name, len(mosi_data)))
-        except AttributeError:
-            raise DecodeError('ERROR: Failed to lookup func: %s' % cmd_name)
-
     def _seq_to_hex_str(self, seq):
-        s = ','.join(['0x%02X' % x for x in seq])
+        hex_strs = self.HEX_STRS
+        s = ','.join([(hex_strs[x] if (0 <= x <= 0xFF) else ('0x%02X' % x)) for x in seq])
         if (1 == len(seq)):
             return s
         else:
             return ('[' + s + ']')
 
-    def _reg_fields_str(self, reg, value):
-        fields = self.REGISTER_FIELDS.get(reg)
+    @classmethod
+    def _render_reg_fields(cls, reg, value):
+        fields = cls.REGISTER_FIELDS.get(reg)
         if (fields is None):
             return '0x{:02X}'.format(value)
         else:
@@ -809,14 +1430,26 @@ class Decode(object):
             else:
                 return ('(' + '|'.join(result) + ')')
 
+    def _reg_fields_str(self, reg, value):
+        strs = self._reg_fields_strs.get(reg)
+        if ((strs is None) or (not (0 <= value <= 0xFF))):
+            return self._render_reg_fields(reg, value)
+        return strs[value]
+
     def _format_num(self, seq):
-        result = []
         if (isinstance(seq, int)):
+            if (0 <= seq <= 0xFF):
+                return self.HEX_STRS[seq]
             return '0x{:02X}'.format(seq)
 
+        hex_strs = self.HEX_STRS
+        result = []
         for item in seq:
             if (isinstance(item, int)):
-                result.append('0x{:02X}'.format(item))
+                if (0 <= item <= 0xFF):
+                    result.append(hex_strs[item])
+                else:
+                    result.append('0x{:02X}'.format(item))
             else:
                 result.append(item)
 
@@ -827,18 +1460,20 @@ class Decode(object):
 
         return result
 
-    def _msg(self, transaction_id, msg, seq=None):
-        id_str = '{:04d}:'.format(transaction_id)
-        if (seq is None):
-            self.messages.append(id_str + msg)
-        else:
-            result = self._format_num(seq)
-            self.messages.append(id_str + '{:<25}{}'.format((msg + ':'), result))
+    def _msg(self, ts, transaction_id, cmd_name, packed_index=None, data=(),
+             note=NOTE_NONE, delta=None):
+        self.transactions.append(ts,
+                                 transaction_id,
+                                 self.COMMAND_LOOKUP[cmd_name],
+                                 packed_index,
+                                 note,
+                                 delta,
+                                 data)
 
     def _r_register(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         if (packed_index > self.RW_REGISTER_MAX_INDEX):
-            self._msg(transaction_id,
-                      '[ERROR: Invalid index found in R_REGISTER command byte: %d]' % packed_index)
+            self._msg(ts, transaction_id, 'R_REGISTER', packed_index,
+                      note=self.NOTE_INVALID_INDEX)
             return
 
         desc, init_value, mask = self.REGISTERS[packed_index]
@@ -848,27 +1483,23 @@ class Decode(object):
         # with payload BEKEN_BANK_SWITCH_DATA to write to a separate bank of registers.
         # For now, these will be ignored.
         if (self._beken_bank_switch_active):
-            self._msg(transaction_id,
-                      ('[IGNORED: BEKEN-SPECIFIC COMMAND]R_REGISTER(%s)' % desc),
-                      [self._reg_fields_str(packed_index, x) for x in miso_data])
+            self._msg(ts, transaction_id, 'R_REGISTER', packed_index, miso_data,
+                      note=self.NOTE_BEKEN)
             return
 
         if (len(mosi_data) != reg_width):
-            self._msg(transaction_id,
-                      ('[IGNORED: INVALID DATA LEN]W_REGISTER(%s)' % desc),
-                      [self._reg_fields_str(packed_index, x) for x in mosi_data])
+            self._msg(ts, transaction_id, 'R_REGISTER', packed_index, mosi_data,
+                      note=self.NOTE_INVALID_DATA_LEN)
         else:
             for i, data in enumerate(miso_data):
                 self.reg_values[packed_index][i] = data
 
-                self._msg(transaction_id,
-                          ('R_REGISTER(%s)' % self.REGISTERS[packed_index][0]),
-                          [self._reg_fields_str(packed_index, x) for x in miso_data])
+            self._msg(ts, transaction_id, 'R_REGISTER', packed_index, miso_data)
 
     def _w_register(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         if (packed_index > self.RW_REGISTER_MAX_INDEX):
-            self._msg(transaction_id,
-                      '[ERROR: Invalid index found in W_REGISTER command byte: %d]' % packed_index)
+            self._msg(ts, transaction_id, 'W_REGISTER', packed_index,
+                      note=self.NOTE_INVALID_INDEX)
             return
 
         desc, init_value, mask = self.REGISTERS[packed_index]
@@ -878,17 +1509,16 @@ class Decode(object):
         # with payload BEKEN_BANK_SWITCH_DATA to write to a separate bank of registers.
         # For now, these will be ignored.
         if (self._beken_bank_switch_active):
-            self._msg(transaction_id,
-                      ('[IGNORED: BEKEN-SPECIFIC COMMAND]W_REGISTER(%s)' % desc),
-                      [self._reg_fields_str(packed_index, x) for x in mosi_data])
+            self._msg(ts, transaction_id, 'W_REGISTER', packed_index, mosi_data,
+                      note=self.NOTE_BEKEN)
+            return
 
         # The W_REGISTER command is only executed in 'POWER_DOWN' or 'STANDBY' modes.
         op = self.get_operational_mode()
         if (('POWER_DOWN' == op) or ('STANDBY' == op)):
             if (len(mosi_data) != reg_width):
-                self._msg(transaction_id,
-                          ('[IGNORED: INVALID DATA LEN]W_REGISTER(%s)' % desc),
-                          [self._reg_fields_str(packed_index, x) for x in mosi_data])
+                self._msg(ts, transaction_id, 'W_REGISTER', packed_index, mosi_data,
+                          note=self.NOTE_INVALID_DATA_LEN)
                 return
             else:
                 for i, data in enumerate(mosi_data):
@@ -907,16 +1537,14 @@ class Decode(object):
                 # Some register writes are more interesting than others.
                 if (packed_index == self.REGISTER_LOOKUP['RF_CH']):
                     ch = mosi_data[-1]
-                    if (not ch in self.used_channels):
+                    if (not ch in self._used_channel_set):
+                        self._used_channel_set.add(ch)
                         self.used_channels.append(ch)
 
-                self._msg(transaction_id,
-                          ('W_REGISTER(%s)' % desc),
-                          [self._reg_fields_str(packed_index, x) for x in mosi_data])
+                self._msg(ts, transaction_id, 'W_REGISTER', packed_index, mosi_data)
         else:
-            self._msg(transaction_id,
-                      ('[IGNORED: INVALID OPERATIONAL MODE]W_REGISTER(%s)' % desc),
-                      [self._reg_fields_str(packed_index, x) for x in mosi_data])
+            self._msg(ts, transaction_id, 'W_REGISTER', packed_index, mosi_data,
+                      note=self.NOTE_INVALID_OPERATIONAL_MODE)
 
     def _r_rx_payload(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         self.rx_count += 1
@@ -926,12 +1554,7 @@ class Decode(object):
             delta = (ts - self._timestamps['R_RX_PAYLOAD'])
         self._timestamps['R_RX_PAYLOAD'] = ts
 
-        if (delta is not None):
-            self._msg(transaction_id,
-                      ('R_RX_PAYLOAD(delta:%.4fs)' % delta),
-                      miso_data)
-        else:
-            self._msg(transaction_id, 'R_RX_PAYLOAD', miso_data)
+        self._msg(ts, transaction_id, 'R_RX_PAYLOAD', data=miso_data, delta=delta)
 
     def _w_tx_payload(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         self._clear_state_reg_bit('FIFO_STATUS', 'TX_REUSE')
@@ -942,12 +1565,7 @@ class Decode(object):
             delta = (ts - self._timestamps['W_TX_PAYLOAD'])
         self._timestamps['W_TX_PAYLOAD'] = ts
 
-        if (delta is not None):
-            self._msg(transaction_id,
-                      ('W_TX_PAYLOAD(delta:%.4fs)' % delta),
-                      mosi_data)
-        else:
-            self._msg(transaction_id, 'W_TX_PAYLOAD', mosi_data)
+        self._msg(ts, transaction_id, 'W_TX_PAYLOAD', data=mosi_data, delta=delta)
 
     def _w_tx_payload_no_ack(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         self.tx_count += 1
@@ -958,33 +1576,21 @@ class Decode(object):
             delta = (ts - self._timestamps['W_TX_PAYLOAD'])
         self._timestamps['W_TX_PAYLOAD'] = ts
 
-        if (delta is not None):
-            self._msg(transaction_id,
-                      ('W_TX_PAYLOAD_NO_ACK(delta:%.4fs)' % delta),
-                      mosi_data)
-        else:
-            self._msg(transaction_id, 'W_TX_PAYLOAD_NO_ACK', mosi_data)
+        self._msg(ts, transaction_id, 'W_TX_PAYLOAD_NO_ACK', data=mosi_data, delta=delta)
 
     def _flush_tx(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         self._clear_state_reg_bit('FIFO_STATUS', 'TX_REUSE')
         self._clear_state_reg_bit('FIFO_STATUS', 'FIFO_STATUS.TX_FULL')
         self._clear_state_reg_bit('STATUS', 'STATUS.TX_FULL')
-        if (0 == len(mosi_data)):
-            self._msg(transaction_id, 'FLUSH_TX')
-        else:
-            self._msg(transaction_id, 'FLUSH_TX', mosi_data)
+        self._msg(ts, transaction_id, 'FLUSH_TX', data=mosi_data)
 
     def _flush_rx(self, ts, transaction_id, mosi_data, miso_data, packed_index):
-        self._clear_state_reg_bit('FIFO_STATUS', 'FIFO_STATUS.RX_FULL')
-        self._clear_state_reg_bit('STATUS', 'STATUS.RX_FULL')
-        if (0 == len(mosi_data)):
-            self._msg(transaction_id, 'FLUSH_RX')
-        else:
-            self._msg(transaction_id, 'FLUSH_RX', mosi_data)
+        self._clear_state_reg_bit('FIFO_STATUS', 'RX_FULL')
+        self._msg(ts, transaction_id, 'FLUSH_RX', data=mosi_data)
 
     def _reuse_tx_pl(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         self._set_state_reg_bit('FIFO_STATUS', 'TX_REUSE')
-        self._msg.append(transaction_id, 'REUSE_TX_PL')
+        self._msg(ts, transaction_id, 'REUSE_TX_PL')
 
     def _activate(self, ts, transaction_id, mosi_data, miso_data, packed_index):
         if (self.BEKEN_BANK_SWITCH_DATA == mosi_data[0]):
@@ -992,163 +1598,4693 @@ class Decode(object):
 
         self.beken_detected = True
 
-        self._msg(transaction_id, '[IGNORED: BEKEN-SPECIFIC COMMAND]ACTIVATE', mosi_data)
+        self._msg(ts, transaction_id, 'ACTIVATE', data=mosi_data, note=self.NOTE_BEKEN)
 
     def _r_rx_pl_wid(self, ts, transaction_id, mosi_data, miso_data, packed_index):
-        self._msg(transaction_id, 'R_RX_PL_WID', miso_data)
+        self._msg(ts, transaction_id, 'R_RX_PL_WID', data=miso_data)
 
     def _w_ack_payload(self, ts, transaction_id, mosi_data, miso_data, packed_index):
-        self._msg(transaction_id, 'W_ACK_PAYLOAD', mosi_data)
+        self._msg(ts, transaction_id, 'W_ACK_PAYLOAD', packed_index, mosi_data)
 
     def _nop(self, ts, transaction_id, mosi_data, miso_data, packed_index):
-        self._msg(transaction_id, 'NOP')
+        self._msg(ts, transaction_id, 'NOP')
 
     def __repr__(self):
-        return os.linesep.join(self.messages)
+        return os.linesep.join(self.iter_messages())
 
 
-def _verify_column_names(line):
-    names = [s.strip() for s in line.split(COL_SEPARATOR)]
+class SummaryDecode(Decode):
+    """Works like Decode but doesn't log any transactions. Only the state that
+    the summary and the micro-esb init code are based on (registers, counters,
+    and channels) is kept.
 
-    if (len(EXPECTED_COL_NAMES) != len(names)):
-        raise DecodeError('ERROR: Unexpected number of columns: %d' % len(names))
+    """
 
-    for i, s in enumerate(names):
-        if (not EXPECTED_COL_NAMES[i] in s):
-            raise DecodeError('ERROR: Unexpected column name: expected ' +
-                              '%s but found %s' % (names[i], s))
+    # The handlers of these commands don't look at the data bytes so they
+    # don't have to be parsed.
+    COUNTED_COMMANDS = ('W_TX_PAYLOAD', 'W_TX_PAYLOAD_NO_ACK', 'R_RX_PAYLOAD',
+                        'W_ACK_PAYLOAD')
 
+    @classmethod
+    def get_counted_cmds(cls):
+        """Returns a tuple of 256 bools that are True for the command bytes
+        of the COUNTED_COMMANDS.
 
-def _parse_num(s):
-    try:
-        return int(s)
-    except ValueError:
+        """
+        return tuple([((cmd_props is not None) and (cmd_props[1] in cls.COUNTED_COMMANDS))
+                      for cmd_props in cls._get_dispatch_table()])
+
+    def _msg(self, ts, transaction_id, cmd_name, packed_index=None, data=(),
+             note=Decode.NOTE_NONE, delta=None):
+        pass
+
+
+class DecodeStats(object):
+    """Collects the following statistics for each command that a Decode object
+    processes:
+        count             [int]              Number of times its handler was called
+        total_time        [float]            Cumulative handler time in seconds
+        max_time          [float]            Longest handler time in seconds
+        bytes             [int]              Number of MOSI bytes (including the
+                                             command byte)
+
+    Errors that are written to stderr are counted by message.
+
+    attach() replaces the handlers in the decoder's dispatch table with timed
+    wrappers so a decoder that doesn't have a DecodeStats attached runs
+    exactly the same code as before.
+
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.errors = collections.Counter()
+
+    def attach(self, decoder):
+        """Starts collecting statistics from the decoder."""
+        dispatch = decoder._dispatch
+        for cmd, cmd_props in enumerate(dispatch):
+            if (cmd_props is not None):
+                func, cmd_name = cmd_props[:2]
+                dispatch[cmd] = ((self._wrap_handler(func, cmd_name),) + cmd_props[1:])
+
+        error = decoder._error
+        errors = self.errors
+
+        def counted_error(msg):
+            errors[msg] += 1
+            error(msg)
+
+        decoder._error = counted_error
+        return decoder
+
+    def _wrap_handler(self, func, cmd_name):
+        entry = self.commands.setdefault(cmd_name, [0, 0.0, 0.0, 0])
+        clock = timeit.default_timer
+
+        def timed_handler(ts, transaction_id, mosi_data, miso_data, packed_index):
+            start = clock()
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+            elapsed = (clock() - start)
+
+            entry[0] += 1
+            entry[1] += elapsed
+            if (elapsed > entry[2]):
+                entry[2] = elapsed
+            entry[3] += (len(mosi_data) + 1)
+
+        return timed_handler
+
+    def to_dict(self):
+        """Returns the statistics as a dict that can be serialized as JSON."""
+        commands = {}
+        for cmd_name, (count, total_time, max_time, byte_count) in self.commands.iteritems():
+            if (count):
+                commands[cmd_name] = dict(count=count,
+                                          total_time=total_time,
+                                          max_time=max_time,
+                                          bytes=byte_count)
+
+        return dict(commands=commands,
+                    handler_count=sum(c['count'] for c in commands.itervalues()),
+                    handler_time=sum(c['total_time'] for c in commands.itervalues()),
+                    errors=dict(self.errors),
+                    error_count=sum(self.errors.itervalues()))
+
+    def write(self, out_file):
+        """Writes the statistics as a table sorted by cumulative handler time."""
+        stats = self.to_dict()
+        handler_time = stats['handler_time']
+
+        row = '{:<22s} {:>10s} {:>11s} {:>6s} {:>10s} {:>10s} {:>12s}' + os.linesep
+        out_file.write(row.format('Command', 'Calls', 'Total [ms]', '%',
+                                  'Mean [us]', 'Max [us]', 'Bytes'))
+        out_file.write('-' * 87 + os.linesep)
+        for cmd_name, c in sorted(stats['commands'].iteritems(),
+                                  key=lambda item: item[1]['total_time'],
+                                  reverse=True):
+            out_file.write(row.format(cmd_name,
+                                      str(c['count']),
+                                      '%.3f' % (c['total_time'] * 1e3),
+                                      '%.1f' % ((100.0 * c['total_time'] / handler_time)
+                                                if handler_time else 0.0),
+                                      '%.2f' % (c['total_time'] * 1e6 / c['count']),
+                                      '%.2f' % (c['max_time'] * 1e6),
+                                      str(c['bytes'])))
+        out_file.write('-' * 87 + os.linesep)
+        out_file.write('{:<22s} {:>10d} {:>11.3f}{:s}'.format('Total',
+                                                             stats['handler_count'],
+                                                             (handler_time * 1e3),
+                                                             os.linesep))
+
+        out_file.write('{:<25s} {:d}{:s}'.format('Errors:', stats['error_count'], os.linesep))
+        for msg, count in sorted(stats['errors'].iteritems()):
+            out_file.write('    {:>8d}  {:s}{:s}'.format(count, msg, os.linesep))
+
+
+class QuantileSketch(object):
+    """Summarizes a stream of values in constant memory. Keeps the count, min,
+    max, and mean, and estimates quantiles to within relative_accuracy of the
+    true value by counting the values in logarithmically sized buckets (the
+    same approach as DDSketch). The number of buckets depends only on the
+    range of the values, not on how many there are.
+
+    """
+
+    def __init__(self, relative_accuracy=TIMING_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = ((1.0 + relative_accuracy) / (1.0 - relative_accuracy))
+        self._inv_log_gamma = (1.0 / math.log(self._gamma))
+
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if (value >= TIMING_MIN_VALUE):
+            i = int(math.ceil(math.log(value) * self._inv_log_gamma))
+            self.buckets[i] = (self.buckets.get(i, 0) + 1)
+        else:
+            self.zero_count += 1
+
+        self.count += 1
+        self.total += value
+        if ((self.min is None) or (value < self.min)):
+            self.min = value
+        if ((self.max is None) or (value > self.max)):
+            self.max = value
+
+    def merge(self, other):
+        """Adds the values of another sketch with the same accuracy."""
+        for i, count in other.buckets.iteritems():
+            self.buckets[i] = (self.buckets.get(i, 0) + count)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        if ((other.min is not None) and ((self.min is None) or (other.min < self.min))):
+            self.min = other.min
+        if ((other.max is not None) and ((self.max is None) or (other.max > self.max))):
+            self.max = other.max
+
+    def mean(self):
+        if (0 == self.count):
+            return None
+        return (self.total / self.count)
+
+    def quantile(self, q):
+        """Returns an estimate of the q-quantile (0 <= q <= 1) or None if no
+        values were added.
+
+        """
+        if (0 == self.count):
+            return None
+
+        rank = int(q * (self.count - 1))
+        if (rank < self.zero_count):
+            return self.min
+
+        seen = self.zero_count
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if (seen > rank):
+                value = (2.0 * (self._gamma ** i) / (self._gamma + 1.0))
+                return max(self.min, min(self.max, value))
+        return self.max
+
+    def histogram(self):
+        """Returns a list of (lower, upper, count) tuples for the non-empty
+        buckets in ascending order. Values below TIMING_MIN_VALUE are in the
+        (0, TIMING_MIN_VALUE) bucket.
+
+        """
+        result = []
+        if (self.zero_count):
+            result.append((0.0, TIMING_MIN_VALUE, self.zero_count))
+        for i in sorted(self.buckets):
+            result.append(((self._gamma ** (i - 1)), (self._gamma ** i), self.buckets[i]))
+        return result
+
+    def to_dict(self):
+        return dict(count=self.count,
+                    min=self.min,
+                    max=self.max,
+                    mean=self.mean(),
+                    p50=self.quantile(0.5),
+                    p90=self.quantile(0.9),
+                    p99=self.quantile(0.99),
+                    histogram=self.histogram())
+
+
+class TimingStats(object):
+    """Collects timing statistics from a Decode object:
+        intervals         [dict]             Maps the names of the payload
+                                             commands to a QuantileSketch of the
+                                             deltas that are printed for them
+        channel_intervals [dict]             Maps (cmd_name, channel) to a
+                                             QuantileSketch of the same deltas
+                                             split by the RF channel
+        durations         [dict]             Maps command names to a
+                                             QuantileSketch of the time from the
+                                             first to the last byte of each SPI
+                                             transaction (when the end timestamp
+                                             is passed to Decode.update)
+
+    Like DecodeStats, attach() wraps the decoder's handlers so a decoder
+    without TimingStats runs exactly the same code as before. The memory used
+    doesn't depend on the length of the capture.
+
+    """
+
+    PAYLOAD_COMMANDS = ('W_TX_PAYLOAD', 'W_TX_PAYLOAD_NO_ACK', 'R_RX_PAYLOAD')
+
+    def __init__(self, relative_accuracy=TIMING_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.intervals = {}
+        self.channel_intervals = {}
+        self.durations = {}
+
+    def _get_sketch(self, sketches, key):
+        sketch = sketches.get(key)
+        if (sketch is None):
+            sketch = QuantileSketch(self.relative_accuracy)
+            sketches[key] = sketch
+        return sketch
+
+    def attach(self, decoder):
+        """Starts collecting statistics from the decoder."""
+        dispatch = decoder._dispatch
+        for cmd, cmd_props in enumerate(dispatch):
+            if ((cmd_props is not None) and (cmd_props[1] in self.PAYLOAD_COMMANDS)):
+                func, cmd_name = cmd_props[:2]
+                dispatch[cmd] = ((self._wrap_handler(decoder, func, cmd_name),) +
+                                 cmd_props[1:])
+
+        update = decoder.update
+        durations = self.durations
+        get_sketch = self._get_sketch
+
+        def timed_update(ts, transaction_id, mosi_data, miso_data, end_ts=None):
+            update(ts, transaction_id, mosi_data, miso_data, end_ts)
+            if (end_ts is not None):
+                get_sketch(durations, dispatch[mosi_data[0]][1]).add(end_ts - ts)
+
+        decoder.update = timed_update
+        decoder.timing = self
+        return decoder
+
+    def _wrap_handler(self, decoder, func, cmd_name):
+        interval_sketch = self._get_sketch(self.intervals, cmd_name)
+        channel_intervals = self.channel_intervals
+        get_sketch = self._get_sketch
+
+        def timed_handler(ts, transaction_id, mosi_data, miso_data, packed_index):
+            transactions = decoder.transactions
+            i = len(transactions)
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+
+            # The handler logs the delta since the previous payload.
+            if (len(transactions) > i):
+                delta = transactions.deltas[i]
+                if (delta == delta):
+                    interval_sketch.add(delta)
+                    get_sketch(channel_intervals, (cmd_name, decoder.get_channel())).add(delta)
+
+        return timed_handler
+
+    def to_dict(self):
+        """Returns the statistics as a dict that can be serialized as JSON."""
+        channels = {}
+        for (cmd_name, ch), sketch in self.channel_intervals.iteritems():
+            channels.setdefault(cmd_name, {})[str(ch)] = sketch.to_dict()
+
+        return dict(relative_accuracy=self.relative_accuracy,
+                    intervals=dict((cmd_name, sketch.to_dict())
+                                   for cmd_name, sketch in self.intervals.iteritems()
+                                   if sketch.count),
+                    channel_intervals=channels,
+                    durations=dict((cmd_name, sketch.to_dict())
+                                   for cmd_name, sketch in self.durations.iteritems()))
+
+    def write(self, out_file):
+        """Writes a table with the count, min, mean, percentiles, and max of
+        the payload intervals and transaction durations.
+
+        """
+        row = '{:<36s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}' + os.linesep
+        out_file.write(row.format('Timing [ms]:', 'Count', 'Min', 'Mean', 'p50', 'p90',
+                                  'p99', 'Max'))
+
+        def write_sketch(name, sketch):
+            out_file.write(row.format(name, str(sketch.count),
+                                      *[('%.3f' % (v * 1e3)) for v in (sketch.min,
+                                                                      sketch.mean(),
+                                                                      sketch.quantile(0.5),
+                                                                      sketch.quantile(0.9),
+                                                                      sketch.quantile(0.99),
+                                                                      sketch.max)]))
+
+        for cmd_name in self.PAYLOAD_COMMANDS:
+            sketch = self.intervals.get(cmd_name)
+            if ((sketch is not None) and sketch.count):
+                write_sketch(('    ' + cmd_name + ' interval'), sketch)
+        for cmd_name, sketch in sorted(self.durations.iteritems()):
+            write_sketch(('    ' + cmd_name + ' duration'), sketch)
+
+
+class ModeTimeline(object):
+    """Records the operational mode and RF channel of a Decode object over
+    time as a list of intervals that are stored in arrays:
+        starts            [array of floats]  Start of each interval in seconds
+        modes             [array of ints]    Index of its mode in MODES
+        channels          [array of ints]    Its RF channel
+        end               [float or None]    Timestamp of the last transaction,
+                                             which ends the last interval
+
+    The mode is the one that get_operational_mode returns after each read or
+    write of the CONFIG, RF_CH, and FIFO_STATUS registers. Since TX_EMPTY is
+    only known when FIFO_STATUS is read, a W_TX_PAYLOAD in STANDBY also starts
+    PTX, which lasts until the STATUS byte of a transaction has TX_DS or MAX_RT
+    set, FIFO_STATUS is read, or the TX FIFO is flushed.
+
+    The intervals that have ended are indexed by (mode, channel) along with
+    the cumulative time, so mode_at and get_time take logarithmic time. Like
+    TimingStats, attach() wraps the decoder's handlers (only those of the
+    commands that can change the mode or channel) so a decoder without a
+    ModeTimeline runs exactly the same code as before.
+
+    """
+
+    MODES = ('POWER_DOWN', 'STANDBY', 'PTX', 'PRX')
+    MODE_LOOKUP = dict([(mode, i) for i, mode in enumerate(MODES)])
+
+    MODE_REGISTERS = ('CONFIG', 'RF_CH', 'FIFO_STATUS')
+    TX_PAYLOAD_COMMANDS = ('W_TX_PAYLOAD', 'W_TX_PAYLOAD_NO_ACK')
+
+    # STATUS bits that are set once a payload has been sent (or dropped).
+    TX_DONE_MASK = ((1 << Decode.REGISTER_FIELD_LOOKUP['TX_DS']) |
+                    (1 << Decode.REGISTER_FIELD_LOOKUP['MAX_RT']))
+
+    def __init__(self):
+        self.starts = array.array('d')
+        self.modes = array.array('B')
+        self.channels = array.array('B')
+        self.end = None
+
+        # Maps (mode, channel) to arrays of the starts, ends, and cumulative
+        # durations (with a leading 0.0) of its intervals that have ended.
+        self._index = {}
+        self._tx_pending = False
+
+    def attach(self, decoder):
+        """Starts recording the mode and channel of the decoder."""
+        mode_registers = [addr for addr in decoder.REGISTERS
+                          if (decoder.REGISTERS[addr][0] in self.MODE_REGISTERS)]
+        fifo_status = decoder.REGISTER_LOOKUP['FIFO_STATUS']
+
+        dispatch = decoder._dispatch
+        for cmd, cmd_props in enumerate(dispatch):
+            if (cmd_props is None):
+                continue
+            func, cmd_name, packed_index = cmd_props[:3]
+            if (cmd_name in self.TX_PAYLOAD_COMMANDS):
+                tx_pending = True
+            elif (('FLUSH_TX' == cmd_name) or
+                  (('R_REGISTER' == cmd_name) and (fifo_status == packed_index))):
+                tx_pending = False
+            elif ((cmd_name in ('R_REGISTER', 'W_REGISTER')) and
+                  (packed_index in mode_registers)):
+                tx_pending = None
+            else:
+                continue
+            dispatch[cmd] = ((self._wrap_handler(decoder, func, tx_pending),) +
+                             cmd_props[1:])
+
+        update = decoder.update
+        timeline = self
+        starts = self.starts
+        tx_done_mask = self.TX_DONE_MASK
+
+        def timed_update(ts, transaction_id, mosi_data, miso_data, end_ts=None):
+            if (not starts):
+                timeline._add(decoder, ts)
+            elif (timeline._tx_pending and (miso_data[0] & tx_done_mask)):
+                timeline._tx_pending = False
+                timeline._add(decoder, ts)
+            update(ts, transaction_id, mosi_data, miso_data, end_ts)
+            timeline.end = (ts if (end_ts is None) else end_ts)
+
+        decoder.update = timed_update
+        decoder.mode_timeline = self
+        return decoder
+
+    def _wrap_handler(self, decoder, func, tx_pending):
+        timeline = self
+
+        def mode_handler(ts, transaction_id, mosi_data, miso_data, packed_index):
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+            if (tx_pending is not None):
+                timeline._tx_pending = tx_pending
+            timeline._add(decoder, ts)
+
+        return mode_handler
+
+    def _add(self, decoder, ts):
+        """Starts a new interval at ts if the mode or channel has changed."""
+        mode = decoder.get_operational_mode()
+        if (self._tx_pending and ('STANDBY' == mode)):
+            mode = 'PTX'
+        mode = self.MODE_LOOKUP[mode]
+        channel = decoder.get_channel()
+
+        if (not self.starts):
+            self.starts.append(ts)
+            self.modes.append(mode)
+            self.channels.append(channel)
+            return
+
+        if ((mode == self.modes[-1]) and (channel == self.channels[-1])):
+            return
+
+        start = self.starts[-1]
+        if (ts <= start):
+            # The interval hasn't lasted any time so it is replaced.
+            self.modes[-1] = mode
+            self.channels[-1] = channel
+            return
+
+        key = (self.modes[-1], self.channels[-1])
+        index = self._index.get(key)
+        if (index is None):
+            index = (array.array('d'), array.array('d'), array.array('d', [0.0]))
+            self._index[key] = index
+        starts, ends, totals = index
+        starts.append(start)
+        ends.append(ts)
+        totals.append(totals[-1] + (ts - start))
+
+        self.starts.append(ts)
+        self.modes.append(mode)
+        self.channels.append(channel)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        """Yields (start, end, mode, channel) for each interval."""
+        for i in xrange(len(self.starts)):
+            end = (self.starts[i + 1] if ((i + 1) < len(self.starts)) else self.end)
+            yield (self.starts[i], end, self.MODES[self.modes[i]], self.channels[i])
+
+    def mode_at(self, ts):
+        """Returns the (mode, channel) at the given time, or None if it isn't
+        covered by the timeline.
+
+        """
+        i = (bisect.bisect_right(self.starts, ts) - 1)
+        if ((i < 0) or (ts > self.end)):
+            return None
+        return (self.MODES[self.modes[i]], self.channels[i])
+
+    def get_time(self, mode=None, channel=None, start=None, end=None):
+        """Returns the total time in seconds that was spent in the given mode
+        (or any mode if it is None) on the given channel (or any channel)
+        between the start and end times (or the whole timeline).
+
+        """
+        if (not self.starts):
+            return 0.0
+        if (start is None):
+            start = self.starts[0]
+        if (end is None):
+            end = self.end
+        if (mode is not None):
+            mode = self.MODE_LOOKUP[mode]
+
+        total = 0.0
+        for (key_mode, key_channel), (starts, ends, totals) in self._index.iteritems():
+            if (((mode is not None) and (mode != key_mode)) or
+                    ((channel is not None) and (channel != key_channel))):
+                continue
+            i = bisect.bisect_right(ends, start)
+            j = bisect.bisect_left(starts, end)
+            if (i >= j):
+                continue
+            total += (totals[j] - totals[i])
+            if (starts[i] < start):
+                total -= (start - starts[i])
+            if (ends[j - 1] > end):
+                total -= (ends[j - 1] - end)
+
+        # The last interval hasn't ended so it isn't indexed.
+        if (((mode is None) or (mode == self.modes[-1])) and
+                ((channel is None) or (channel == self.channels[-1]))):
+            total += max(0.0, (min(end, self.end) - max(start, self.starts[-1])))
+        return total
+
+    def get_channels(self):
+        """Returns a sorted list of the channels in the timeline."""
+        channels = set([channel for mode, channel in self._index])
+        if (self.channels):
+            channels.add(self.channels[-1])
+        return sorted(channels)
+
+    def to_dict(self):
+        """Returns the timeline and the time spent in each mode and on each
+        channel (in PTX and PRX) as a dict that can be serialized as JSON.
+
+        """
+        if (not self.starts):
+            return dict(start=None, end=None, modes={}, channels={}, intervals=[])
+
+        return dict(start=self.starts[0],
+                    end=self.end,
+                    modes=dict([(mode, self.get_time(mode)) for mode in self.MODES]),
+                    channels=dict([(str(channel),
+                                    dict([(mode, self.get_time(mode, channel))
+                                          for mode in ('PTX', 'PRX')]))
+                                   for channel in self.get_channels()]),
+                    intervals=[list(interval) for interval in self])
+
+    def write(self, out_file):
+        """Writes a table with the time and duty cycle of each mode, and of
+        PTX and PRX on each channel.
+
+        """
+        if (not self.starts):
+            return
+
+        duration = (self.end - self.starts[0])
+
+        def duty_cycle(seconds):
+            return (('%.2f%%' % (100.0 * seconds / duration)) if duration else '-')
+
+        row = '{:<36s} {:>10s} {:>10s} {:>10s} {:>10s}' + os.linesep
+        out_file.write(row.format('Operational modes [s]:', 'Time', 'Duty cycle', '', ''))
+        for mode in self.MODES:
+            seconds = self.get_time(mode)
+            out_file.write(row.format(('    ' + mode), ('%.3f' % seconds),
+                                      duty_cycle(seconds), '', ''))
+
+        out_file.write(row.format('Channels [s]:', 'PTX', 'Duty cycle', 'PRX',
+                                  'Duty cycle'))
+        for channel in self.get_channels():
+            ptx = self.get_time('PTX', channel)
+            prx = self.get_time('PRX', channel)
+            if (ptx or prx):
+                out_file.write(row.format(('    %d' % channel), ('%.3f' % ptx),
+                                          duty_cycle(ptx), ('%.3f' % prx),
+                                          duty_cycle(prx)))
+
+
+class ChannelStats(object):
+    """Collects the following for each RF channel (indexed by channel) from a
+    Decode object:
+        dwell_times       [array of floats]  Time spent on the channel in seconds
+        hop_counts        [array of ints]    Number of hops to the channel
+        tx_counts         [array of ints]    Number of TX payloads written on it
+        rx_counts         [array of ints]    Number of RX payloads read on it
+
+    A hop is a read or write of RF_CH that changes the channel. The hop
+    sequence is stored as a list of segments, each of which is a cycle of
+    channels (an array) and the number of times it was repeated in a row. A
+    cycle of up to max_period channels that is repeated min_count times is
+    detected incrementally (see get_cycle) and from then on each hop only
+    counts the repetitions of the last segment.
+
+    Like TimingStats, attach() wraps the decoder's handlers (only those of
+    RF_CH and the payload commands) so a decoder without ChannelStats runs
+    exactly the same code as before.
+
+    """
+
+    CHANNEL_COUNT = (Decode.RF_CHANNEL_MASK + 1)
+
+    TX_PAYLOAD_COMMANDS = ('W_TX_PAYLOAD', 'W_TX_PAYLOAD_NO_ACK')
+    RX_PAYLOAD_COMMANDS = ('R_RX_PAYLOAD',)
+
+    def __init__(self, max_period=HOP_MAX_PERIOD, min_count=HOP_MIN_COUNT):
+        self.max_period = max_period
+        self.min_count = min_count
+
+        self.dwell_times = array.array('d', ([0.0] * self.CHANNEL_COUNT))
+        self.hop_counts = array.array('L', ([0] * self.CHANNEL_COUNT))
+        self.tx_counts = array.array('L', ([0] * self.CHANNEL_COUNT))
+        self.rx_counts = array.array('L', ([0] * self.CHANNEL_COUNT))
+
+        self.channel = None
+        self.start = None
+        self.end = None
+        self.segments = []
+        self.hop_count = 0
+
+        # The time the current channel was entered.
+        self._since = None
+        # The hops after the last segment that aren't part of a cycle yet.
+        self._pending = []
+        # _matched[period] is the number of the last pending hops that are the
+        # same as the hop that is period hops before them.
+        self._matched = [0] * (max_period + 1)
+        # The position in the cycle of the last segment while it is repeated.
+        self._cycle_pos = None
+
+    def attach(self, decoder):
+        """Starts collecting statistics from the decoder."""
+        rf_ch = decoder.REGISTER_LOOKUP['RF_CH']
+        tx_counts = self.tx_counts
+        rx_counts = self.rx_counts
+
+        dispatch = decoder._dispatch
+        for cmd, cmd_props in enumerate(dispatch):
+            if (cmd_props is None):
+                continue
+            func, cmd_name, packed_index = cmd_props[:3]
+            if ((cmd_name in ('R_REGISTER', 'W_REGISTER')) and (rf_ch == packed_index)):
+                handler = self._wrap_channel_handler(decoder, func)
+            elif (cmd_name in self.TX_PAYLOAD_COMMANDS):
+                handler = self._wrap_payload_handler(func, tx_counts)
+            elif (cmd_name in self.RX_PAYLOAD_COMMANDS):
+                handler = self._wrap_payload_handler(func, rx_counts)
+            else:
+                continue
+            dispatch[cmd] = ((handler,) + cmd_props[1:])
+
+        update = decoder.update
+        channel_stats = self
+
+        def counted_update(ts, transaction_id, mosi_data, miso_data, end_ts=None):
+            if (channel_stats.start is None):
+                channel_stats.start = ts
+                channel_stats.channel = decoder.get_channel()
+                channel_stats._since = ts
+            update(ts, transaction_id, mosi_data, miso_data, end_ts)
+            channel_stats.end = (ts if (end_ts is None) else end_ts)
+
+        decoder.update = counted_update
+        decoder.channel_stats = self
+        return decoder
+
+    def _wrap_channel_handler(self, decoder, func):
+        channel_stats = self
+
+        def channel_handler(ts, transaction_id, mosi_data, miso_data, packed_index):
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+            channel = decoder.get_channel()
+            if (channel != channel_stats.channel):
+                channel_stats._hop(ts, channel)
+
+        return channel_handler
+
+    def _wrap_payload_handler(self, func, counts):
+        channel_stats = self
+
+        def payload_handler(ts, transaction_id, mosi_data, miso_data, packed_index):
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+            counts[channel_stats.channel] += 1
+
+        return payload_handler
+
+    def _hop(self, ts, channel):
+        self.dwell_times[self.channel] += (ts - self._since)
+        self.hop_counts[channel] += 1
+        self.hop_count += 1
+        self.channel = channel
+        self._since = ts
+
+        hops = [channel]
+        while (hops):
+            channel = hops.pop(0)
+
+            if (self._cycle_pos is not None):
+                segment = self.segments[-1]
+                cycle = segment[0]
+                if (channel == cycle[self._cycle_pos]):
+                    self._cycle_pos += 1
+                    if (len(cycle) == self._cycle_pos):
+                        segment[1] += 1
+                        self._cycle_pos = 0
+                    continue
+                # The cycle was broken, so the start of an incomplete
+                # repetition and this hop might start another one.
+                hops = (list(cycle[:self._cycle_pos]) + [channel] + hops)
+                self._cycle_pos = None
+                continue
+
+            pending = self._pending
+            matched = self._matched
+            pending.append(channel)
+            count = len(pending)
+            for period in xrange(1, (self.max_period + 1)):
+                if ((period < count) and (channel == pending[-1 - period])):
+                    matched[period] += 1
+                else:
+                    matched[period] = 0
+
+            for period in xrange(1, (self.max_period + 1)):
+                if (matched[period] >= (period * (self.min_count - 1))):
+                    start = (count - (period * self.min_count))
+                    if (start):
+                        self._add_literal(pending[:start])
+                    self.segments.append([array.array('B', pending[start:(start + period)]),
+                                          self.min_count])
+                    self._cycle_pos = 0
+                    self._pending = []
+                    self._matched = [0] * (self.max_period + 1)
+                    break
+            else:
+                if (count > (self.max_period * self.min_count)):
+                    self._add_literal(pending[:1])
+                    del pending[0]
+
+    def _add_literal(self, channels):
+        """Adds hops that aren't part of a cycle to the last segment unless it
+        is a cycle.
+
+        """
+        if (self.segments and (1 == self.segments[-1][1])):
+            self.segments[-1][0].extend(channels)
+        else:
+            self.segments.append([array.array('B', channels), 1])
+
+    def get_cycle(self):
+        """Returns the hop cycle that is being repeated as a list of channels
+        and the number of times it has been repeated, or None if the last hops
+        don't repeat.
+
+        """
+        if (self._cycle_pos is None):
+            return None
+        cycle, count = self.segments[-1]
+        return (list(cycle), count)
+
+    def get_period(self):
+        """Returns the number of hops in the cycle that is being repeated, or
+        None.
+
+        """
+        if (self._cycle_pos is None):
+            return None
+        return len(self.segments[-1][0])
+
+    def get_sequence(self):
+        """Returns the hop sequence as a list of [channels, count] segments,
+        including the hops that aren't part of a segment yet.
+
+        """
+        sequence = [[list(cycle), count] for cycle, count in self.segments]
+        if (self._cycle_pos):
+            sequence.append([list(self.segments[-1][0][:self._cycle_pos]), 1])
+        if (self._pending):
+            sequence.append([list(self._pending), 1])
+        return sequence
+
+    def iter_hops(self):
+        """Yields the channel of each hop in order."""
+        for cycle, count in self.get_sequence():
+            for i in xrange(count):
+                for channel in cycle:
+                    yield channel
+
+    def get_dwell_time(self, channel):
+        """Returns the time spent on the channel in seconds, including the
+        time since the last hop to it if it is the current channel.
+
+        """
+        dwell_time = self.dwell_times[channel]
+        if ((channel == self.channel) and (self.end is not None)):
+            dwell_time += (self.end - self._since)
+        return dwell_time
+
+    def get_channels(self):
+        """Returns a sorted list of the channels that were used."""
+        return [channel for channel in xrange(self.CHANNEL_COUNT)
+                if ((channel == self.channel) or self.hop_counts[channel] or
+                    self.dwell_times[channel])]
+
+    def to_dict(self):
+        """Returns the hop table and the hop sequence as a dict that can be
+        serialized as JSON.
+
+        """
+        cycle = self.get_cycle()
+        return dict(start=self.start,
+                    end=self.end,
+                    hop_count=self.hop_count,
+                    channels=dict([(str(channel),
+                                    dict(dwell_time=self.get_dwell_time(channel),
+                                         hops=self.hop_counts[channel],
+                                         tx_count=self.tx_counts[channel],
+                                         rx_count=self.rx_counts[channel]))
+                                   for channel in self.get_channels()]),
+                    cycle=(None if (cycle is None) else cycle[0]),
+                    cycle_count=(None if (cycle is None) else cycle[1]),
+                    sequence=self.get_sequence())
+
+    def write(self, out_file):
+        """Writes a table with the dwell time, duty cycle, hops, TX payloads,
+        and RX payloads of each channel, followed by the hop cycle.
+
+        """
+        if (self.start is None):
+            return
+
+        duration = (self.end - self.start)
+        row = '{:<36s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}' + os.linesep
+        out_file.write(row.format('Channels:', 'Dwell [s]', 'Duty cycle', 'Hops', 'TX', 'RX'))
+        for channel in self.get_channels():
+            dwell_time = self.get_dwell_time(channel)
+            out_file.write(row.format(('    %d' % channel),
+                                      ('%.3f' % dwell_time),
+                                      (('%.2f%%' % (100.0 * dwell_time / duration))
+                                       if duration else '-'),
+                                      str(self.hop_counts[channel]),
+                                      str(self.tx_counts[channel]),
+                                      str(self.rx_counts[channel])))
+
+        cycle = self.get_cycle()
+        if (cycle is None):
+            out_file.write('{:<25s} {:s}{:s}'.format('Hop cycle:', 'None', os.linesep))
+        else:
+            out_file.write('{:<25s} {} x{:d}{:s}'.format('Hop cycle:', cycle[0], cycle[1],
+                                                         os.linesep))
+
+
+class TransactionFilter(object):
+    """Selects decoded transactions. It is created from an expression that
+    consists of space-separated terms, all of which have to match:
+        cmd:NAME[,NAME...]     Command names. The register of R_REGISTER and
+                               W_REGISTER can be given in parentheses, e.g.
+                               W_REGISTER(RF_CH).
+        reg:NAME[,NAME...]     Registers that are read or written
+        time:START..END        Timestamps in seconds (START <= ts < END)
+        id:START..END          Transaction IDs (START <= id < END)
+        data:PATTERN           Hex bytes that have to appear in the data bytes,
+                               where ?? matches any byte, e.g. 0045??9A
+
+    Either end of a range can be left out. For example:
+
+        cmd:W_REGISTER(RF_CH),W_TX_PAYLOAD time:12.5..30
+
+    """
+
+    def __init__(self, expression=''):
+        self.expression = expression
+        self.cmds = None
+        self.registers = None
+        self.ts_range = (None, None)
+        self.id_range = (None, None)
+        self.data_pattern = None
+
+        for term in expression.split():
+            key, sep, value = term.partition(':')
+            if ((not sep) or (not value)):
+                raise DecodeError('ERROR: Invalid filter term: %s' % term)
+
+            if ('cmd' == key):
+                self.cmds = set([self._parse_cmd(name) for name in value.split(',')])
+            elif ('reg' == key):
+                self.registers = set([self._parse_register(name) for name in value.split(',')])
+            elif ('time' == key):
+                self.ts_range = self._parse_range(value, float)
+            elif ('id' == key):
+                self.id_range = self._parse_range(value, (lambda s: int(float(s))))
+            elif ('data' == key):
+                self.data_pattern = self._parse_data_pattern(value)
+            else:
+                raise DecodeError('ERROR: Unknown filter term: %s' % term)
+
+    def _parse_register(self, name):
+        if (name.upper() in Decode.REGISTER_LOOKUP):
+            return Decode.REGISTER_LOOKUP[name.upper()]
+        addr = _parse_num(name)
+        if (not isinstance(addr, int)):
+            raise DecodeError('ERROR: Unknown register in filter: %s' % name)
+        return addr
+
+    def _parse_cmd(self, name):
+        name, sep, register = name.partition('(')
+        cmd = Decode.COMMAND_LOOKUP.get(name.upper())
+        if (cmd is None):
+            raise DecodeError('ERROR: Unknown command in filter: %s' % name)
+        if (not sep):
+            return (cmd, None)
+        if ((cmd not in Decode.REGISTER_COMMANDS) or (not register.endswith(')'))):
+            raise DecodeError('ERROR: Invalid command in filter: %s(%s' % (name, register))
+        return (cmd, self._parse_register(register[:-1]))
+
+    @staticmethod
+    def _parse_range(value, convert):
+        start, sep, end = value.partition('..')
+        if (not sep):
+            raise DecodeError('ERROR: Invalid range in filter: %s' % value)
         try:
-            return int(s, 16)
+            return (convert(start) if start else None,
+                    convert(end) if end else None)
         except ValueError:
+            raise DecodeError('ERROR: Invalid range in filter: %s' % value)
+
+    def _parse_data_pattern(self, value):
+        if ((0 != (len(value) % 2)) or (not value)):
+            raise DecodeError('ERROR: Invalid data pattern in filter: %s' % value)
+        regex = []
+        for i in xrange(0, len(value), 2):
+            if ('??' == value[i:(i + 2)]):
+                regex.append('.')
+                continue
             try:
-                return float(s)
+                regex.append(re.escape(chr(int(value[i:(i + 2)], 16))))
             except ValueError:
-                return None
+                raise DecodeError('ERROR: Invalid data pattern in filter: %s' % value)
+        return re.compile(''.join(regex), re.DOTALL)
 
+    def is_before(self, ts, transaction_id):
+        """Returns True if the transaction comes before the time and ID
+        ranges.
 
-def parse_file(file_name):
-    """Parses a file in the form:
+        """
+        return (((self.ts_range[0] is not None) and (ts < self.ts_range[0])) or
+                ((self.id_range[0] is not None) and (transaction_id < self.id_range[0])))
 
-    Time, Packet ID, MOSI, MISO\n
-    0.0,0,0x00,0x01\n
-    0.1,1,0x01,0x02\n
-    ...
+    def is_past(self, ts, transaction_id):
+        """Returns True if the transaction (and all of the ones after it)
+        comes after the time or ID range.
+
+        """
+        return (((self.ts_range[1] is not None) and (ts >= self.ts_range[1])) or
+                ((self.id_range[1] is not None) and (transaction_id >= self.id_range[1])))
+
+    def get_skip_cmds(self):
+        """Returns a tuple of 256 bools that are True for the command bytes of
+        payloads that can't match (so their data bytes don't have to be
+        parsed), or None if all of them can match.
+
+        """
+        if ((self.cmds is None) and (self.registers is None)):
+            return None
+
+        selected = set(Decode.REGISTER_COMMANDS)
+        if (self.cmds is not None):
+            selected = set([cmd for cmd, packed_index in self.cmds])
+            if (self.registers is not None):
+                selected &= set(Decode.REGISTER_COMMANDS)
+
+        return tuple([(counted and (Decode.COMMAND_LOOKUP[cmd_props[1]] not in selected))
+                      for counted, cmd_props in zip(SummaryDecode.get_counted_cmds(),
+                                                    Decode._get_dispatch_table())])
+
+    def matches(self, transactions, i):
+        """Returns True if the transaction at index i of a TransactionLog
+        matches.
+
+        """
+        if (self.is_before(transactions.ts[i], transactions.transaction_ids[i]) or
+                self.is_past(transactions.ts[i], transactions.transaction_ids[i])):
+            return False
+
+        cmd = transactions.cmds[i]
+        packed_index = transactions.packed_indexes[i]
+        if ((self.cmds is not None) and
+                ((cmd, None) not in self.cmds) and
+                ((cmd, packed_index) not in self.cmds)):
+            return False
+        if ((self.registers is not None) and
+                ((cmd not in Decode.REGISTER_COMMANDS) or (packed_index not in self.registers))):
+            return False
+
+        if (self.data_pattern is not None):
+            offset = transactions.offsets[i]
+            data = str(transactions.payload[offset:(offset + transactions.lengths[i])])
+            if (self.data_pattern.search(data) is None):
+                return False
+
+        return True
 
-    All lines that contain the same Packet ID are combined into
-    single messages and then sent to the parsing object.
+
+def _read_state_vector(decoder, registers):
+    """Returns the decoder's state as a list of values that can be stored as
+    JSON. The register values come first, in the order of registers.
 
     """
-    decoder = Decode()
+    reg_values = decoder.reg_values
+    vector = [tuple(reg_values[addr]) for addr in registers]
+    vector.append(decoder.tx_count)
+    vector.append(decoder.rx_count)
+    vector.append(tuple(decoder.used_channels))
+    vector.append(tuple(sorted(decoder._timestamps.iteritems())))
+    vector.append(decoder._beken_bank_switch_active)
+    vector.append(decoder.beken_detected)
+    return vector
+
+
+def _state_vector_to_dict(vector, registers):
+    """Converts a state vector to a dict that Decode.set_state accepts."""
+    count = len(registers)
+    return {'reg_values': dict(zip(registers, [list(val) for val in vector[:count]])),
+            'tx_count': vector[count],
+            'rx_count': vector[count + 1],
+            'used_channels': list(vector[count + 2]),
+            'timestamps': dict([tuple(item) for item in vector[count + 3]]),
+            'beken_bank_switch_active': vector[count + 4],
+            'beken_detected': vector[count + 5]}
+
+
+class _StateIndexBlock(object):
+    """The changes that a StateIndex records between two of its snapshots:
+    the register deltas (transaction_id, ts, ((slot, value), ...)) and the
+    IDs and timestamps of the TX and RX payloads.
 
-    with open(file_name) as in_file:
-        _verify_column_names(in_file.readline())
+    """
 
-        start_ts = None
-        cur_packet_id = None
-        mosi_data = []
-        miso_data = []
-        for line in in_file:
-            ts, packet_id, mosi, miso = [_parse_num(n) for n in
-                                         line.split(COL_SEPARATOR)]
+    def __init__(self):
+        self.deltas = []
+        self.tx_ids = array.array('l')
+        self.tx_ts = array.array('d')
+        self.rx_ids = array.array('l')
+        self.rx_ts = array.array('d')
+
+    def to_json(self):
+        return json.dumps({'deltas': self.deltas,
+                           'tx': [list(self.tx_ids), list(self.tx_ts)],
+                           'rx': [list(self.rx_ids), list(self.rx_ts)]},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        block = cls()
+        block.deltas = data['deltas']
+        block.tx_ids.extend(data['tx'][0])
+        block.tx_ts.extend(data['tx'][1])
+        block.rx_ids.extend(data['rx'][0])
+        block.rx_ts.extend(data['rx'][1])
+        return block
+
+
+class StateIndex(object):
+    """Records the state of a decoder while a file is being decoded so that
+    the state after any transaction can be restored without decoding the file
+    again. A full snapshot is stored every interval transactions. In between,
+    a delta is only stored when a register or the Beken bank changes (a write,
+    a read that returns a new value, or a new STATUS byte), and the TX and RX
+    payloads are stored as arrays of their IDs and timestamps, from which the
+    counters and the payload timestamps are restored.
+
+    attach() wraps the handlers of the commands that can change a register
+    (the same way DecodeStats does), so only those registers are compared
+    after a transaction. The decoder has to be attached before it is
+    recorded.
+
+    The index file starts with a line that holds the snapshots and the
+    location of each block of changes that follows it, so a query only reads
+    that line and the block that it needs.
+
+    Transaction IDs and timestamps are expected to increase throughout the
+    input file.
 
-            if (packet_id is None):
-                continue
+    """
 
-            if (packet_id != cur_packet_id):
-                if (cur_packet_id is not None):
-                    decoder.update(start_ts,
-                                   cur_packet_id,
-                                   mosi_data,
-                                   miso_data)
-
-                start_ts = ts
-                cur_packet_id = packet_id
-                mosi_data = [mosi]
-                miso_data = [miso]
+    # Commands that can change the FIFO_STATUS and STATUS registers.
+    FIFO_COMMANDS = ('W_TX_PAYLOAD', 'FLUSH_TX', 'FLUSH_RX', 'REUSE_TX_PL')
+
+    def __init__(self, interval=STATE_INDEX_INTERVAL):
+        self.interval = interval
+        self.registers = sorted(Decode.REGISTERS)
+
+        # Each snapshot is (transaction_id, ts, state_vector) and is followed
+        # by a _StateIndexBlock (None until it is read from the index file).
+        self.snapshots = []
+        self.blocks = []
+        self._snapshot_ids = array.array('l')
+        self._snapshot_ts = array.array('d')
+
+        # The index file and the (offset, length) of each block in it.
+        self._file_name = None
+        self._block_spans = []
+
+        self._decoder = None
+        self._touched = []
+        self._status_slot = None
+        self._position = 0
+        self._prev_vector = None
+        self._tx_count = 0
+        self._rx_count = 0
+
+        # The ID and timestamp of the last recorded transaction.
+        self.last_transaction_id = None
+        self.last_ts = None
+
+    def attach(self, decoder):
+        """Starts tracking the registers that the decoder's handlers change."""
+        slots = dict([(addr, slot) for slot, addr in enumerate(self.registers)])
+        fifo_slots = (slots[decoder.REGISTER_LOOKUP['FIFO_STATUS']],
+                      slots[decoder.REGISTER_LOOKUP['STATUS']])
+
+        dispatch = decoder._dispatch
+        for cmd, cmd_props in enumerate(dispatch):
+            if (cmd_props is None):
+                continue
+            func, cmd_name, packed_index = cmd_props[:3]
+            if (cmd_name in ('R_REGISTER', 'W_REGISTER')):
+                if (packed_index not in slots):
+                    continue
+                touched_slots = (slots[packed_index],)
+            elif (cmd_name in self.FIFO_COMMANDS):
+                touched_slots = fifo_slots
             else:
-                mosi_data.append(mosi)
-                miso_data.append(miso)
+                continue
+            dispatch[cmd] = ((self._wrap_handler(func, touched_slots),) + cmd_props[1:])
 
-        if (cur_packet_id is not None):
-            decoder.update(start_ts,
-                           cur_packet_id,
-                           mosi_data,
-                           miso_data)
+        self._decoder = decoder
+        self._status_slot = slots[decoder.REGISTER_LOOKUP['STATUS']]
+        return decoder
 
-    return decoder
+    def _wrap_handler(self, func, touched_slots):
+        touched = self._touched
 
+        def tracked_handler(ts, transaction_id, mosi_data, miso_data, packed_index):
+            func(ts, transaction_id, mosi_data, miso_data, packed_index)
+            touched.extend(touched_slots)
 
-if ("__main__" == __name__):
-    """Parses the SPI trace of a Saleae logic analyzer and creates a version of the
-    trace that contains human-readable names and/or creates micro-esb init code.
+        return tracked_handler
 
-    USAGE:    python nrf24l01p-decode.py -i in.txt -o out.txt -u uesb.txt
-    OPTIONS:
-        -i    [required]    Specify the path of the input file to use
-        -o    [optional]    Specify the path of the human-readable output file to create
-        -u    [optional]    Specify the path of the micro-esb init code file to create
+    def record(self, decoder, ts, transaction_id):
+        """Records the state of the decoder. Expected to be called after each
+        call to Decode.update.
 
-    """
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input_file', dest='input_file_name')
-    parser.add_argument('-o', '--output_file', dest='output_file_name')
-    parser.add_argument('-u', '--uesb_config_file', dest='uesb_file')
-    args = parser.parse_args()
-    if (args.input_file_name is None):
-        sys.stderr.write('ERROR: No input file specified\r\n')
-        sys.exit(-1)
+        """
+        position = self._position
+        self._position += 1
+        self.last_transaction_id = transaction_id
+        self.last_ts = ts
+
+        touched = self._touched
+        if (0 == (position % self.interval)):
+            if (decoder is not self._decoder):
+                raise DecodeError('ERROR: The decoder is not attached to the state index')
+            vector = _read_state_vector(decoder, self.registers)
+            self.snapshots.append((transaction_id, ts, vector))
+            self.blocks.append(_StateIndexBlock())
+            self._snapshot_ids.append(transaction_id)
+            self._snapshot_ts.append(ts)
+
+            self._prev_vector = list(vector)
+            self._tx_count = decoder.tx_count
+            self._rx_count = decoder.rx_count
+            del touched[:]
+            return
 
-    decoder = parse_file(args.input_file_name)
+        block = self.blocks[-1]
+        if (decoder.tx_count != self._tx_count):
+            self._tx_count = decoder.tx_count
+            block.tx_ids.append(transaction_id)
+            block.tx_ts.append(ts)
+        elif (decoder.rx_count != self._rx_count):
+            self._rx_count = decoder.rx_count
+            block.rx_ids.append(transaction_id)
+            block.rx_ts.append(ts)
+
+        prev_vector = self._prev_vector
+        count = len(self.registers)
+        changes = []
+
+        # The STATUS byte is shifted out with every command.
+        status_slot = self._status_slot
+        if (decoder._status_reg[0] != prev_vector[status_slot][0]):
+            touched.append(status_slot)
+
+        if (touched):
+            reg_values = decoder.reg_values
+            registers = self.registers
+            for slot in touched:
+                val = tuple(reg_values[registers[slot]])
+                if (val != prev_vector[slot]):
+                    prev_vector[slot] = val
+                    changes.append((slot, val))
+            del touched[:]
+
+        if (len(decoder.used_channels) != len(prev_vector[count + 2])):
+            prev_vector[count + 2] = tuple(decoder.used_channels)
+            changes.append((count + 2, prev_vector[count + 2]))
+        for slot, val in (((count + 4), decoder._beken_bank_switch_active),
+                          ((count + 5), decoder.beken_detected)):
+            if (val != prev_vector[slot]):
+                prev_vector[slot] = val
+                changes.append((slot, val))
+
+        if (changes):
+            block.deltas.append((transaction_id, ts, tuple(changes)))
+
+    def _get_block(self, i):
+        block = self.blocks[i]
+        if (block is None):
+            offset, length = self._block_spans[i]
+            with open(self._file_name, 'rb') as in_file:
+                in_file.seek(offset)
+                block = _StateIndexBlock.from_json(in_file.read(length))
+            self.blocks[i] = block
+        return block
+
+    def state_at(self, transaction_id=None, ts=None):
+        """Returns a Decode object with the state that the decoder had after
+        the last transaction with an ID (or a timestamp) that is less than or
+        equal to the given value. Its getters can be used to inspect the
+        configuration of the radio at that point. A value past the last
+        recorded transaction is an error.
 
-    if (args.output_file_name is not None):
-        with open(args.output_file_name, 'wb') as out_file:
-            out_file.write('nRF24L01 SPI Decoder v' + str(VERSION[0]) + os.linesep)
-            out_file.write(datetime.datetime.now().strftime('%c') + os.linesep)
-            out_file.write("Input file: '" +
-                           os.path.basename(args.input_file_name) +
-                           "'" + os.linesep)
-            out_file.write('-' * 80 + os.linesep)
-            out_file.write('{:<25s} {:s}{:s}'.format('Packet format:',
-                                                     decoder.get_packet_format(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:s}{:s}'.format('Data rate:',
-                                                     decoder.get_data_rate(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:s}{:s}'.format('CRC width:',
-                                                     decoder.get_CRC_mode(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:d}{:s}'.format('Address width:',
-                                                     decoder.get_address_width(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {}{:s}'.format('Possible channels:',
-                                                   decoder.get_used_channels(),
-                                                   os.linesep))
-            out_file.write('{:<25s} {:s}{:s}'.format('Output power:',
-                                                     decoder.get_output_power(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:d}{:s}'.format('Auto retransmit count:',
-                                                     decoder.get_auto_retransmit_count(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:d}{:s}'.format('Auto retransmit delay:',
-                                                     decoder.get_auto_retransmit_delay(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:d}{:s}'.format('Packets sent:',
-                                                     decoder.get_tx_count(),
-                                                     os.linesep))
-            out_file.write('{:<25s} {:d}{:s}'.format('Packets received:',
-                                                     decoder.get_rx_count(),
-                                                     os.linesep))
-            out_file.write('-' * 80 + os.linesep)
-            out_file.write(decoder.__repr__())
+        """
+        if ((transaction_id is None) == (ts is None)):
+            raise DecodeError('ERROR: Either a transaction ID or a timestamp is required')
+
+        if ((transaction_id is not None) and (self.last_transaction_id is not None) and
+                (transaction_id > self.last_transaction_id)):
+            raise DecodeError('ERROR: Transaction ID %d is past the last transaction: %d' %
+                              (transaction_id, self.last_transaction_id))
+        if ((ts is not None) and (self.last_ts is not None) and (ts > self.last_ts)):
+            raise DecodeError('ERROR: Time %s is past the last transaction: %s' %
+                              (ts, self.last_ts))
+
+        if (transaction_id is not None):
+            i = bisect.bisect_right(self._snapshot_ids, transaction_id)
+            key = 0
+            value = transaction_id
+        else:
+            i = bisect.bisect_right(self._snapshot_ts, ts)
+            key = 1
+            value = ts
+        if (0 == i):
+            raise DecodeError('ERROR: No state is recorded before %s' % value)
+
+        vector = list(self.snapshots[i - 1][2])
+        block = self._get_block(i - 1)
+
+        # Apply the deltas that follow the snapshot until the value is passed.
+        for delta in block.deltas:
+            if (delta[key] > value):
+                break
+            for slot, val in delta[2]:
+                vector[slot] = val
+
+        # Count the payloads up to the value and restore their timestamps.
+        count = len(self.registers)
+        timestamps = dict([tuple(item) for item in vector[count + 3]])
+        for slot, cmd_name, ids, stamps in ((count, 'W_TX_PAYLOAD', block.tx_ids, block.tx_ts),
+                                            ((count + 1), 'R_RX_PAYLOAD',
+                                             block.rx_ids, block.rx_ts)):
+            j = bisect.bisect_right(stamps if key else ids, value)
+            if (j):
+                vector[slot] += j
+                timestamps[cmd_name] = stamps[j - 1]
+        vector[count + 3] = sorted(timestamps.iteritems())
+
+        decoder = Decode()
+        decoder.set_state(_state_vector_to_dict(vector, self.registers))
+        return decoder
+
+    def save(self, file_name):
+        """Writes the index to a file. The first line is a JSON object with
+        the snapshots and the offset and length of each block, and each block
+        follows on its own line.
+
+        """
+        texts = [(self._get_block(i).to_json() + '\n') for i in range(len(self.blocks))]
+        snapshots = []
+        offset = 0
+        for (transaction_id, ts, vector), text in zip(self.snapshots, texts):
+            snapshots.append((transaction_id, ts, vector, offset, len(text)))
+            offset += len(text)
+
+        with open(file_name, 'wb') as out_file:
+            json.dump({'version': STATE_INDEX_VERSION,
+                       'interval': self.interval,
+                       'registers': self.registers,
+                       'snapshots': snapshots,
+                       'last_transaction_id': self.last_transaction_id,
+                       'last_ts': self.last_ts},
+                      out_file,
+                      separators=(',', ':'))
+            out_file.write('\n')
+            for text in texts:
+                out_file.write(text)
+
+    @classmethod
+    def load(cls, file_name):
+        """Reads the first line of an index that was written by save. The
+        blocks are read when a query needs them.
+
+        """
+        with open(file_name, 'rb') as in_file:
+            try:
+                data = json.loads(in_file.readline())
+            except ValueError:
+                data = {}
+            data_offset = in_file.tell()
+
+        if (STATE_INDEX_VERSION != data.get('version')):
+            raise DecodeError('ERROR: Unsupported state index file: %s' % file_name)
+
+        index = cls(data['interval'])
+        index.registers = data['registers']
+        index._file_name = file_name
+        for transaction_id, ts, vector, offset, length in data['snapshots']:
+            index.snapshots.append((transaction_id, ts, vector))
+            index.blocks.append(None)
+            index._block_spans.append(((data_offset + offset), length))
+            index._snapshot_ids.append(transaction_id)
+            index._snapshot_ts.append(ts)
+        index.last_transaction_id = data['last_transaction_id']
+        index.last_ts = data['last_ts']
+        return index
+
+
+class SeekIndex(object):
+    """Records the byte offset of the first line of every interval-th
+    transaction in an input file, along with its ID, its timestamp, and the
+    state of the decoder before it. Decoding can then start at the last entry
+    before a transaction ID or a time instead of at the beginning of the file,
+    and the result is the same as if the whole file had been decoded up to
+    that point.
+
+    Transaction IDs and timestamps are expected to increase throughout the
+    input file.
+
+    """
+
+    def __init__(self, interval=SEEK_INDEX_INTERVAL):
+        self.interval = interval
+        self.registers = sorted(Decode.REGISTERS)
+        self.file_size = None
+        self.file_mtime = None
+
+        # Each entry is (offset, transaction_id, ts, state_vector).
+        self.entries = []
+        self._entry_ids = array.array('l')
+        self._entry_ts = array.array('d')
+
+    def _append(self, offset, transaction_id, ts, vector):
+        self.entries.append((offset, transaction_id, ts, vector))
+        self._entry_ids.append(transaction_id)
+        self._entry_ts.append(ts)
+
+    @classmethod
+    def build(cls, file_name, interval=SEEK_INDEX_INTERVAL):
+        """Returns a new index for the input file. The file is read twice:
+        once to find the offsets and once to decode the state (only the
+        state that SummaryDecode keeps is needed).
+
+        """
+        _check_uncompressed(file_name)
+        index = cls(interval)
+        st = os.stat(file_name)
+        index.file_size = st.st_size
+        index.file_mtime = st.st_mtime
+
+        offsets = []
+        with open(file_name, 'rb') as in_file:
+            for i, (offset, transaction_id, ts) in enumerate(_iter_transaction_starts(in_file)):
+                if (0 == (i % interval)):
+                    offsets.append((offset, transaction_id, ts))
+        if (not offsets):
+            return index
+
+        decoder = SummaryDecode()
+        update = decoder.update
+        entry_iter = iter(offsets)
+        offset, next_id, next_ts = next(entry_iter)
+        with open(file_name, 'rb') as in_file:
+            transactions = _iter_file_transactions(in_file,
+                                                   skip_cmds=SummaryDecode.get_counted_cmds())
+            for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+                if ((next_id is not None) and (packet_id >= next_id)):
+                    index._append(offset, next_id, next_ts,
+                                  _read_state_vector(decoder, index.registers))
+                    offset, next_id, next_ts = next(entry_iter, (None, None, None))
+                update(ts, packet_id, mosi_data, miso_data, end_ts)
+
+        return index
+
+    def is_current(self, file_name):
+        """Returns True if the input file hasn't changed since the index was
+        built.
+
+        """
+        st = os.stat(file_name)
+        return ((st.st_size == self.file_size) and (st.st_mtime == self.file_mtime))
+
+    def find(self, transaction_id=None, ts=None):
+        """Returns (offset, state) for the last entry with an ID (or a
+        timestamp) that is less than or equal to the given value, or for the
+        first entry if there isn't one. The state is a dict that
+        Decode.set_state accepts.
+
+        """
+        if ((transaction_id is None) == (ts is None)):
+            raise DecodeError('ERROR: Either a transaction ID or a timestamp is required')
+        if (not self.entries):
+            raise DecodeError('ERROR: The seek index is empty')
+
+        if (transaction_id is not None):
+            i = bisect.bisect_right(self._entry_ids, transaction_id)
+        else:
+            i = bisect.bisect_right(self._entry_ts, ts)
+
+        offset, entry_id, entry_ts, vector = self.entries[max(0, (i - 1))]
+        return (offset, _state_vector_to_dict(vector, self.registers))
+
+    def iter_transactions(self, file_name, decoder, transaction_id=None, ts=None,
+                          skip_cmds=None):
+        """Restores the decoder's state from the last entry before the given
+        transaction ID and/or timestamp (the later of the two is used) and
+        yields the transactions of the input file from that entry on. See
+        _iter_transactions for skip_cmds.
+
+        """
+        offset, state = 0, None
+        for key, value in (('transaction_id', transaction_id), ('ts', ts)):
+            if (value is not None):
+                entry = self.find(**{key: value})
+                if (entry[0] >= offset):
+                    offset, state = entry
+
+        if (state is None):
+            with open(file_name, 'rb') as in_file:
+                for transaction in _iter_file_transactions(in_file, skip_cmds=skip_cmds):
+                    yield transaction
+            return
+
+        decoder.set_state(state)
+        layout = ColumnLayout.from_file(file_name)
+        with open(file_name, 'rb') as in_file:
+            section = _FileSection(in_file, offset, os.fstat(in_file.fileno()).st_size)
+            for transaction in _iter_file_transactions(section, header=False,
+                                                       skip_cmds=skip_cmds, layout=layout):
+                yield transaction
+
+    def save(self, file_name):
+        """Writes the index to a JSON file."""
+        with open(file_name, 'wb') as out_file:
+            json.dump({'version': SEEK_INDEX_VERSION,
+                       'interval': self.interval,
+                       'registers': self.registers,
+                       'file_size': self.file_size,
+                       'file_mtime': self.file_mtime,
+                       'entries': self.entries},
+                      out_file,
+                      separators=(',', ':'))
+
+    @classmethod
+    def load(cls, file_name):
+        """Reads an index that was written by save."""
+        with open(file_name, 'rb') as in_file:
+            data = json.load(in_file)
+
+        if (SEEK_INDEX_VERSION != data.get('version')):
+            raise DecodeError('ERROR: Unsupported seek index file: %s' % file_name)
+
+        index = cls(data['interval'])
+        index.registers = data['registers']
+        index.file_size = data['file_size']
+        index.file_mtime = data['file_mtime']
+        for offset, transaction_id, ts, vector in data['entries']:
+            index._append(offset, transaction_id, ts, vector)
+        return index
+
+    @classmethod
+    def load_or_build(cls, input_file_name, file_name=None, interval=SEEK_INDEX_INTERVAL):
+        """Loads the index of the input file from file_name (or from the
+        sidecar file next to it). It is built and saved first if the file
+        doesn't exist or if the input file has changed since.
+
+        """
+        if (file_name is None):
+            file_name = (input_file_name + SEEK_INDEX_SUFFIX)
+
+        if (os.path.exists(file_name)):
+            index = cls.load(file_name)
+            if (index.is_current(input_file_name)):
+                return index
+
+        index = cls.build(input_file_name, interval)
+        index.save(file_name)
+        return index
+
+
+class Checkpoint(object):
+    """The complete state of the decode of an input file that is still being
+    appended to: the state of the decoder before the last transaction that was
+    decoded, the offset of that transaction's first line in the input file, its
+    Packet ID, and the size of the output file before it was written. The last
+    transaction may not have been complete yet, so it is decoded again (and
+    its output rewritten) when the decode is resumed. The header line of the
+    input file is stored as well to detect when the file has been replaced.
+
+    """
+
+    def __init__(self, header=None):
+        self.registers = sorted(Decode.REGISTERS)
+        self.header = header
+        self.input_offset = None
+        self.packet_id = None
+        self.output_size = None
+        self.vector = None
+
+    def record(self, decoder, input_offset, packet_id, output_size):
+        """Records the decoder's state before the transaction that starts at
+        input_offset.
+
+        """
+        self.input_offset = input_offset
+        self.packet_id = packet_id
+        self.output_size = output_size
+        self.vector = _read_state_vector(decoder, self.registers)
+
+    def restore(self, decoder):
+        decoder.set_state(_state_vector_to_dict(self.vector, self.registers))
+
+    def verify(self, in_file, layout, output_size):
+        """Raises a DecodeError if the input file has a different header, if
+        the transaction that was recorded doesn't start at input_offset
+        anymore, or if the output file (of output_size bytes) has been
+        truncated.
+
+        """
+        in_file.seek(0)
+        if (in_file.readline() != self.header):
+            raise DecodeError('ERROR: The input file does not match the checkpoint')
+
+        if (self.packet_id is not None):
+            in_file.seek(self.input_offset)
+            fields = in_file.readline().split(COL_SEPARATOR)
+            if ((len(fields) <= layout.packet_id_col) or
+                    (_parse_num(fields[layout.packet_id_col]) != self.packet_id)):
+                raise DecodeError('ERROR: The input file does not match the checkpoint')
+
+        if (output_size < self.output_size):
+            raise DecodeError('ERROR: The output file does not match the checkpoint')
+
+    def save(self, file_name):
+        """Writes the checkpoint to a JSON file. The file is replaced in one
+        step so that an interrupted save leaves the previous checkpoint.
+
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=(os.path.dirname(file_name) or '.'),
+                                        suffix='.tmp')
+        with os.fdopen(fd, 'wb') as out_file:
+            json.dump({'version': CHECKPOINT_VERSION,
+                       'registers': self.registers,
+                       'header': self.header,
+                       'input_offset': self.input_offset,
+                       'packet_id': self.packet_id,
+                       'output_size': self.output_size,
+                       'state': self.vector},
+                      out_file,
+                      separators=(',', ':'))
+        os.rename(tmp_path, file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        """Reads a checkpoint that was written by save."""
+        with open(file_name, 'rb') as in_file:
+            data = json.load(in_file)
+
+        if (CHECKPOINT_VERSION != data.get('version')):
+            raise DecodeError('ERROR: Unsupported checkpoint file: %s' % file_name)
+
+        checkpoint = cls(data['header'].encode('utf-8'))
+        checkpoint.registers = data['registers']
+        checkpoint.input_offset = data['input_offset']
+        checkpoint.packet_id = data['packet_id']
+        checkpoint.output_size = data['output_size']
+        checkpoint.vector = data['state']
+        return checkpoint
+
+
+class ColumnLayout(object):
+    """Describes which columns of an input file contain the timestamp, the
+    Packet ID, and the MOSI and MISO bytes, and how the bytes are formatted.
+    The columns are found by their names in the header line, so exports with
+    other column orders and extra columns can be decoded as they are:
+
+        Logic 1.x    Time [s],Packet ID,MOSI,MISO
+        Logic 2.x    name,type,start_time,duration,mosi,miso
+
+    A chip select column (CS, Device, or Channel) is recognized as well, for
+    captures of several radios that share a bus (see demux_file).
+
+    Logic 2.x doesn't export a Packet ID. Each transaction starts with an
+    'enable' row instead and only the 'result' rows contain bytes, so the
+    transactions are numbered from 0 and the number is appended to the fields
+    of each 'result' row.
+
+    """
+
+    COLUMN_NAMES = (('ts', 'Time [s]', ('time [s]', 'start_time', 'time')),
+                    ('packet_id', 'Packet ID', ('packet id', 'packet_id')),
+                    ('mosi', 'MOSI', ('mosi',)),
+                    ('miso', 'MISO', ('miso',)),
+                    ('type', 'type', ('type',)),
+                    ('device', 'CS', ('cs', 'chip select', 'chip_select', 'device', 'channel')))
+
+    def __init__(self, col_count=4, ts_col=0, packet_id_col=1, mosi_col=2, miso_col=3,
+                 type_col=None, device_col=None):
+        self.col_count = col_count
+        self.ts_col = ts_col
+        self.packet_id_col = packet_id_col
+        self.mosi_col = mosi_col
+        self.miso_col = miso_col
+        self.type_col = type_col
+
+        # The chip select (or device) column of captures with several radios.
+        # It is only used by demux_file.
+        self.device_col = device_col
+
+        # The base that the bytes are converted with (16, 10, or 2). It is
+        # sniffed from the first row that contains a byte.
+        self.value_base = None
+
+    @property
+    def has_packet_ids(self):
+        """True if the Packet IDs are read from the input file instead of
+        being numbered.
+
+        """
+        return (self.type_col is None)
+
+    @classmethod
+    def from_header(cls, line):
+        names = [s.strip().strip('"').strip().lower() for s in line.split(COL_SEPARATOR)]
+        cols = {}
+        for key, display_name, aliases in cls.COLUMN_NAMES:
+            for i, name in enumerate(names):
+                if (name in aliases):
+                    cols[key] = i
+                    break
+
+        for key, display_name, aliases in cls.COLUMN_NAMES[:4]:
+            if ((not key in cols) and ((key != 'packet_id') or (not 'type' in cols))):
+                raise DecodeError('ERROR: Missing column: %s' % display_name)
+
+        if (cols.has_key('packet_id')):
+            return cls(len(names), cols['ts'], cols['packet_id'], cols['mosi'], cols['miso'],
+                       device_col=cols.get('device'))
+        return cls(len(names), cols['ts'], len(names), cols['mosi'], cols['miso'],
+                   cols['type'], cols.get('device'))
+
+    @classmethod
+    def from_file(cls, file_name):
+        """Reads the layout from the header of an input file and sniffs the
+        format of the bytes.
+
+        """
+        with _open_input_file(file_name, False) as in_file:
+            layout = cls.from_header(in_file.readline())
+            for fields in layout.iter_rows(in_file):
+                if (layout.sniff(fields)):
+                    break
+        return layout
+
+    def iter_rows(self, lines):
+        """Yields the fields of each line. For layouts without a Packet ID only
+        the 'result' rows are yielded and the number of the transaction is
+        appended to them.
+
+        """
+        if (self.has_packet_ids):
+            for line in lines:
+                yield line.split(COL_SEPARATOR)
+            return
+
+        type_col = self.type_col
+        packet_id = 0
+        packet_id_str = '0'
+        has_result = False
+        for line in lines:
+            fields = line.split(COL_SEPARATOR)
+            if (len(fields) <= type_col):
+                continue
+            row_type = fields[type_col].strip().strip('"')
+            if ('result' == row_type):
+                has_result = True
+                fields.append(packet_id_str)
+                yield fields
+            elif (('enable' == row_type) and has_result):
+                packet_id += 1
+                packet_id_str = str(packet_id)
+                has_result = False
+
+    def sniff(self, fields):
+        """Sets value_base from the MOSI field of a row. Returns False if the
+        row doesn't contain a byte.
+
+        """
+        if (len(fields) <= self.mosi_col):
+            return False
+        value = fields[self.mosi_col].strip().lower()
+        if (not value):
+            return False
+
+        if (value.startswith('0x')):
+            self.value_base = 16
+        elif (value.startswith('0b')):
+            self.value_base = 2
+        elif (value.isdigit()):
+            self.value_base = 10
+        else:
+            self.value_base = 16
+        return True
+
+    def parse_fields(self, fields):
+        """Converts the fields of a row that couldn't be converted with the
+        sniffed formats. Any format that _parse_num accepts is allowed.
+        Returns (ts, packet_id, mosi, miso). The packet_id is None if the row
+        doesn't have one.
+
+        """
+        if (len(fields) <= max(self.ts_col, self.packet_id_col, self.mosi_col, self.miso_col)):
+            return (None, None, None, None)
+        return (_parse_num(fields[self.ts_col]),
+                _parse_num(fields[self.packet_id_col]),
+                _parse_num(fields[self.mosi_col]),
+                _parse_num(fields[self.miso_col]))
+
+
+def _read_layout(in_file, header, layout):
+    """Returns the ColumnLayout of an input file whose first row is next.
+    The header line is read if header is True. Otherwise the layout that is
+    passed in is used (or the Logic 1.x layout if it is None).
+
+    """
+    if (header):
+        return ColumnLayout.from_header(in_file.readline())
+    if (layout is None):
+        return ColumnLayout()
+    return layout
+
+
+def _parse_num(s):
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return int(s, 16)
+        except ValueError:
+            try:
+                return float(s)
+            except ValueError:
+                return None
+
+
+def _iter_transactions(in_file, header=True, skip_cmds=None, layout=None):
+    """Yields (ts, packet_id, mosi_data, miso_data, end_ts) tuples from an open
+    input file. All lines that contain the same Packet ID are combined into a
+    single transaction. The timestamp of its first line is used as ts and the
+    timestamp of its last line as end_ts. The header line is expected to be
+    the first line unless header is False, in which case the ColumnLayout of
+    the file should be passed in.
+
+    Each column is converted with the format that is sniffed from the first
+    row. Only rows that don't match it are converted with _parse_num.
+
+    If skip_cmds (a sequence of 256 bools) is given then the data bytes of
+    transactions whose command byte is set in it don't have to be converted.
+    Only their number is preserved and they may be returned as zeros.
+
+    """
+    layout = _read_layout(in_file, header, layout)
+
+    rows = layout.iter_rows(in_file)
+    if (layout.value_base is None):
+        sniffed_rows = []
+        for fields in rows:
+            sniffed_rows.append(fields)
+            if (layout.sniff(fields)):
+                break
+        rows = itertools.chain(sniffed_rows, rows)
+
+    ts_col = layout.ts_col
+    packet_id_col = layout.packet_id_col
+    mosi_col = layout.mosi_col
+    miso_col = layout.miso_col
+    value_base = layout.value_base
+    parse_fields = layout.parse_fields
+
+    start_ts = None
+    end_ts = None
+    cur_packet_id = None
+    mosi_data = []
+    miso_data = []
+    skip = False
+    skipped_end_ts = None
+    for fields in rows:
+        if (skip):
+            # Only the Packet ID is converted. The timestamp is converted
+            # when the transaction ends.
+            try:
+                packet_id = int(fields[packet_id_col])
+            except (ValueError, IndexError):
+                packet_id = parse_fields(fields)[1]
+            if (packet_id == cur_packet_id):
+                mosi_data.append(0)
+                miso_data.append(0)
+                skipped_end_ts = fields[ts_col]
+                continue
+
+        try:
+            packet_id = int(fields[packet_id_col])
+            ts = float(fields[ts_col])
+            mosi = int(fields[mosi_col], value_base)
+            miso = int(fields[miso_col], value_base)
+        except (ValueError, TypeError, IndexError):
+            ts, packet_id, mosi, miso = parse_fields(fields)
+
+        if (packet_id is None):
+            continue
+
+        if (packet_id != cur_packet_id):
+            if (cur_packet_id is not None):
+                if (skipped_end_ts is not None):
+                    end_ts = _parse_num(skipped_end_ts)
+                yield (start_ts, cur_packet_id, mosi_data, miso_data, end_ts)
+
+            start_ts = ts
+            cur_packet_id = packet_id
+            mosi_data = [mosi]
+            miso_data = [miso]
+            skip = ((skip_cmds is not None) and (mosi is not None) and skip_cmds[mosi])
+            skipped_end_ts = None
+        else:
+            mosi_data.append(mosi)
+            miso_data.append(miso)
+        end_ts = ts
+
+    if (cur_packet_id is not None):
+        if (skipped_end_ts is not None):
+            end_ts = _parse_num(skipped_end_ts)
+        yield (start_ts, cur_packet_id, mosi_data, miso_data, end_ts)
+
+
+def _parse_block(block, layout):
+    """Parses a block of complete input lines one line at a time. Returns the
+    columns as four lists. Lines without a Packet ID are skipped.
+
+    """
+    ts_col = layout.ts_col
+    packet_id_col = layout.packet_id_col
+    mosi_col = layout.mosi_col
+    miso_col = layout.miso_col
+    value_base = layout.value_base
+
+    ts = []
+    packet_ids = []
+    mosi = []
+    miso = []
+    for fields in layout.iter_rows(block.splitlines()):
+        try:
+            row = (float(fields[ts_col]),
+                   int(fields[packet_id_col]),
+                   int(fields[mosi_col], value_base),
+                   int(fields[miso_col], value_base))
+        except (ValueError, TypeError, IndexError):
+            row = layout.parse_fields(fields)
+            if (row[1] is None):
+                continue
+        ts.append(row[0])
+        packet_ids.append(row[1])
+        mosi.append(row[2])
+        miso.append(row[3])
+    return (ts, packet_ids, mosi, miso)
+
+
+def _parse_hex_column_numpy(buf, start, end, hex_digits):
+    # Only the '0xHH' form that the logic analyzer exports is handled here.
+    if (not numpy.all((end - start) == 4)):
+        return None
+    if (not numpy.all((buf[start] == ord('0')) & ((buf[start + 1] | 0x20) == ord('x')))):
+        return None
+    high = hex_digits[buf[start + 2]]
+    low = hex_digits[buf[start + 3]]
+    if ((0 != len(high)) and (max(high.max(), low.max()) > 0x0F)):
+        return None
+    return ((high.astype(numpy.int64) << 4) | low)
+
+
+def _parse_int_column_numpy(buf, start, end):
+    widths = (end - start)
+    if ((widths.min() < 1) or (widths.max() > 18)):
+        return None
+    result = numpy.zeros(len(start), dtype=numpy.int64)
+    for i in range(widths.max()):
+        valid = (widths > i)
+        digits = (buf[numpy.where(valid, (start + i), start)].astype(numpy.int64) - ord('0'))
+        if (numpy.any(valid & ((digits < 0) | (digits > 9)))):
+            return None
+        result = numpy.where(valid, ((result * 10) + digits), result)
+    return result
+
+
+def _parse_float_fields_numpy(buf, start, end):
+    # Only the bytes of the fields are copied (separated by commas) so that
+    # NumPy can convert them in one call.
+    widths = (end - start)
+    if ((0 == len(widths)) or (widths.min() < 1)):
+        return None
+    text_starts = (numpy.cumsum(widths + 1) - (widths + 1))
+    offsets = (numpy.arange(widths.sum()) - numpy.repeat((numpy.cumsum(widths) - widths), widths))
+    text = numpy.full((text_starts[-1] + widths[-1] + 1), ord(COL_SEPARATOR), dtype=numpy.uint8)
+    text[numpy.repeat(text_starts, widths) + offsets] = buf[numpy.repeat(start, widths) + offsets]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        result = numpy.fromstring(text.tobytes(), sep=COL_SEPARATOR)
+    if (len(result) != len(start)):
+        return None
+    return result
+
+
+def _parse_block_numpy(block, hex_digits, layout, skip_cmds=None):
+    """Parses a block of complete input lines, each of which must end with a
+    newline. Returns the columns as four NumPy arrays or None if the block does
+    not match the ColumnLayout (which must have Packet IDs) or the bytes are
+    not in the '0xHH' form.
+
+    Only the timestamps of the first and last line of each transaction are
+    converted (the others are NaN). If skip_cmds (a boolean array with 256
+    entries) is given then the data bytes of the transactions whose command
+    byte is set in it are returned as zeros. The first transaction in the
+    block is always converted because it may be the continuation of a
+    transaction from the previous block.
+
+    """
+    buf = numpy.frombuffer(block, dtype=numpy.uint8)
+    seps = numpy.flatnonzero((buf == ord(COL_SEPARATOR)) | (buf == ord('\n')))
+    if (0 != (len(seps) % layout.col_count)):
+        return None
+
+    seps = seps.reshape(-1, layout.col_count)
+    if (not (numpy.all(buf[seps[:, :-1]] == ord(COL_SEPARATOR)) and
+             numpy.all(buf[seps[:, -1]] == ord('\n')))):
+        return None
+
+    # Each field starts after the preceding separator (or at the start of the
+    # line) and ends at the following one (or before the line ending).
+    line_starts = numpy.concatenate(([0], (seps[:-1, -1] + 1)))
+    line_ends = (seps[:, -1] - (buf[seps[:, -1] - 1] == ord('\r')))
+    cols = (layout.ts_col, layout.packet_id_col, layout.mosi_col, layout.miso_col)
+    starts = [(line_starts if (0 == col) else (seps[:, (col - 1)] + 1)) for col in cols]
+    ends = [(line_ends if ((layout.col_count - 1) == col) else seps[:, col]) for col in cols]
+
+    # Lines without a Packet ID are skipped.
+    has_packet_id = (ends[1] > starts[1])
+    if (not numpy.all(has_packet_id)):
+        starts = [start[has_packet_id] for start in starts]
+        ends = [end[has_packet_id] for end in ends]
+        if (0 == len(starts[1])):
+            return ([], [], [], [])
+
+    ts_starts, packet_id_starts, mosi_starts, miso_starts = starts
+    ts_ends, packet_id_ends, mosi_ends, miso_ends = ends
+
+    packet_ids = _parse_int_column_numpy(buf, packet_id_starts, packet_id_ends)
+    if (packet_ids is None):
+        return None
+
+    run_starts = numpy.concatenate(([0], (numpy.flatnonzero(packet_ids[1:] !=
+                                                            packet_ids[:-1]) + 1)))
+    run_lens = numpy.diff(numpy.append(run_starts, len(packet_ids)))
+
+    ts = numpy.full(len(packet_ids), numpy.nan)
+    rows = numpy.zeros(len(packet_ids), dtype=bool)
+    rows[run_starts] = True
+    rows[run_starts + run_lens - 1] = True
+    rows = numpy.flatnonzero(rows)
+    ts_rows = _parse_float_fields_numpy(buf, ts_starts[rows], ts_ends[rows])
+    if (ts_rows is None):
+        return None
+    ts[rows] = ts_rows
+
+    if (skip_cmds is None):
+        mosi = _parse_hex_column_numpy(buf, mosi_starts, mosi_ends, hex_digits)
+        miso = _parse_hex_column_numpy(buf, miso_starts, miso_ends, hex_digits)
+        if ((mosi is None) or (miso is None)):
+            return None
+        return (ts, packet_ids, mosi, miso)
+
+    cmds = _parse_hex_column_numpy(buf, mosi_starts[run_starts], mosi_ends[run_starts],
+                                   hex_digits)
+    if (cmds is None):
+        return None
+    converted = ~skip_cmds[cmds]
+    converted[0] = True
+    rows = numpy.repeat(converted, run_lens)
+    rows[run_starts] = True
+    rows = numpy.flatnonzero(rows)
+
+    mosi = numpy.zeros(len(packet_ids), dtype=numpy.int64)
+    miso = numpy.zeros(len(packet_ids), dtype=numpy.int64)
+    mosi_rows = _parse_hex_column_numpy(buf, mosi_starts[rows], mosi_ends[rows], hex_digits)
+    miso_rows = _parse_hex_column_numpy(buf, miso_starts[rows], miso_ends[rows], hex_digits)
+    if ((mosi_rows is None) or (miso_rows is None)):
+        return None
+    mosi[rows] = mosi_rows
+    miso[rows] = miso_rows
+    return (ts, packet_ids, mosi, miso)
+
+
+def _iter_transactions_numpy(in_file, header=True, block_size=NUMPY_BLOCK_SIZE,
+                             skip_cmds=None, layout=None):
+    """Works like _iter_transactions but reads the input file in large blocks
+    and uses NumPy to convert the columns and to find the Packet ID
+    boundaries. Blocks that can't be handled this way are parsed one line at a
+    time instead. The layout must have Packet IDs.
+
+    """
+    layout = _read_layout(in_file, header, layout)
+
+    if (skip_cmds is not None):
+        skip_cmds = numpy.array(skip_cmds, dtype=bool)
+
+    hex_digits = numpy.full(256, 0xFF, dtype=numpy.uint8)
+    for i, c in enumerate('0123456789ABCDEF'):
+        hex_digits[ord(c)] = i
+        hex_digits[ord(c.lower())] = i
+
+    start_ts = None
+    end_ts = None
+    cur_packet_id = None
+    mosi_data = []
+    miso_data = []
+    while (True):
+        block = in_file.read(block_size)
+        if (not block):
+            break
+        block += in_file.readline()
+        if (not block.endswith('\n')):
+            block += '\n'
+
+        if (layout.value_base is None):
+            for fields in layout.iter_rows(block.splitlines()):
+                if (layout.sniff(fields)):
+                    break
+
+        cols = _parse_block_numpy(block, hex_digits, layout, skip_cmds)
+        if (cols is None):
+            cols = _parse_block(block, layout)
+
+        packet_ids = numpy.asarray(cols[1])
+        if (0 == len(packet_ids)):
+            continue
+
+        # Each transaction is a run of lines that share the same Packet ID.
+        bounds = (numpy.flatnonzero(packet_ids[1:] != packet_ids[:-1]) + 1).tolist()
+        bounds = ([0] + bounds + [len(packet_ids)])
+
+        ts, packet_ids, mosi, miso = [(col.tolist() if isinstance(col, numpy.ndarray) else col)
+                                      for col in cols]
+        for i in range(len(bounds) - 1):
+            start, end = bounds[i], bounds[i + 1]
+
+            # The first transaction of a block may have started in the last one.
+            if (packet_ids[start] == cur_packet_id):
+                mosi_data.extend(mosi[start:end])
+                miso_data.extend(miso[start:end])
+                end_ts = ts[end - 1]
+                continue
+
+            if (cur_packet_id is not None):
+                yield (start_ts, cur_packet_id, mosi_data, miso_data, end_ts)
+
+            start_ts = ts[start]
+            end_ts = ts[end - 1]
+            cur_packet_id = packet_ids[start]
+            mosi_data = mosi[start:end]
+            miso_data = miso[start:end]
+
+    if (cur_packet_id is not None):
+        yield (start_ts, cur_packet_id, mosi_data, miso_data, end_ts)
+
+
+def _iter_file_transactions(in_file, header=True, skip_cmds=None, layout=None):
+    """Returns an iterator over the transactions in an open input file. NumPy
+    is used for parsing when it is available and the file has Packet IDs. See
+    _iter_transactions for the other arguments.
+
+    """
+    layout = _read_layout(in_file, header, layout)
+    if ((numpy is not None) and layout.has_packet_ids):
+        return _iter_transactions_numpy(in_file, False, skip_cmds=skip_cmds, layout=layout)
+    return _iter_transactions(in_file, False, skip_cmds, layout)
+
+
+def _get_compression(file_name):
+    """Returns the compression format of a file ('gzip', 'bz2', 'xz', or
+    'zstd') by its first bytes, or None if it isn't compressed.
+
+    """
+    with open(file_name, 'rb') as in_file:
+        magic = in_file.read(8)
+    for compression, prefix in COMPRESSION_MAGIC:
+        if (magic.startswith(prefix)):
+            return compression
+    return None
+
+
+def _strip_compression_suffix(file_name):
+    for suffix in COMPRESSION_SUFFIXES:
+        if (file_name.lower().endswith(suffix)):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+def _new_decompressor(compression):
+    """Returns an object with a decompress method for one compressed stream."""
+    if ('gzip' == compression):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if ('bz2' == compression):
+        return bz2.BZ2Decompressor()
+    if ('xz' == compression):
+        if (lzma is None):
+            raise DecodeError('ERROR: Reading xz compressed files requires backports.lzma ' +
+                              'or the xz command')
+        return lzma.LZMADecompressor()
+    if (zstandard is None):
+        raise DecodeError('ERROR: Reading zstd compressed files requires zstandard ' +
+                          'or the zstd command')
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _find_executable(name):
+    """Returns the path of a command on the PATH or None."""
+    for dir_name in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(dir_name, name)
+        if (os.path.isfile(path) and os.access(path, os.X_OK)):
+            return path
+    return None
+
+
+def _iter_decompressed(file_name, compression, read_size=DECOMPRESS_READ_SIZE):
+    """Yields the decompressed data of a compressed file in blocks. Files
+    that consist of several compressed streams (e.g. from pigz or pbzip2) are
+    decompressed one stream after the other.
+
+    """
+    decompressor = _new_decompressor(compression)
+    with open(file_name, 'rb') as raw_file:
+        while (True):
+            data = raw_file.read(read_size)
+            if (not data):
+                break
+            while (data):
+                try:
+                    block = decompressor.decompress(data)
+                except EOFError:
+                    # The previous stream ended at the end of the previous read.
+                    decompressor = _new_decompressor(compression)
+                    continue
+                if (block):
+                    yield block
+                data = getattr(decompressor, 'unused_data', '')
+                if (data):
+                    decompressor = _new_decompressor(compression)
+
+
+def _iter_command_output(command, read_size=DECOMPRESS_READ_SIZE):
+    """Yields the output of a command (e.g. 'gzip -dc FILE') in blocks. The
+    command is terminated if the generator is closed before it exits.
+
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    finished = False
+    try:
+        while (True):
+            data = process.stdout.read(read_size)
+            if (not data):
+                break
+            yield data
+        finished = True
+    finally:
+        process.stdout.close()
+        if ((not finished) and (process.poll() is None)):
+            process.terminate()
+        process.wait()
+
+    if (0 != process.returncode):
+        raise DecodeError('ERROR: %s exited with status %d' % (command[0], process.returncode))
+
+
+def _iter_in_thread(blocks, queue_size=DECOMPRESS_QUEUE_SIZE):
+    """Yields the same blocks as an iterator but reads them in a separate
+    thread that stays at most queue_size blocks ahead. Reading from a child
+    process and zlib's decompression release the GIL so they overlap with the
+    parser. The thread is stopped when the generator is closed.
+
+    """
+    queue = Queue.Queue(queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while (not stopped.is_set()):
+            try:
+                queue.put(item, True, FOLLOW_POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for block in blocks:
+                if (not put(block)):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    try:
+        while (True):
+            try:
+                block = queue.get(True, FOLLOW_POLL_INTERVAL)
+            except Queue.Empty:
+                continue
+            if (block is None):
+                break
+            if (isinstance(block, Exception)):
+                raise block
+            yield block
+    finally:
+        stopped.set()
+        thread.join()
+        if (hasattr(blocks, 'close')):
+            blocks.close()
+
+
+class _DecompressedFile(object):
+    """Reads the decompressed data of a compressed input file from an
+    iterator over its blocks. Only the methods of a file that the parsers use
+    are provided.
+
+    """
+
+    def __init__(self, blocks):
+        self._blocks = blocks
+        self._buffer = ''
+        self._offset = 0
+
+    def _fill(self):
+        """Appends the next decompressed block to the buffer. Returns False
+        at the end of the file.
+
+        """
+        block = next(self._blocks, None)
+        if (block is None):
+            return False
+        self._buffer = (self._buffer[self._offset:] + block)
+        self._offset = 0
+        return True
+
+    def read(self, size=-1):
+        while (((size < 0) or ((len(self._buffer) - self._offset) < size)) and self._fill()):
+            pass
+        end = len(self._buffer)
+        if (size >= 0):
+            end = min(end, (self._offset + size))
+        data = self._buffer[self._offset:end]
+        self._offset = end
+        return data
+
+    def readline(self):
+        while (True):
+            end = (self._buffer.find('\n', self._offset) + 1)
+            if (end > 0):
+                break
+            if (not self._fill()):
+                end = len(self._buffer)
+                break
+        line = self._buffer[self._offset:end]
+        self._offset = end
+        return line
+
+    def __iter__(self):
+        while (True):
+            # All of the complete lines in the buffer are split at once.
+            end = (self._buffer.rfind('\n', self._offset) + 1)
+            if (end > self._offset):
+                lines = self._buffer[self._offset:end].split('\n')
+                self._offset = end
+                for line in lines[:-1]:
+                    yield (line + '\n')
+            elif (not self._fill()):
+                line = self.read()
+                if (line):
+                    yield line
+                break
+
+    def close(self):
+        self._blocks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _open_input_file(file_name, threaded=None):
+    """Opens an input file for reading. A compressed file is decompressed
+    while it is read. If threaded is True (it defaults to DECOMPRESS_THREAD)
+    then the decompression runs in parallel with the parser. The command in
+    DECOMPRESS_COMMANDS is also used if the module for the compression is
+    missing.
+
+    """
+    compression = _get_compression(file_name)
+    if (compression is None):
+        return open(file_name, 'rb')
+    if (threaded is None):
+        threaded = DECOMPRESS_THREAD
+
+    error = None
+    try:
+        _new_decompressor(compression)
+    except DecodeError as e:
+        error = e
+
+    command = DECOMPRESS_COMMANDS[compression]
+    if ((threaded or (error is not None)) and (_find_executable(command[0]) is not None)):
+        blocks = _iter_command_output(command + (file_name,))
+    elif (error is not None):
+        raise error
+    else:
+        blocks = _iter_decompressed(file_name, compression)
+
+    if (threaded):
+        blocks = _iter_in_thread(blocks)
+    return _DecompressedFile(blocks)
+
+
+def _check_uncompressed(file_name):
+    """Raises a DecodeError if the input file is compressed. Byte offsets
+    can't be used in compressed files.
+
+    """
+    if (_get_compression(file_name) is not None):
+        raise DecodeError('ERROR: Byte offsets can not be used in a compressed ' +
+                          'input file: %s' % file_name)
+
+
+class LogicCapture(object):
+    """A capture of the raw logic samples of the CS, SCLK, MOSI, and MISO
+    signals (instead of the bytes that the SPI analyzer of the logic analyzer
+    exports). The transactions are decoded from the samples. These files can
+    be read:
+
+        sigrok session (.sr)    The samplerate, the sample size, and the
+                                channel names are read from its metadata
+        Raw binary              One little endian sample of sample_size bytes
+                                with a bit for each channel per sample period,
+                                e.g. from 'sigrok-cli -O binary'. The file is
+                                memory-mapped.
+
+    The channels are given as bit numbers (or as channel names for sigrok
+    sessions) in the order CS, SCLK, MOSI, MISO. The samplerate (in Hz) can be
+    a number or a str like '24 MHz'. The bus is expected to use SPI mode 0 (CS
+    active low, bits sampled on the rising edge of SCLK, MSB first) like the
+    nRF24L01+ does. Requires NumPy.
+
+    """
+
+    DEFAULT_CHANNELS = (0, 1, 2, 3)
+
+    SAMPLERATE_UNITS = {'': 1, 'k': 1000, 'm': 1000000, 'g': 1000000000}
+
+    def __init__(self, file_name, samplerate=None, channels=None, sample_size=1):
+        if (numpy is None):
+            raise DecodeError('ERROR: Decoding raw logic samples requires NumPy')
+
+        self.file_name = file_name
+        self.is_sigrok = file_name.lower().endswith('.sr')
+        self.sample_size = sample_size
+        self.samplerate = None
+        channel_names = []
+        self._data_files = []
+        if (self.is_sigrok):
+            samplerate, channel_names = self._read_sigrok_metadata(samplerate)
+
+        if (samplerate is None):
+            raise DecodeError('ERROR: The samplerate of the logic capture is unknown')
+        self.samplerate = self._parse_samplerate(samplerate)
+
+        if (channels is None):
+            channels = self.DEFAULT_CHANNELS
+        if (4 != len(channels)):
+            raise DecodeError('ERROR: Expected the CS, SCLK, MOSI and MISO channels')
+        self.channels = tuple([self._parse_channel(channel, channel_names)
+                               for channel in channels])
+
+    @classmethod
+    def _parse_samplerate(cls, value):
+        if (isinstance(value, (int, long, float))):
+            return float(value)
+        match = re.match(r'^\s*([0-9.eE+]+)\s*([kKmMgG]?)(hz)?\s*$', value, re.IGNORECASE)
+        if (match is None):
+            raise DecodeError('ERROR: Invalid samplerate: %s' % value)
+        try:
+            return (float(match.group(1)) * cls.SAMPLERATE_UNITS[match.group(2).lower()])
+        except ValueError:
+            raise DecodeError('ERROR: Invalid samplerate: %s' % value)
+
+    def _parse_channel(self, channel, channel_names):
+        channel = str(channel).strip()
+        if (channel in channel_names):
+            return channel_names.index(channel)
+        if (channel.isdigit() and (int(channel) < (self.sample_size * 8))):
+            return int(channel)
+        raise DecodeError('ERROR: Unknown channel: %s' % channel)
+
+    def _read_sigrok_metadata(self, samplerate):
+        """Reads the metadata of a sigrok session. Returns (samplerate,
+        channel_names). The samplerate that is passed in is used if it isn't
+        None.
+
+        """
+        with zipfile.ZipFile(self.file_name) as zip_file:
+            props = {}
+            for line in zip_file.read('metadata').splitlines():
+                if ('=' in line):
+                    key, value = line.split('=', 1)
+                    props[key.strip()] = value.strip()
+            names = zip_file.namelist()
+
+        capture_file = props.get('capturefile', 'logic-1')
+        chunks = [name for name in names if name.startswith(capture_file + '-')]
+        chunks.sort(key=(lambda name: int(name[(len(capture_file) + 1):])))
+        self._data_files = (chunks or [name for name in names if (name == capture_file)])
+        self.sample_size = int(props.get('unitsize', self.sample_size))
+
+        channel_names = [props.get('probe%d' % (i + 1)) for i in range(self.sample_size * 8)]
+        if (samplerate is None):
+            samplerate = props.get('samplerate')
+        return (samplerate, channel_names)
+
+    def iter_blocks(self, block_size=LOGIC_BLOCK_SIZE):
+        """Yields the samples as NumPy arrays of at most block_size samples."""
+        dtype = numpy.dtype('<u%d' % self.sample_size)
+        if (not self.is_sigrok):
+            sample_count = (os.path.getsize(self.file_name) // dtype.itemsize)
+            if (0 == sample_count):
+                return
+            samples = numpy.memmap(self.file_name, dtype=dtype, mode='r',
+                                   shape=(sample_count,))
+            for start in xrange(0, sample_count, block_size):
+                yield samples[start:(start + block_size)]
+            return
+
+        with zipfile.ZipFile(self.file_name) as zip_file:
+            for name in self._data_files:
+                with zip_file.open(name) as in_file:
+                    while (True):
+                        data = in_file.read(block_size * dtype.itemsize)
+                        if (not data):
+                            break
+                        yield numpy.frombuffer(data, dtype=dtype)
+
+    def iter_transactions(self, block_size=LOGIC_BLOCK_SIZE):
+        """Yields (ts, packet_id, mosi_data, miso_data, end_ts) tuples like
+        _iter_transactions does. See _iter_logic_transactions.
+
+        """
+        return _iter_logic_transactions(self.iter_blocks(block_size), self.samplerate,
+                                        self.channels)
+
+
+def _iter_logic_bytes(edges, segments, mosi_bits, miso_bits, samplerate):
+    """Packs the bits that were read on the clock edges of one or more
+    complete transactions into bytes. The edges are sample indexes and the
+    segments number the transactions. Yields (ts, mosi_data, miso_data,
+    end_ts) for each transaction that has at least one whole byte. The bits
+    after the last whole byte of a transaction are dropped.
+
+    """
+    if (0 == len(edges)):
+        return
+
+    starts = numpy.concatenate(([0], (numpy.flatnonzero(segments[1:] != segments[:-1]) + 1)))
+    counts = numpy.diff(numpy.append(starts, len(edges)))
+    byte_counts = (counts // 8)
+    positions = (numpy.arange(len(edges)) - numpy.repeat(starts, counts))
+    keep = (positions < numpy.repeat((byte_counts * 8), counts))
+
+    mosi = numpy.packbits(mosi_bits[keep]).tolist()
+    miso = numpy.packbits(miso_bits[keep]).tolist()
+    byte_ts = (edges[keep][::8] / float(samplerate)).tolist()
+
+    i = 0
+    for byte_count in byte_counts.tolist():
+        if (byte_count):
+            end = (i + byte_count)
+            yield (byte_ts[i], mosi[i:end], miso[i:end], byte_ts[end - 1])
+            i = end
+
+
+def _iter_logic_transactions(blocks, samplerate, channels):
+    """Yields (ts, packet_id, mosi_data, miso_data, end_ts) tuples for the SPI
+    transactions in blocks of raw logic samples (NumPy arrays with a bit for
+    each channel). The channels are the bit numbers of CS, SCLK, MOSI, and
+    MISO. A transaction lasts from a falling edge of CS to the next rising
+    edge and a bit of MOSI and MISO is read on each rising edge of SCLK in
+    between. The transactions are numbered from 0 and the time of a byte is
+    the time of its first clock edge. A transaction that is already in
+    progress at the start of the capture is skipped.
+
+    The edges of a whole block are found at once with NumPy. Only the bits of
+    the transaction that is still in progress at the end of a block are
+    carried over to the next one.
+
+    """
+    cs_mask, sclk_mask, mosi_mask, miso_mask = [(1 << channel) for channel in channels]
+
+    packet_id = 0
+    offset = 0
+    prev_cs_low = None
+    prev_sclk_high = None
+
+    # The edges and bits of the transaction in progress, or None if CS isn't
+    # asserted (or the start of the transaction wasn't captured).
+    carried = None
+
+    for block in blocks:
+        if (0 == len(block)):
+            continue
+
+        cs_low = ((block & cs_mask) == 0)
+        sclk_high = ((block & sclk_mask) != 0)
+        cs_starts = (numpy.flatnonzero(cs_low[1:] & ~cs_low[:-1]) + 1)
+        edges = (numpy.flatnonzero(sclk_high[1:] & ~sclk_high[:-1] & cs_low[1:]) + 1)
+        if (prev_cs_low is not None):
+            # Edges between the last sample of the previous block and the first one.
+            if (cs_low[0] and (not prev_cs_low)):
+                cs_starts = numpy.append(0, cs_starts)
+            if (cs_low[0] and sclk_high[0] and (not prev_sclk_high)):
+                edges = numpy.append(0, edges)
+
+        # Segment 0 is the transaction that was in progress at the start of
+        # the block and segment i the one that starts at cs_starts[i - 1].
+        segments = numpy.searchsorted(cs_starts, edges, side='right')
+        mosi_bits = ((block[edges] & mosi_mask) != 0)
+        miso_bits = ((block[edges] & miso_mask) != 0)
+        edges = (edges + offset)
+
+        if (carried is None):
+            first = numpy.searchsorted(segments, 1)
+            edges, segments, mosi_bits, miso_bits = [col[first:] for col in
+                                                     (edges, segments, mosi_bits, miso_bits)]
+        else:
+            edges = numpy.concatenate((carried[0], edges))
+            segments = numpy.concatenate((numpy.zeros(len(carried[0]), segments.dtype),
+                                          segments))
+            mosi_bits = numpy.concatenate((carried[1], mosi_bits))
+            miso_bits = numpy.concatenate((carried[2], miso_bits))
+
+        if (cs_low[-1] and (len(cs_starts) or (carried is not None))):
+            last = numpy.searchsorted(segments, len(cs_starts))
+            carried = (edges[last:], mosi_bits[last:], miso_bits[last:])
+            edges, segments, mosi_bits, miso_bits = [col[:last] for col in
+                                                     (edges, segments, mosi_bits, miso_bits)]
+        else:
+            carried = None
+
+        prev_cs_low = cs_low[-1]
+        prev_sclk_high = sclk_high[-1]
+        offset += len(block)
+
+        for ts, mosi_data, miso_data, end_ts in _iter_logic_bytes(edges, segments, mosi_bits,
+                                                                   miso_bits, samplerate):
+            yield (ts, packet_id, mosi_data, miso_data, end_ts)
+            packet_id += 1
+
+    # The capture ended before CS was deasserted.
+    if (carried is not None):
+        for ts, mosi_data, miso_data, end_ts in _iter_logic_bytes(
+                carried[0], numpy.zeros(len(carried[0]), numpy.int64), carried[1],
+                carried[2], samplerate):
+            yield (ts, packet_id, mosi_data, miso_data, end_ts)
+
+
+class TransactionCache(object):
+    """Stores the transactions parsed from input files in a compact binary
+    form so that the text doesn't have to be parsed again the next time the
+    same file is decoded. Each entry is keyed by the input file's size,
+    modification time, and a hash of its contents.
+
+    An entry consists of a header followed by blocks of up to
+    CACHE_BLOCK_SIZE transactions. Each block holds a (count, data_len) header
+    and the following arrays:
+        ts                [double] * count   Timestamps
+        end_ts            [double] * count   Timestamps of the last bytes
+        packet_ids        [long] * count     Packet IDs
+        lengths           [ushort] * count   Number of bytes in each transaction
+        mosi              [byte] * data_len  MOSI bytes of all transactions
+        miso              [byte] * data_len  MISO bytes of all transactions
+
+    The arrays are stored in the native byte order. Entries are read through
+    a memory map.
+
+    """
+
+    MAGIC = 'NRF24TXC'
+    HEADER = struct.Struct('<8sI')
+    BLOCK_HEADER = struct.Struct('<II')
+    EXTENSION = '.txc'
+
+    def __init__(self, cache_dir, max_size=CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _entry_path(self, file_name):
+        sha = hashlib.sha1()
+        with open(file_name, 'rb') as in_file:
+            while (True):
+                data = in_file.read(1 << 20)
+                if (not data):
+                    break
+                sha.update(data)
+
+        st = os.stat(file_name)
+        key = ('%d:%d:%r:%s:%s:%d:%d' % (CACHE_VERSION,
+                                         st.st_size,
+                                         st.st_mtime,
+                                         sha.hexdigest(),
+                                         sys.byteorder,
+                                         array.array('l').itemsize,
+                                         CACHE_BLOCK_SIZE))
+        return os.path.join(self.cache_dir,
+                            (hashlib.sha1(key).hexdigest() + self.EXTENSION))
+
+    def iter_transactions(self, file_name):
+        """Yields the transactions in the input file the same way that
+        _iter_file_transactions does. They are read from the cache if possible.
+        Otherwise the input file is parsed and a cache entry is created.
+
+        """
+        path = self._entry_path(file_name)
+        if (os.path.exists(path)):
+            # The modification time is used to find the least recently used entries.
+            os.utime(path, None)
+            for transaction in self._read(path):
+                yield transaction
+        else:
+            for transaction in self._parse_and_write(file_name, path):
+                yield transaction
+
+    def _read(self, path):
+        with open(path, 'rb') as in_file:
+            mm = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, version = self.HEADER.unpack_from(mm, 0)
+                if ((self.MAGIC != magic) or (CACHE_VERSION != version)):
+                    raise DecodeError('ERROR: Invalid cache file: %s' % path)
+
+                pos = self.HEADER.size
+                while (pos < len(mm)):
+                    count, data_len = self.BLOCK_HEADER.unpack_from(mm, pos)
+                    pos += self.BLOCK_HEADER.size
+
+                    ts = array.array('d')
+                    ts.fromstring(mm[pos:(pos + (count * ts.itemsize))])
+                    pos += (count * ts.itemsize)
+
+                    end_ts = array.array('d')
+                    end_ts.fromstring(mm[pos:(pos + (count * end_ts.itemsize))])
+                    pos += (count * end_ts.itemsize)
+
+                    packet_ids = array.array('l')
+                    packet_ids.fromstring(mm[pos:(pos + (count * packet_ids.itemsize))])
+                    pos += (count * packet_ids.itemsize)
+
+                    lengths = array.array('H')
+                    lengths.fromstring(mm[pos:(pos + (count * lengths.itemsize))])
+                    pos += (count * lengths.itemsize)
+
+                    mosi = list(bytearray(mm[pos:(pos + data_len)]))
+                    pos += data_len
+                    miso = list(bytearray(mm[pos:(pos + data_len)]))
+                    pos += data_len
+
+                    ts = ts.tolist()
+                    end_ts = end_ts.tolist()
+                    packet_ids = packet_ids.tolist()
+                    offset = 0
+                    for i in xrange(count):
+                        end = (offset + lengths[i])
+                        yield (ts[i], packet_ids[i], mosi[offset:end], miso[offset:end],
+                               end_ts[i])
+                        offset = end
+            finally:
+                mm.close()
+
+    def _write_block(self, out_file, block):
+        ts = array.array('d')
+        end_ts = array.array('d')
+        packet_ids = array.array('l')
+        lengths = array.array('H')
+        mosi = bytearray()
+        miso = bytearray()
+        for transaction in block:
+            ts.append(transaction[0])
+            end_ts.append(transaction[4])
+            packet_ids.append(transaction[1])
+            lengths.append(len(transaction[2]))
+            mosi.extend(transaction[2])
+            miso.extend(transaction[3])
+
+        out_file.write(self.BLOCK_HEADER.pack(len(block), len(mosi)))
+        out_file.write(ts.tostring())
+        out_file.write(end_ts.tostring())
+        out_file.write(packet_ids.tostring())
+        out_file.write(lengths.tostring())
+        out_file.write(mosi)
+        out_file.write(miso)
+
+    def _parse_and_write(self, file_name, path):
+        if (not os.path.isdir(self.cache_dir)):
+            os.makedirs(self.cache_dir)
+
+        # The entry is only moved into place once the whole file was parsed.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        out_file = os.fdopen(fd, 'wb')
+        try:
+            out_file.write(self.HEADER.pack(self.MAGIC, CACHE_VERSION))
+            block = []
+            with _open_input_file(file_name) as in_file:
+                for transaction in _iter_file_transactions(in_file):
+                    if (out_file is not None):
+                        block.append(transaction)
+                        if (CACHE_BLOCK_SIZE == len(block)):
+                            out_file = self._try_write_block(out_file, block)
+                            block = []
+                    yield transaction
+
+            if (out_file is not None):
+                if (block):
+                    out_file = self._try_write_block(out_file, block)
+            if (out_file is not None):
+                out_file.close()
+                out_file = None
+                os.rename(tmp_path, path)
+                self.evict()
+        finally:
+            if (out_file is not None):
+                out_file.close()
+            if (os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+
+    def _try_write_block(self, out_file, block):
+        """Returns the out_file or None if the block can't be cached (e.g. the
+        input contains values that are not bytes).
+
+        """
+        try:
+            self._write_block(out_file, block)
+            return out_file
+        except (ValueError, TypeError, OverflowError):
+            out_file.close()
+            return None
+
+    def evict(self):
+        """Deletes the least recently used entries until the total size of the
+        cache directory is at most max_size.
+
+        """
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            if (not name.endswith(self.EXTENSION)):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Another process sharing the cache directory removed it.
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total_size += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if (total_size <= self.max_size):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+
+def _iter_input_transactions(file_name, cache=None, skip_cmds=None):
+    """Yields the transactions in the input file. A TransactionCache is used
+    if one is passed in. See _iter_transactions for skip_cmds (it's ignored
+    when the cache is used). The file_name can also be a LogicCapture, in
+    which case the transactions are decoded from its samples and the cache
+    isn't used.
+
+    """
+    if (isinstance(file_name, LogicCapture)):
+        for transaction in file_name.iter_transactions():
+            yield transaction
+    elif (cache is not None):
+        for transaction in cache.iter_transactions(file_name):
+            yield transaction
+    else:
+        with _open_input_file(file_name) as in_file:
+            for transaction in _iter_file_transactions(in_file, skip_cmds=skip_cmds):
+                yield transaction
+
+
+def parse_file(file_name, state_index=None, cache=None, decoder=None):
+    """Parses a file in the form:
+
+    Time, Packet ID, MOSI, MISO\n
+    0.0,0,0x00,0x01\n
+    0.1,1,0x01,0x02\n
+    ...
+
+    All lines that contain the same Packet ID are combined into
+    single messages and then sent to the parsing object.
+
+    If a StateIndex is passed in then the state of the parsing object is
+    recorded in it after each transaction. If a TransactionCache is passed in
+    then it is used to avoid parsing the same file more than once. A Decode
+    object can be passed in to use instead of a new one.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+
+    transactions = _iter_input_transactions(file_name, cache)
+    if (state_index is None):
+        for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+            decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+    else:
+        state_index.attach(decoder)
+        for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+            decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+            state_index.record(decoder, ts, packet_id)
+
+    return decoder
+
+
+def summarize_file(file_name, cache=None, decoder=None):
+    """Works like parse_file but returns a SummaryDecode (unless a decoder is
+    passed in) that only has the state needed for the summary and the
+    micro-esb init code. The data bytes of payloads are counted without being
+    parsed unless a TransactionCache is used.
+
+    """
+    if (decoder is None):
+        decoder = SummaryDecode()
+
+    update = decoder.update
+    if ((cache is not None) or isinstance(file_name, LogicCapture)):
+        for ts, packet_id, mosi_data, miso_data, end_ts in _iter_input_transactions(file_name,
+                                                                                    cache):
+            update(ts, packet_id, mosi_data, miso_data, end_ts)
+        return decoder
+
+    with _open_input_file(file_name) as in_file:
+        transactions = _iter_file_transactions(in_file,
+                                               skip_cmds=SummaryDecode.get_counted_cmds())
+        for ts, packet_id, mosi_data, miso_data, end_ts in transactions:
+            update(ts, packet_id, mosi_data, miso_data, end_ts)
+
+    return decoder
+
+
+def iter_records(file_name, decoder=None, cache=None, transaction_filter=None,
+                 seek_index=None, state_index=None):
+    """Works like parse_file but yields a Transaction for each decoded
+    transaction as soon as it is produced instead of collecting them. The
+    transactions are removed from the decoder after they are yielded so memory
+    usage does not grow with the size of the input file.
+
+    A Decode object can be passed in to inspect the summary (packet format,
+    channels, etc.) after the generator is exhausted.
+
+    If a TransactionFilter is passed in then only the matching transactions
+    are yielded. The transactions before its time and ID ranges are still
+    decoded (so the registers are up to date) but decoding stops at the end
+    of the ranges, so the decoder's state is only up to that point. The data
+    bytes of payloads that can't match are not parsed.
+
+    If a SeekIndex is passed in as well then decoding starts at its last entry
+    before the filter's ranges instead (with the decoder's state restored from
+    it) and the cache isn't used.
+
+    If a StateIndex is passed in (without a TransactionFilter) then the state
+    of the decoder is recorded in it after each transaction, as parse_file
+    does.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+
+    transactions = decoder.transactions
+    if (transaction_filter is None):
+        if (state_index is not None):
+            state_index.attach(decoder)
+        for ts, packet_id, mosi_data, miso_data, end_ts in _iter_input_transactions(file_name,
+                                                                                    cache):
+            decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+            if (state_index is not None):
+                state_index.record(decoder, ts, packet_id)
+            if (transactions):
+                for transaction in transactions:
+                    yield transaction
+                transactions.clear()
+        return
+
+    if (seek_index is None):
+        input_transactions = _iter_input_transactions(file_name, cache,
+                                                      transaction_filter.get_skip_cmds())
+    else:
+        input_transactions = seek_index.iter_transactions(file_name, decoder,
+                                                          transaction_filter.id_range[0],
+                                                          transaction_filter.ts_range[0],
+                                                          transaction_filter.get_skip_cmds())
+
+    matches = transaction_filter.matches
+    for ts, packet_id, mosi_data, miso_data, end_ts in input_transactions:
+        if (transaction_filter.is_past(ts, packet_id)):
+            break
+        decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+        if (transactions):
+            for i in xrange(len(transactions)):
+                if (matches(transactions, i)):
+                    yield transactions[i]
+            transactions.clear()
+
+
+def iter_decode(file_name, decoder=None, cache=None, transaction_filter=None,
+                seek_index=None, collapse=False, state_index=None):
+    """Works like iter_records but yields each decoded transaction as a
+    human-readable str. If collapse is True then repeated transactions are
+    yielded as a single str (see Decode.iter_collapsed). Every transaction
+    is still decoded.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+
+    transactions = iter_records(file_name, decoder, cache, transaction_filter, seek_index,
+                                state_index)
+    if (collapse):
+        for msg in decoder.iter_collapsed(transactions):
+            yield msg
+        return
+
+    for transaction in transactions:
+        yield decoder.render(transaction)
+
+
+class _RecordExporter(object):
+    """Base class of the export formats. Records (see Decode.to_record) are
+    buffered and written block_size at a time.
+
+    """
+
+    def __init__(self, out_file_name, block_size=EXPORT_BLOCK_SIZE):
+        self.out_file_name = out_file_name
+        self.block_size = block_size
+        self._records = []
+
+    def write(self, record):
+        self._records.append(record)
+        if (len(self._records) >= self.block_size):
+            self.flush()
+
+    def flush(self):
+        if (self._records):
+            self._write_block(self._records)
+            del self._records[:]
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def _write_block(self, records):
+        raise NotImplementedError()
+
+    def _close(self):
+        pass
+
+
+class _JsonLinesExporter(_RecordExporter):
+    """Writes one JSON object per line. The data bytes are a hex str."""
+
+    def __init__(self, out_file_name, block_size=EXPORT_BLOCK_SIZE):
+        _RecordExporter.__init__(self, out_file_name, block_size)
+        self._out_file = open(out_file_name, 'wb')
+
+    # The strs are names from the Decode tables, so they don't need escaping.
+    LINE_FORMAT = ('{"ts":%r,"transaction_id":%d,"cmd":"%s","register":%s,"fields":%s,' +
+                   '"data":"%s","mode":"%s","delta":%s,"note":%s}')
+
+    def _write_block(self, records):
+        line_format = self.LINE_FORMAT
+        lines = []
+        for ts, transaction_id, cmd, register, fields, data, mode, delta, note in records:
+            lines.append(line_format % (ts,
+                                        transaction_id,
+                                        cmd,
+                                        ('null' if (register is None) else ('"' + register + '"')),
+                                        ('null' if (fields is None) else ('"' + fields + '"')),
+                                        data.encode('hex'),
+                                        mode,
+                                        ('null' if (delta is None) else repr(delta)),
+                                        ('null' if (note is None) else ('"' + note + '"'))))
+        lines.append('')
+        self._out_file.write('\n'.join(lines))
+
+    def _close(self):
+        self._out_file.close()
+
+
+class _CsvExporter(_RecordExporter):
+    """Writes a header line followed by one line per record. The data bytes
+    are a hex str and missing values are left empty.
+
+    """
+
+    def __init__(self, out_file_name, block_size=EXPORT_BLOCK_SIZE):
+        _RecordExporter.__init__(self, out_file_name, block_size)
+        self._out_file = open(out_file_name, 'wb')
+        self._out_file.write(COL_SEPARATOR.join(Decode.RECORD_COLUMNS) + '\r\n')
+
+    def _write_block(self, records):
+        lines = []
+        for ts, transaction_id, cmd, register, fields, data, mode, delta, note in records:
+            lines.append(COL_SEPARATOR.join((repr(ts),
+                                             str(transaction_id),
+                                             cmd,
+                                             (register or ''),
+                                             (fields or ''),
+                                             data.encode('hex'),
+                                             mode,
+                                             ('' if (delta is None) else repr(delta)),
+                                             (note or ''))))
+        lines.append('')
+        self._out_file.write('\r\n'.join(lines))
+
+    def _close(self):
+        self._out_file.close()
+
+
+class _ParquetExporter(_RecordExporter):
+    """Writes a Parquet file with a row group per block. Requires pyarrow."""
+
+    def __init__(self, out_file_name, block_size=EXPORT_BLOCK_SIZE):
+        if (pyarrow is None):
+            raise DecodeError('ERROR: pyarrow is required for the parquet format')
+        _RecordExporter.__init__(self, out_file_name, block_size)
+        self._types = (pyarrow.float64(),
+                       pyarrow.int64(),
+                       pyarrow.string(),
+                       pyarrow.string(),
+                       pyarrow.string(),
+                       pyarrow.binary(),
+                       pyarrow.string(),
+                       pyarrow.float64(),
+                       pyarrow.string())
+        self._schema = pyarrow.schema([pyarrow.field(name, col_type) for name, col_type in
+                                       zip(Decode.RECORD_COLUMNS, self._types)])
+        self._writer = pyarrow.parquet.ParquetWriter(out_file_name, self._schema)
+
+    def _write_block(self, records):
+        arrays = [pyarrow.array(list(col), type=col_type)
+                  for col, col_type in zip(zip(*records), self._types)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+
+
+class _NpzExporter(_RecordExporter):
+    """Writes a NumPy .npz file with an array per column. Requires NumPy.
+
+    Each block is appended to a temporary file per column so memory usage
+    doesn't grow with the number of records. The str columns are stored as
+    int32 codes (-1 for None) with a '<column>_names' array of the strs. The
+    data bytes of all records are concatenated in 'data' and the ones of
+    record i are data[data_offsets[i]:data_offsets[i + 1]]. Missing deltas
+    are NaN.
+
+    """
+
+    NUMERIC_COLUMNS = (('ts', '<f8'), ('transaction_id', '<i8'), ('delta', '<f8'))
+    STR_COLUMNS = ('cmd', 'register', 'fields', 'mode', 'note')
+
+    def __init__(self, out_file_name, block_size=EXPORT_BLOCK_SIZE):
+        if (numpy is None):
+            raise DecodeError('ERROR: NumPy is required for the npz format')
+        _RecordExporter.__init__(self, out_file_name, block_size)
+        self._tmp_dir = tempfile.mkdtemp(prefix='.export-',
+                                         dir=os.path.dirname(os.path.abspath(out_file_name)))
+        self._dtypes = dict(self.NUMERIC_COLUMNS)
+        self._dtypes.update([(name, '<i4') for name in self.STR_COLUMNS])
+        self._dtypes.update([('data', '|u1'), ('data_offsets', '<i8')])
+        self._files = dict([(name, open(os.path.join(self._tmp_dir, name), 'wb'))
+                            for name in self._dtypes])
+        self._codes = dict([(name, {None: -1}) for name in self.STR_COLUMNS])
+        self._count = 0
+        self._data_len = 0
+
+    def _write_column(self, name, values):
+        numpy.asarray(values, dtype=self._dtypes[name]).tofile(self._files[name])
+
+    def _write_block(self, records):
+        cols = dict(zip(Decode.RECORD_COLUMNS, zip(*records)))
+        self._write_column('ts', cols['ts'])
+        self._write_column('transaction_id', cols['transaction_id'])
+        self._write_column('delta', [(float('nan') if (delta is None) else delta)
+                                     for delta in cols['delta']])
+        for name in self.STR_COLUMNS:
+            codes = self._codes[name]
+            self._write_column(name, [codes.setdefault(s, (len(codes) - 1))
+                                      for s in cols[name]])
+
+        data = ''.join(cols['data'])
+        lengths = numpy.array([len(x) for x in cols['data']], dtype=numpy.int64)
+        self._write_column('data_offsets', (self._data_len + numpy.cumsum(lengths) - lengths))
+        self._files['data'].write(data)
+        self._data_len += len(data)
+        self._count += len(records)
+
+    def _close(self):
+        self._write_column('data_offsets', [self._data_len])
+        for out_file in self._files.itervalues():
+            out_file.close()
+
+        try:
+            with zipfile.ZipFile(self.out_file_name, 'w', allowZip64=True) as zip_file:
+                for name, dtype in self._dtypes.iteritems():
+                    shape = ((self._count + 1) if ('data_offsets' == name) else self._count)
+                    if ('data' == name):
+                        shape = self._data_len
+                    self._add_array(zip_file, name, dtype, shape)
+
+                for name in self.STR_COLUMNS:
+                    codes = self._codes[name]
+                    names = [''] * (len(codes) - 1)
+                    for s, code in codes.iteritems():
+                        if (s is not None):
+                            names[code] = s
+                    path = os.path.join(self._tmp_dir, (name + '_names'))
+                    with open(path, 'wb') as out_file:
+                        numpy.save(out_file, numpy.array(names, dtype=str))
+                    zip_file.write(path, (name + '_names.npy'))
+        finally:
+            shutil.rmtree(self._tmp_dir)
+
+    def _add_array(self, zip_file, name, dtype, shape):
+        # The .npy header is written in front of the raw column data.
+        raw_path = os.path.join(self._tmp_dir, name)
+        npy_path = (raw_path + '.npy')
+        with open(npy_path, 'wb') as out_file:
+            numpy.lib.format.write_array_header_1_0(out_file, {'descr': dtype,
+                                                              'fortran_order': False,
+                                                              'shape': (shape,)})
+            with open(raw_path, 'rb') as in_file:
+                shutil.copyfileobj(in_file, out_file)
+        os.remove(raw_path)
+        zip_file.write(npy_path, (name + '.npy'))
+        os.remove(npy_path)
+
+
+EXPORTERS = {'jsonl': _JsonLinesExporter,
+             'csv': _CsvExporter,
+             'parquet': _ParquetExporter,
+             'npz': _NpzExporter}
+
+
+def _get_export_format(file_name):
+    """Returns the export format that matches the extension of file_name."""
+    ext = os.path.splitext(file_name)[1].lower().lstrip('.')
+    if (ext in ('json', 'ndjson')):
+        return 'jsonl'
+    if (ext in EXPORTERS):
+        return ext
+    raise DecodeError('ERROR: Unknown export format: %s' % file_name)
+
+
+def export_file(file_name, out_file_name, export_format=None, decoder=None, cache=None,
+                transaction_filter=None, seek_index=None):
+    """Decodes the input file and writes a record (see Decode.to_record) for
+    each decoded transaction to out_file_name as soon as it is decoded. The
+    export_format is one of the keys of EXPORTERS. It is chosen by the
+    extension of out_file_name if it isn't given. See iter_records for the
+    other params. Returns the decoder.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+    if (export_format is None):
+        export_format = _get_export_format(out_file_name)
+    if (not export_format in EXPORTERS):
+        raise DecodeError('ERROR: Unknown export format: %s' % export_format)
+
+    exporter = EXPORTERS[export_format](out_file_name)
+    write = exporter.write
+    to_record = decoder.to_record
+    for transaction in iter_records(file_name, decoder, cache, transaction_filter,
+                                    seek_index):
+        write(to_record(transaction))
+    exporter.close()
+    return decoder
+
+
+class _FileSection(object):
+    """Wraps an open file so that reading starts at the start offset and
+    stops at the end offset.
+
+    """
+
+    def __init__(self, in_file, start, end):
+        in_file.seek(start)
+        self._file = in_file
+        self._remaining = (end - start)
+
+    def read(self, size=-1):
+        if ((size < 0) or (size > self._remaining)):
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readline(self):
+        if (self._remaining <= 0):
+            return ''
+        line = self._file.readline(self._remaining)
+        self._remaining -= len(line)
+        return line
+
+    def __iter__(self):
+        while (True):
+            line = self.readline()
+            if (not line):
+                break
+            yield line
+
+
+def _next_transaction_offset(in_file, layout):
+    """Returns the offset of the first line of the next transaction that
+    starts after the current position or None if there isn't one. The current
+    position is expected to be at the beginning of a line.
+
+    """
+    first_packet_id = None
+    while (True):
+        offset = in_file.tell()
+        line = in_file.readline()
+        if (not line):
+            return None
+
+        cols = line.split(COL_SEPARATOR)
+        if (layout.col_count != len(cols)):
+            continue
+        packet_id = _parse_num(cols[layout.packet_id_col])
+        if (packet_id is None):
+            continue
+
+        if (first_packet_id is None):
+            first_packet_id = packet_id
+        elif (packet_id != first_packet_id):
+            return offset
+
+
+def _iter_transaction_starts(in_file):
+    """Yields (offset, packet_id, ts) for the first line of each transaction
+    in an open input file. The header line is expected to be the first line
+    and the file must have Packet IDs.
+
+    """
+    layout = ColumnLayout.from_header(in_file.readline())
+    if (not layout.has_packet_ids):
+        raise DecodeError('ERROR: The input file has no Packet ID column')
+    offset = in_file.tell()
+
+    ts_col = layout.ts_col
+    packet_id_col = layout.packet_id_col
+    cur_packet_id = None
+    for line in in_file:
+        fields = line.split(COL_SEPARATOR)
+        if ((len(fields) > packet_id_col) and (fields[packet_id_col] != cur_packet_id)):
+            packet_id = _parse_num(fields[packet_id_col])
+            if (packet_id is not None):
+                cur_packet_id = fields[packet_id_col]
+                yield (offset, packet_id, _parse_num(fields[ts_col]))
+        offset += len(line)
+
+
+def _find_data_end(in_file):
+    """Returns the offset after the last newline in an open input file. A line
+    without a newline at the end of the file is still being written.
+
+    """
+    end = os.fstat(in_file.fileno()).st_size
+    while (end > 0):
+        start = max(0, (end - CHECKPOINT_TAIL_SIZE))
+        in_file.seek(start)
+        i = in_file.read(end - start).rfind('\n')
+        if (i >= 0):
+            return (start + i + 1)
+        end = start
+    return 0
+
+
+def _find_last_transaction(in_file, start, end, layout):
+    """Returns (offset, packet_id) for the first line of the last transaction
+    between the start and end offsets of an open input file, or (start, None)
+    if there isn't one. The end is expected to be at the end of a line.
+
+    """
+    packet_id_col = layout.packet_id_col
+    size = CHECKPOINT_TAIL_SIZE
+    while (True):
+        block_start = max(start, (end - size))
+        in_file.seek(block_start)
+        lines = in_file.read(end - block_start).split('\n')[:-1]
+        if (block_start > start):
+            # The first line may be incomplete.
+            block_start += (len(lines.pop(0)) + 1)
+
+        offset = end
+        last_packet_id = None
+        for line in reversed(lines):
+            fields = line.split(COL_SEPARATOR)
+            packet_id = None
+            if (len(fields) > packet_id_col):
+                packet_id = _parse_num(fields[packet_id_col])
+            offset -= (len(line) + 1)
+            if (packet_id is None):
+                continue
+            if (last_packet_id is None):
+                last_packet_id = packet_id
+            elif (packet_id != last_packet_id):
+                break
+            first_offset = offset
+        else:
+            if (block_start > start):
+                # The block may not contain the whole transaction.
+                size *= 2
+                continue
+
+        if (last_packet_id is None):
+            return (start, None)
+        return (first_offset, last_packet_id)
+
+
+def _split_file(file_name, section_count):
+    """Returns a list of (start, end) offsets that split the input file into
+    at most section_count sections. The header is excluded and each section
+    starts with the first line of a transaction. Files without Packet IDs are
+    not split because their transactions are numbered from the start.
+
+    """
+    _check_uncompressed(file_name)
+    with open(file_name, 'rb') as in_file:
+        layout = ColumnLayout.from_header(in_file.readline())
+        data_start = in_file.tell()
+        size = os.fstat(in_file.fileno()).st_size
+        if (not layout.has_packet_ids):
+            section_count = 1
+
+        offsets = [data_start]
+        for i in range(1, section_count):
+            target = (data_start + (((size - data_start) * i) // section_count))
+            if (target <= offsets[-1]):
+                continue
+
+            # Move to the beginning of the line that contains the target.
+            in_file.seek(target - 1)
+            in_file.readline()
+
+            offset = _next_transaction_offset(in_file, layout)
+            if ((offset is not None) and (offset > offsets[-1])):
+                offsets.append(offset)
+
+        offsets.append(size)
+
+    return zip(offsets[:-1], offsets[1:])
+
+
+def _decode_section(args):
+    """Decodes one section of the input file in a worker process. The section
+    is decoded as if the radio was in its reset state at the start of it and
+    the state is recorded every checkpoint_interval transactions so that the
+    result can be reconciled with the real state later.
+
+    """
+    file_name, start, end, checkpoint_interval = args
+
+    decoder = Decode()
+    transactions = decoder.transactions
+    checkpoints = []
+    count = 0
+    layout = ColumnLayout.from_file(file_name)
+    with open(file_name, 'rb') as in_file:
+        section = _FileSection(in_file, start, end)
+        for ts, packet_id, mosi_data, miso_data, end_ts in _iter_file_transactions(
+                section, False, layout=layout):
+            if (0 == (count % checkpoint_interval)):
+                checkpoints.append((count,
+                                    len(transactions),
+                                    decoder._get_decode_state(),
+                                    decoder.tx_count,
+                                    decoder.rx_count))
+            decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+            count += 1
+
+    # The text of the transaction at index i ends at text_ends[i].
+    lines = [(decoder.render(transaction) + os.linesep) for transaction in transactions]
+    text_ends = array.array('L')
+    text_len = 0
+    for line in lines:
+        text_len += len(line)
+        text_ends.append(text_len)
+
+    # Channels are only added to used_channels when an RF_CH write succeeds.
+    channel_writes = {}
+    w_register = Decode.COMMAND_LOOKUP['W_REGISTER']
+    rf_ch = Decode.REGISTER_LOOKUP['RF_CH']
+    for i in xrange(len(transactions)):
+        if ((w_register == transactions.cmds[i]) and
+                (rf_ch == transactions.packed_indexes[i]) and
+                (Decode.NOTE_NONE == transactions.notes[i])):
+            ch = transactions.payload[transactions.offsets[i] + transactions.lengths[i] - 1]
+            channel_writes.setdefault(ch, []).append(i)
+
+    return {'checkpoints': checkpoints,
+            'text': ''.join(lines),
+            'text_ends': text_ends,
+            'decode_state': decoder._get_decode_state(),
+            'tx_count': decoder.tx_count,
+            'rx_count': decoder.rx_count,
+            'beken_detected': decoder.beken_detected,
+            'channel_writes': channel_writes}
+
+
+def _reconcile_section(decoder, file_name, start, end, result, checkpoint_interval):
+    """Combines the result of _decode_section with the real state of the
+    decoder at the start of the section. The section is decoded again from the
+    real state until it matches one of the worker's checkpoints. From then on
+    the worker's output is identical to what a sequential decode would
+    produce. Yields the section's text and updates the decoder to the state
+    at the end of the section.
+
+    """
+    checkpoints = result['checkpoints']
+    if (not checkpoints):
+        return
+
+    transactions = decoder.transactions
+    transactions.clear()
+
+    converged = None
+    if (decoder._get_decode_state() == checkpoints[0][2]):
+        converged = checkpoints[0]
+    else:
+        # The errors for these transactions were already reported by the worker.
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+        try:
+            count = 0
+            layout = ColumnLayout.from_file(file_name)
+            with open(file_name, 'rb') as in_file:
+                section = _FileSection(in_file, start, end)
+                for ts, packet_id, mosi_data, miso_data, end_ts in _iter_file_transactions(
+                        section, False, layout=layout):
+                    if (count and (0 == (count % checkpoint_interval))):
+                        checkpoint = checkpoints[count // checkpoint_interval]
+                        if (decoder._get_decode_state() == checkpoint[2]):
+                            converged = checkpoint
+                            break
+                    decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+                    count += 1
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+
+    if (transactions):
+        yield ''.join([(decoder.render(transaction) + os.linesep) for transaction in transactions])
+        transactions.clear()
+
+    if (converged is None):
+        # The whole section was decoded again.
+        return
+
+    count, transaction_count, decode_state, tx_count, rx_count = converged
+    decoder._set_decode_state(result['decode_state'])
+    decoder.tx_count += (result['tx_count'] - tx_count)
+    decoder.rx_count += (result['rx_count'] - rx_count)
+    decoder.beken_detected = (decoder.beken_detected or result['beken_detected'])
+
+    first_writes = []
+    for ch, indexes in result['channel_writes'].iteritems():
+        i = bisect.bisect_left(indexes, transaction_count)
+        if (i < len(indexes)):
+            first_writes.append((indexes[i], ch))
+    for i, ch in sorted(first_writes):
+        if (not ch in decoder._used_channel_set):
+            decoder._used_channel_set.add(ch)
+            decoder.used_channels.append(ch)
+
+    text = result['text']
+    if (transaction_count):
+        text = text[result['text_ends'][transaction_count - 1]:]
+    if (text):
+        yield text
+
+
+def iter_decode_parallel(file_name, decoder=None, processes=None,
+                         checkpoint_interval=PARALLEL_CHECKPOINT_INTERVAL):
+    """Works like iter_decode but splits the input file into sections and
+    decodes them in a pool of worker processes. Yields blocks of text that
+    contain one or more decoded lines, each followed by os.linesep. The
+    output is identical to the sequential decode.
+
+    A Decode object can be passed in to inspect the summary (packet format,
+    channels, etc.) after the generator is exhausted. Its transactions are not
+    kept.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+    if (processes is None):
+        processes = multiprocessing.cpu_count()
+
+    sections = _split_file(file_name, (processes * PARALLEL_SECTIONS_PER_PROCESS))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.imap(_decode_section,
+                            [(file_name, start, end, checkpoint_interval)
+                             for start, end in sections])
+        for (start, end), result in zip(sections, results):
+            for text in _reconcile_section(decoder, file_name, start, end, result,
+                                           checkpoint_interval):
+                yield text
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class _FollowReader(object):
+    """Reads lines from a file that is still being written, the way that
+    'tail -f' does, or from a pipe such as stdin. Only complete lines are
+    returned. When no data is available, the idle callback is called before
+    waiting for more. A file is followed until the reader is interrupted; a
+    pipe is read until it is closed.
+
+    """
+
+    def __init__(self, in_file, poll_interval=FOLLOW_POLL_INTERVAL, idle=None):
+        self._fd = in_file.fileno()
+        self._is_file = stat.S_ISREG(os.fstat(self._fd).st_mode)
+        self._poll_interval = poll_interval
+        self._idle = idle
+        self._partial = ''
+        self._lines = collections.deque()
+
+    def _wait(self):
+        if (self._idle is not None):
+            self._idle()
+
+    def _fill(self):
+        """Returns False once the end of a pipe was reached and all lines were
+        returned.
+
+        """
+        while (not self._lines):
+            # A signal (e.g. SIGUSR1 for a refresh) interrupts select and read,
+            # so the idle callback is called to handle it before trying again.
+            try:
+                if ((not self._is_file) and
+                        (not select.select([self._fd], [], [], self._poll_interval)[0])):
+                    self._wait()
+                    continue
+
+                data = os.read(self._fd, (1 << 16))
+            except (select.error, OSError) as e:
+                if (errno.EINTR != e.args[0]):
+                    raise
+                self._wait()
+                continue
+
+            if (not data):
+                if (not self._is_file):
+                    if (self._partial):
+                        self._lines.append(self._partial)
+                        self._partial = ''
+                    return bool(self._lines)
+                self._wait()
+                time.sleep(self._poll_interval)
+                continue
+
+            lines = (self._partial + data).split('\n')
+            self._partial = lines.pop()
+            self._lines.extend([(line + '\n') for line in lines])
+        return True
+
+    def readline(self):
+        if (not self._fill()):
+            return ''
+        return self._lines.popleft()
+
+    def __iter__(self):
+        while (True):
+            line = self.readline()
+            if (not line):
+                break
+            yield line
+
+
+def follow(in_file, out_file, decoder=None, refresh=None, latency=FOLLOW_LATENCY):
+    """Decodes the input while it is being written and writes each decoded
+    line to out_file as soon as the transaction is complete (i.e. when the
+    next Packet ID appears). The output is flushed at least every latency
+    seconds. If a refresh function is passed in then it is called with the
+    decoder between transactions whenever it returns True when called
+    without arguments.
+
+    Returns when the input is a pipe that has been closed.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+
+    flush_time = [time.time()]
+
+    def idle():
+        out_file.flush()
+        flush_time[0] = time.time()
+        if ((refresh is not None) and refresh()):
+            refresh(decoder)
+
+    reader = _FollowReader(in_file, idle=idle)
+    transactions = decoder.transactions
+    for ts, packet_id, mosi_data, miso_data, end_ts in _iter_transactions(reader):
+        decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+        if (transactions):
+            for transaction in transactions:
+                out_file.write(decoder.render(transaction) + os.linesep)
+            transactions.clear()
+
+        now = time.time()
+        if ((now - flush_time[0]) > latency):
+            out_file.flush()
+            flush_time[0] = now
+        if ((refresh is not None) and refresh()):
+            refresh(decoder)
+
+    out_file.flush()
+    return decoder
+
+
+def resume_file(file_name, out_file_name, checkpoint_file_name=None, decoder=None):
+    """Decodes an input file that is still being appended to (e.g. by a soak
+    test) into an output file in the layout that -s writes, with the summary
+    at the end, and saves a Checkpoint next to the output file (or to
+    checkpoint_file_name). When the checkpoint exists, the decoder's state is
+    restored from it instead and only the input from its offset on is decoded.
+    The output file is truncated to the size before the checkpoint's
+    transaction and the new transactions and the summary are appended to it.
+    The output is the same as if the whole input file had been decoded,
+    except for the time in the header.
+
+    A line at the end of the input file that doesn't end with a newline yet
+    is left for the next run. The input file must have Packet IDs. Returns
+    the decoder.
+
+    """
+    if (decoder is None):
+        decoder = Decode()
+    if (checkpoint_file_name is None):
+        checkpoint_file_name = (out_file_name + CHECKPOINT_SUFFIX)
+
+    _check_uncompressed(file_name)
+    layout = ColumnLayout.from_file(file_name)
+    if (not layout.has_packet_ids):
+        raise DecodeError('ERROR: The input file has no Packet ID column')
+
+    with open(file_name, 'rb') as in_file:
+        if (os.path.exists(checkpoint_file_name) and os.path.exists(out_file_name)):
+            checkpoint = Checkpoint.load(checkpoint_file_name)
+            out_file = open(out_file_name, 'r+b')
+            try:
+                checkpoint.verify(in_file, layout, os.fstat(out_file.fileno()).st_size)
+            except DecodeError:
+                out_file.close()
+                raise
+            checkpoint.restore(decoder)
+            start = checkpoint.input_offset
+            out_file.seek(checkpoint.output_size)
+            out_file.truncate()
+        else:
+            checkpoint = Checkpoint(in_file.readline())
+            start = in_file.tell()
+            out_file = open(out_file_name, 'wb')
+            _write_header(out_file, file_name)
+            out_file.write('-' * 80 + os.linesep)
+
+        end = max(start, _find_data_end(in_file))
+        offset, last_packet_id = _find_last_transaction(in_file, start, end, layout)
+
+        transactions = decoder.transactions
+        section = _FileSection(in_file, start, end)
+        pending = None
+        for transaction in _iter_file_transactions(section, header=False, layout=layout):
+            if (pending is not None):
+                decoder.update(*pending)
+                if (transactions):
+                    for decoded in transactions:
+                        out_file.write(decoder.render(decoded) + os.linesep)
+                    transactions.clear()
+            pending = transaction
+
+        if (pending is None):
+            checkpoint.record(decoder, start, None, out_file.tell())
+        else:
+            if (pending[1] != last_packet_id):
+                out_file.close()
+                raise DecodeError('ERROR: Failed to find the last transaction: %d' %
+                                  pending[1])
+            checkpoint.record(decoder, offset, last_packet_id, out_file.tell())
+            decoder.update(*pending)
+            for decoded in transactions:
+                out_file.write(decoder.render(decoded) + os.linesep)
+            transactions.clear()
+
+        _write_summary(out_file, decoder)
+        out_file.close()
+
+    checkpoint.save(checkpoint_file_name)
+    return decoder
+
+
+def _iter_batch_files(pattern):
+    """Returns the sorted paths of the input files in a directory or the ones
+    that match a glob pattern. Files that were written by a previous batch
+    decode and seek indexes are skipped.
+
+    """
+    if (os.path.isdir(pattern)):
+        file_names = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        file_names = glob.glob(pattern)
+
+    return sorted(name for name in file_names
+                  if (os.path.isfile(name) and
+                      not name.endswith((BATCH_OUTPUT_SUFFIX, BATCH_UESB_SUFFIX,
+                                         BATCH_TIMELINE_SUFFIX, SEEK_INDEX_SUFFIX))))
+
+
+def _batch_output_names(file_names):
+    """Returns the name (without a suffix) to use for the output files of each
+    input file. The names are relative to the directory that the input files
+    have in common so that files with the same name in different directories
+    don't overwrite each other.
+
+    """
+    common_dir = os.path.commonprefix([os.path.dirname(os.path.abspath(name)) + os.sep
+                                       for name in file_names])
+    common_dir = common_dir[:(common_dir.rfind(os.sep) + 1)]
+    names = [_strip_compression_suffix(os.path.abspath(name))[len(common_dir):]
+             for name in file_names]
+    return [os.path.splitext(name)[0].replace(os.sep, '_') for name in names]
+
+
+def _decode_batch_file(args):
+    """Decodes one input file in a worker process and writes its output file
+    and micro-esb init code to output_dir (if it isn't None). If timeline_dir
+    isn't None then a file with the timestamp and text of each transaction
+    (separated by a tab) is written to it for merging into a timeline.
+    Returns a dict that contains the summary of the file or the error that
+    stopped it from being decoded.
+
+    """
+    file_name, output_name, output_dir, cache_dir, cache_size, timeline_dir = args
+
+    result = dict(file_name=file_name, error=None)
+    cache = None
+    if (cache_dir is not None):
+        cache = TransactionCache(cache_dir, cache_size)
+
+    start = time.time()
+    decoder = Decode()
+    count = 0
+    try:
+        for ts, packet_id, mosi_data, miso_data, end_ts in _iter_input_transactions(file_name, cache):
+            decoder.update(ts, packet_id, mosi_data, miso_data, end_ts)
+            count += 1
+    except DecodeError as e:
+        result['error'] = str(e)
+        return result
+    elapsed = (time.time() - start)
+
+    if (output_dir is not None):
+        output_path = os.path.join(output_dir, output_name)
+        with open(output_path + BATCH_OUTPUT_SUFFIX, 'wb') as out_file:
+            _write_header(out_file, file_name)
+            _write_summary(out_file, decoder)
+            out_file.write(decoder.__repr__())
+        with open(output_path + BATCH_UESB_SUFFIX, 'wb') as out_file:
+            out_file.write(decoder.get_uesb_config())
+
+    if (timeline_dir is not None):
+        render = decoder.render
+        with open(os.path.join(timeline_dir, output_name) + BATCH_TIMELINE_SUFFIX,
+                  'wb') as out_file:
+            out_file.writelines([('%r\t%s\n' % (transaction.ts, render(transaction)))
+                                 for transaction in decoder.transactions])
+
+    result.update(packet_format=decoder.get_packet_format(),
+                  data_rate=decoder.get_data_rate(),
+                  crc=decoder.get_CRC_mode(),
+                  address_width=decoder.get_address_width(),
+                  channels=decoder.get_used_channels(),
+                  tx_count=decoder.get_tx_count(),
+                  rx_count=decoder.get_rx_count(),
+                  transaction_count=count,
+                  elapsed=elapsed)
+    return result
+
+
+def iter_decode_batch(file_names, output_dir=None, processes=None, cache_dir=None,
+                      cache_size=CACHE_MAX_SIZE, timeline_dir=None):
+    """Decodes a list of input files in a pool of worker processes (one file
+    per worker at a time) and yields the result of each file in order. See
+    _decode_batch_file for the contents of the results and timeline_dir. A
+    file that raises a DecodeError doesn't stop the others from being
+    decoded.
+
+    """
+    if (processes is None):
+        processes = multiprocessing.cpu_count()
+
+    args = [(file_name, output_name, output_dir, cache_dir, cache_size, timeline_dir)
+            for file_name, output_name in zip(file_names, _batch_output_names(file_names))]
+
+    if (1 == processes):
+        for arg in args:
+            yield _decode_batch_file(arg)
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(_decode_batch_file, args):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _write_header(out_file, input_file_name):
+    out_file.write('nRF24L01 SPI Decoder v' + str(VERSION[0]) + os.linesep)
+    out_file.write(datetime.datetime.now().strftime('%c') + os.linesep)
+    out_file.write("Input file: '" +
+                   os.path.basename(input_file_name) +
+                   "'" + os.linesep)
+
+
+def _write_registers(out_file, decoder):
+    for addr in sorted(decoder.REGISTERS):
+        val = decoder.reg_values[addr]
+        out_file.write('{:<25s} {:s}{:s}'.format((decoder.REGISTERS[addr][0] + ':'),
+                                                 decoder._format_num([decoder._reg_fields_str(addr, x)
+                                                                      for x in val]),
+                                                 os.linesep))
+
+
+def _write_summary(out_file, decoder):
+    out_file.write('-' * 80 + os.linesep)
+    out_file.write('{:<25s} {:s}{:s}'.format('Packet format:',
+                                             decoder.get_packet_format(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:s}{:s}'.format('Data rate:',
+                                             decoder.get_data_rate(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:s}{:s}'.format('CRC width:',
+                                             decoder.get_CRC_mode(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Address width:',
+                                             decoder.get_address_width(),
+                                             os.linesep))
+    out_file.write('{:<25s} {}{:s}'.format('Possible channels:',
+                                           decoder.get_used_channels(),
+                                           os.linesep))
+    out_file.write('{:<25s} {:s}{:s}'.format('Output power:',
+                                             decoder.get_output_power(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Auto retransmit count:',
+                                             decoder.get_auto_retransmit_count(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Auto retransmit delay:',
+                                             decoder.get_auto_retransmit_delay(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Packets sent:',
+                                             decoder.get_tx_count(),
+                                             os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Packets received:',
+                                             decoder.get_rx_count(),
+                                             os.linesep))
+    if (decoder.timing is not None):
+        decoder.timing.write(out_file)
+    if (decoder.mode_timeline is not None):
+        decoder.mode_timeline.write(out_file)
+    if (decoder.channel_stats is not None):
+        decoder.channel_stats.write(out_file)
+    out_file.write('-' * 80 + os.linesep)
+
+
+class DeviceMap(object):
+    """Assigns the transactions of an input file that contains the SPI
+    traffic of several radios to devices. It is created from a list of specs
+    in one of the following forms:
+        NAME=VALUE          The transactions that have VALUE in the device (CS)
+                            column belong to NAME
+        NAME=START..END     The transactions with Packet IDs from START to END
+                            (START <= id < END) belong to NAME. Either end can be
+                            left out.
+
+    Without a spec for a value of the device column, the value itself is used
+    as the name. Transactions that aren't assigned to any device are dropped.
+
+    """
+
+    def __init__(self, specs=()):
+        self.values = {}
+        self.ranges = []
+        for spec in specs:
+            name, sep, value = spec.partition('=')
+            if ((not sep) or (not name) or (not value)):
+                raise DecodeError('ERROR: Invalid device: %s' % spec)
+            if ('..' in value):
+                start, end = TransactionFilter._parse_range(value, (lambda s: int(float(s))))
+                self.ranges.append((start, end, name))
+            else:
+                self.values[value] = name
+
+    def get_device(self, packet_id, value):
+        """Returns the name of the device of a transaction or None. The value
+        is the one in the device column (or None if there isn't one).
+
+        """
+        if (value is not None):
+            if (not value):
+                return None
+            return self.values.get(value, value)
+
+        for start, end, name in self.ranges:
+            if (((start is None) or (packet_id >= start)) and ((end is None) or (packet_id < end))):
+                return name
+        return None
+
+
+def demux_file(file_name, output_dir, device_map=None):
+    """Splits an input file that contains the SPI traffic of several radios
+    into one input file per device in output_dir, named after the input file
+    and the device. The devices are told apart by the device (CS) column of
+    the input file or, if it doesn't have one, by the Packet ID ranges of the
+    DeviceMap. Returns a list of (device, file_name) sorted by device.
+
+    """
+    if (device_map is None):
+        device_map = DeviceMap()
+
+    base_name = os.path.splitext(os.path.basename(_strip_compression_suffix(file_name)))[0]
+    out_files = {}
+    lines = {}
+    header = (COL_SEPARATOR.join(['Time [s]', 'Packet ID', 'MOSI', 'MISO']) + '\n')
+
+    def flush(device):
+        out_files[device].write(''.join(lines[device]))
+        del lines[device][:]
+
+    with _open_input_file(file_name) as in_file:
+        layout = ColumnLayout.from_header(in_file.readline())
+        if ((layout.device_col is None) and (not device_map.ranges)):
+            raise DecodeError('ERROR: The input file has no device column and no ' +
+                              'Packet ID ranges were given')
+
+        cols = (layout.ts_col, layout.packet_id_col, layout.mosi_col, layout.miso_col)
+        packet_id_col = layout.packet_id_col
+        device_col = layout.device_col
+        col_count = (max(cols + ((device_col or 0),)) + 1)
+
+        # The device only has to be found when a new transaction starts.
+        cur_key = None
+        device_lines = None
+        for fields in layout.iter_rows(in_file):
+            if (len(fields) < col_count):
+                continue
+            value = (None if (device_col is None) else fields[device_col].strip().strip('"'))
+            key = (value, fields[packet_id_col])
+            if (key != cur_key):
+                cur_key = key
+                packet_id = (None if (value is not None) else _parse_num(fields[packet_id_col]))
+                device = device_map.get_device(packet_id, value)
+                if (device is None):
+                    device_lines = None
+                    continue
+
+                device_lines = lines.get(device)
+                if (device_lines is None):
+                    path = os.path.join(output_dir, '%s.%s.txt' % (base_name,
+                                                                   device.replace(os.sep, '_')))
+                    out_files[device] = open(path, 'wb')
+                    out_files[device].write(header)
+                    device_lines = lines[device] = []
+                elif (len(device_lines) >= DEMUX_BLOCK_SIZE):
+                    flush(device)
+
+            if (device_lines is not None):
+                device_lines.append(COL_SEPARATOR.join([fields[col].strip() for col in cols]) +
+                                    '\n')
+
+    result = []
+    for device in sorted(out_files):
+        flush(device)
+        out_files[device].close()
+        result.append((device, out_files[device].name))
+    return result
+
+
+def _iter_timeline(timeline_files):
+    """Yields (ts, device, line) for the lines of the timeline fragments that
+    _decode_batch_file writes, merged in the order of their timestamps. Each
+    item of timeline_files is (device, file_name).
+
+    """
+    def iter_fragment(device, file_name):
+        with open(file_name, 'rb') as in_file:
+            for line in in_file:
+                ts, msg = line.rstrip('\n').split('\t', 1)
+                yield (float(ts), device, msg)
+
+    return heapq.merge(*[iter_fragment(device, file_name)
+                         for device, file_name in timeline_files])
+
+
+def iter_decode_devices(file_name, output_dir, device_map=None, processes=None):
+    """Splits an input file with several radios into one stream per device
+    (see demux_file) and decodes the streams in a pool of worker processes
+    like iter_decode_batch. The output file and micro-esb init code of each
+    device are written to output_dir and an interleaved timeline of all of
+    the devices is written to output_dir as well. Yields the result of each
+    device in order of the device names.
+
+    """
+    base_name = os.path.splitext(os.path.basename(_strip_compression_suffix(file_name)))[0]
+    tmp_dir = tempfile.mkdtemp(prefix='.demux-', dir=output_dir)
+    try:
+        devices = demux_file(file_name, tmp_dir, device_map)
+        device_file_names = [name for device, name in devices]
+        timeline_files = []
+        for (device, name), output_name, result in zip(devices,
+                                                       _batch_output_names(device_file_names),
+                                                       iter_decode_batch(device_file_names,
+                                                                         output_dir, processes,
+                                                                         timeline_dir=tmp_dir)):
+            if (result['error'] is None):
+                timeline_files.append((device, os.path.join(tmp_dir, (output_name +
+                                                                      BATCH_TIMELINE_SUFFIX))))
+            result['file_name'] = device
+            yield result
+
+        width = max([len(device) for device, name in timeline_files] + [0])
+        with open(os.path.join(output_dir, (base_name + BATCH_TIMELINE_SUFFIX)), 'wb') as out_file:
+            for ts, device, msg in _iter_timeline(timeline_files):
+                out_file.write('{:.9f} {:<{}s} {}{}'.format(ts, device, width, msg, os.linesep))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def _write_batch_report(out_file, results, elapsed):
+    """Writes one line for each of the results of iter_decode_batch followed
+    by the totals."""
+    row = '{:<30s} {:<6s} {:<8s} {:<6s} {:>2s} {:>8s} {:>8s} {:>12s}  {:s}' + os.linesep
+    out_file.write(row.format('File', 'Format', 'Rate', 'CRC', 'AW', 'Sent',
+                              'Received', 'Trans/s', 'Channels'))
+    out_file.write('-' * 100 + os.linesep)
+
+    failed_count = 0
+    transaction_count = 0
+    for result in results:
+        name = os.path.basename(result['file_name'])
+        if (result['error'] is not None):
+            failed_count += 1
+            out_file.write('{:<30s} {:s}{:s}'.format(name, result['error'], os.linesep))
+            continue
+
+        transaction_count += result['transaction_count']
+        rate = 0.0
+        if (result['elapsed']):
+            rate = (result['transaction_count'] / result['elapsed'])
+        out_file.write(row.format(name,
+                                  result['packet_format'],
+                                  result['data_rate'],
+                                  result['crc'],
+                                  str(result['address_width']),
+                                  str(result['tx_count']),
+                                  str(result['rx_count']),
+                                  '{:,.0f}'.format(rate),
+                                  str(result['channels'])))
+
+    out_file.write('-' * 100 + os.linesep)
+    out_file.write('{:<25s} {:d}{:s}'.format('Files decoded:',
+                                             (len(results) - failed_count),
+                                             os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Files failed:', failed_count, os.linesep))
+    out_file.write('{:<25s} {:d}{:s}'.format('Transactions:', transaction_count, os.linesep))
+    out_file.write('{:<25s} {:.2f}s{:s}'.format('Elapsed:', elapsed, os.linesep))
+    if (elapsed):
+        out_file.write('{:<25s} {:,.0f} transactions/s{:s}'.format('Throughput:',
+                                                                  (transaction_count / elapsed),
+                                                                  os.linesep))
+    return failed_count
+
+
+if ("__main__" == __name__):
+    """Parses the SPI trace of a Saleae logic analyzer and creates a version of the
+    trace that contains human-readable names and/or creates micro-esb init code.
+
+    USAGE:    python nrf24l01p-decode.py -i in.txt -o out.txt -u uesb.txt
+    OPTIONS:
+        -i    [required]    Specify the path of the input file to use. Files that are
+                            compressed with gzip, bzip2, xz (requires backports.lzma)
+                            or zstd (requires zstandard) are decompressed while they
+                            are read, but can't be used with -j (except with -b or
+                            --demux), -f, --seek_index or --resume.
+        -o    [optional]    Specify the path of the human-readable output file to create
+        -u    [optional]    Specify the path of the micro-esb init code file to create
+        -s    [optional]    Write the output file while decoding and put the summary
+                            at the end of it instead of the beginning
+        -j    [optional]    Specify the number of processes to decode with (defaults
+                            to 1, or to the number of CPUs with -b)
+        --state_index       Specify the path of a state index file to create (or to
+                            use if it already exists). It is created by the sequential
+                            decode (with or without -s), so without --state_at it
+                            can't be combined with -j, --filter, -e or --resume, and
+                            never with -b, --demux or -f.
+        --state_at          Print the configuration after the given transaction ID
+        --state_at_time     Print the configuration at the given time (in seconds)
+        --cache_dir         Specify a directory for caching parsed input files
+        --cache_size        Specify the maximum size of the cache directory (in MB)
+        -f    [optional]    Decode the input file while it is being written (or stdin
+                            if the input file is '-') and write to the output file (or
+                            stdout) as soon as each transaction is complete. Send
+                            SIGUSR1 to print the summary to stderr and rewrite the
+                            micro-esb init code file.
+        --summary           Print the summary to stdout. Without -o only the state
+                            that the summary and the micro-esb init code need is
+                            decoded, which is much faster.
+        --stats             Time the handler of each command and count the errors, and
+                            print the results to stderr (or write them as JSON to the
+                            given file). Can't be combined with -b or -j.
+        --timing            Add the intervals between payloads (per command and RF
+                            channel) and the durations of the SPI transactions to the
+                            summary (and write them as JSON to the given file). Can't
+                            be combined with -b or -j.
+        --modes             Record the operational mode (POWER_DOWN, STANDBY, PTX, or
+                            PRX) and RF channel over time and add the time and duty
+                            cycle of each mode, and of PTX and PRX on each channel,
+                            to the summary (and write them and the intervals as JSON
+                            to the given file). Can't be combined with -b or -j.
+        --channels          Add a table with the dwell time, number of hops, and
+                            number of TX and RX payloads of each RF channel, and the
+                            hop cycle that is being repeated, to the summary (and
+                            write them and the whole hop sequence as JSON to the
+                            given file). Can't be combined with -b or -j.
+        -b    [optional]    Treat the input file as a directory or glob pattern and
+                            decode every matching file in a pool of processes (see
+                            -j). The output file and micro-esb init code of each file
+                            are written to the directory given with -o and a report
+                            that summarizes every file is printed.
+        --filter            Only write the transactions that match the given filter
+                            expression (to the output file, or stdout), e.g.
+                            "cmd:W_REGISTER(RF_CH),W_TX_PAYLOAD time:12.5..30". See
+                            TransactionFilter for the terms. Can't be combined with
+                            -b, -j or -f.
+        --seek_index        Create an index of the byte offsets of the transactions
+                            in the input file and of the state at each of them (or
+                            use it if it is up to date) so that --filter can start
+                            decoding at its time or ID range. It is stored next to
+                            the input file unless a path is given.
+        -e    [optional]    Specify the path of a file to export the decoded
+                            transactions to as records (timestamp, ID, command,
+                            register, fields, data, operational mode, delta, note).
+                            The format is chosen by the extension (.jsonl, .csv,
+                            .parquet, or .npz) unless --export_format is given.
+                            Can be combined with --filter but not with -o, -b, -j
+                            or -f.
+        --export_format     One of jsonl, csv, parquet (requires pyarrow), or npz
+                            (requires NumPy)
+        --demux             Split an input file with several radios on the same bus
+                            into one stream per device (by its CS column or the
+                            --device ranges) and decode the streams in a pool of
+                            processes (see -j). The output file and micro-esb init
+                            code of each device and a timeline of all devices are
+                            written to the directory given with -o.
+        --device            Name a device: NAME=VALUE for a value of the CS column,
+                            or NAME=START..END for a range of Packet IDs. Can be
+                            given more than once.
+        --resume            Decode an input file that is still being appended to
+                            into the output file (with the summary at the end, as
+                            with -s) and save a checkpoint of the decoder's state
+                            next to it (or to the given path). Later runs only
+                            decode the new data and append it to the output file.
+                            Can't be combined with -b, --demux, -j, -f, --filter,
+                            -e, --stats, --timing, --modes or --channels.
+        --raw               Decode the transactions from the raw logic samples of the
+                            CS, SCLK, MOSI and MISO signals in the input file (a
+                            sigrok session or a raw binary file with a bit per
+                            channel) instead of from the SPI analyzer's export.
+                            The channels can be given as CS,SCLK,MOSI,MISO bit
+                            numbers or sigrok channel names (defaults to 0,1,2,3).
+                            Requires NumPy. Can't be combined with -b, --demux,
+                            -j, -f, --seek_index, --resume or --cache_dir.
+        --samplerate        The samplerate of a raw binary file, e.g. 24MHz
+        --sample_size       The number of bytes per sample of a raw binary file
+                            (defaults to 1)
+        --decompress_thread Decompress a compressed input file in a separate thread
+                            while it is being parsed
+        --collapse          Write a sequence of up to 8 transactions that is repeated
+                            3 or more times in a row (e.g. polling of the STATUS
+                            register) as a single line with the range of IDs and the
+                            number of repetitions. Can't be combined with -b,
+                            --demux, -j, -f, -e or --resume.
+
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_file', dest='input_file_name')
+    parser.add_argument('-o', '--output_file', dest='output_file_name')
+    parser.add_argument('-u', '--uesb_config_file', dest='uesb_file')
+    parser.add_argument('-s', '--stream', dest='stream', action='store_true')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int)
+    parser.add_argument('--state_index', dest='state_index_file')
+    parser.add_argument('--state_at', dest='state_at', type=int)
+    parser.add_argument('--state_at_time', dest='state_at_time', type=float)
+    parser.add_argument('--cache_dir', dest='cache_dir')
+    parser.add_argument('--cache_size', dest='cache_size', type=int,
+                        default=(CACHE_MAX_SIZE >> 20))
+    parser.add_argument('-f', '--follow', dest='follow', action='store_true')
+    parser.add_argument('-b', '--batch', dest='batch', action='store_true')
+    parser.add_argument('--summary', dest='summary', action='store_true')
+    parser.add_argument('--stats', dest='stats_file', nargs='?', const='-')
+    parser.add_argument('--timing', dest='timing_file', nargs='?', const='-')
+    parser.add_argument('--modes', dest='modes_file', nargs='?', const='-')
+    parser.add_argument('--channels', dest='channels_file', nargs='?', const='-')
+    parser.add_argument('--filter', dest='filter')
+    parser.add_argument('--seek_index', dest='seek_index_file', nargs='?', const='')
+    parser.add_argument('-e', '--export', dest='export_file_name')
+    parser.add_argument('--export_format', dest='export_format', choices=sorted(EXPORTERS))
+    parser.add_argument('--demux', dest='demux', action='store_true')
+    parser.add_argument('--device', dest='devices', action='append', default=[])
+    parser.add_argument('--resume', dest='checkpoint_file', nargs='?', const='')
+    parser.add_argument('--raw', dest='raw_channels', nargs='?', const='')
+    parser.add_argument('--samplerate', dest='samplerate')
+    parser.add_argument('--sample_size', dest='sample_size', type=int, default=1)
+    parser.add_argument('--decompress_thread', dest='decompress_thread', action='store_true')
+    parser.add_argument('--collapse', dest='collapse', action='store_true')
+    args = parser.parse_args()
+    if (args.input_file_name is None):
+        sys.stderr.write('ERROR: No input file specified\r\n')
+        sys.exit(-1)
+
+    # The input file, or a LogicCapture of it with --raw.
+    source = args.input_file_name
+    if (args.raw_channels is not None):
+        if (args.batch or args.demux or args.follow or (args.seek_index_file is not None) or
+                (args.checkpoint_file is not None) or (args.cache_dir is not None) or
+                ((args.jobs is not None) and (args.jobs > 1))):
+            sys.stderr.write('ERROR: --raw can not be combined with -b, --demux, -j, -f, ' +
+                             '--seek_index, --resume or --cache_dir\r\n')
+            sys.exit(-1)
+        try:
+            source = LogicCapture(args.input_file_name, args.samplerate,
+                                  (args.raw_channels.split(',') if args.raw_channels else None),
+                                  args.sample_size)
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+
+    if (args.decompress_thread):
+        DECOMPRESS_THREAD = True
+    if ((not args.batch) and (args.raw_channels is None) and
+            os.path.isfile(args.input_file_name) and
+            (_get_compression(args.input_file_name) is not None) and
+            (args.follow or ((not args.demux) and (args.jobs is not None) and (args.jobs > 1)))):
+        sys.stderr.write('ERROR: -f and -j can not be used with a compressed input file\r\n')
+        sys.exit(-1)
+
+    transaction_filter = None
+    if (args.filter is not None):
+        if (args.batch or args.demux or args.follow or
+                ((args.jobs is not None) and (args.jobs > 1))):
+            sys.stderr.write('ERROR: --filter can not be combined with -b, --demux, -j or -f\r\n')
+            sys.exit(-1)
+        try:
+            transaction_filter = TransactionFilter(args.filter)
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+
+    if (args.export_file_name is not None):
+        if ((args.output_file_name is not None) or args.batch or args.demux or args.follow or
+                ((args.jobs is not None) and (args.jobs > 1))):
+            sys.stderr.write('ERROR: -e can not be combined with -o, -b, --demux, -j or -f\r\n')
+            sys.exit(-1)
+
+    if (args.state_index_file is not None):
+        # The index is only built by a sequential decode of the whole file.
+        if (args.batch or args.demux or args.follow or
+                ((args.state_at is None) and (args.state_at_time is None) and
+                 ((transaction_filter is not None) or (args.export_file_name is not None) or
+                  (args.checkpoint_file is not None) or
+                  ((args.jobs is not None) and (args.jobs > 1))))):
+            sys.stderr.write('ERROR: --state_index can not be combined with -b, --demux, -j, ' +
+                             '-f, --filter, -e or --resume\r\n')
+            sys.exit(-1)
+
+    seek_index = None
+    if (args.seek_index_file is not None):
+        if (args.batch or args.follow):
+            sys.stderr.write('ERROR: --seek_index can not be combined with -b or -f\r\n')
+            sys.exit(-1)
+        try:
+            seek_index = SeekIndex.load_or_build(args.input_file_name,
+                                                 (args.seek_index_file or None))
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+
+    if (args.checkpoint_file is not None):
+        if (args.batch or args.demux or args.follow or (transaction_filter is not None) or
+                (args.export_file_name is not None) or (args.stats_file is not None) or
+                (args.timing_file is not None) or (args.modes_file is not None) or
+                (args.channels_file is not None) or
+                ((args.jobs is not None) and (args.jobs > 1))):
+            sys.stderr.write('ERROR: --resume can not be combined with -b, --demux, -j, -f, ' +
+                             '--filter, -e, --stats, --timing, --modes or --channels\r\n')
+            sys.exit(-1)
+        if (args.output_file_name is None):
+            sys.stderr.write('ERROR: --resume requires an output file (-o)\r\n')
+            sys.exit(-1)
+
+    if (args.collapse):
+        if (args.batch or args.demux or args.follow or (args.export_file_name is not None) or
+                (args.checkpoint_file is not None) or
+                ((args.jobs is not None) and (args.jobs > 1))):
+            sys.stderr.write('ERROR: --collapse can not be combined with -b, --demux, -j, -f, ' +
+                             '-e or --resume\r\n')
+            sys.exit(-1)
+
+    stats = None
+    timing = None
+    mode_timeline = None
+    channel_stats = None
+    if ((args.stats_file is not None) or (args.timing_file is not None) or
+            (args.modes_file is not None) or (args.channels_file is not None)):
+        if (args.batch or args.demux or ((args.jobs is not None) and (args.jobs > 1))):
+            sys.stderr.write('ERROR: --stats, --timing, --modes and --channels can not be ' +
+                             'combined with -b, --demux or -j\r\n')
+            sys.exit(-1)
+        if (args.stats_file is not None):
+            stats = DecodeStats()
+        if (args.timing_file is not None):
+            timing = TimingStats()
+        if (args.modes_file is not None):
+            mode_timeline = ModeTimeline()
+        if (args.channels_file is not None):
+            channel_stats = ChannelStats()
+
+    def new_decoder(decoder_class=Decode):
+        decoder = decoder_class()
+        if (stats is not None):
+            stats.attach(decoder)
+        if (timing is not None):
+            timing.attach(decoder)
+        if (mode_timeline is not None):
+            mode_timeline.attach(decoder)
+        if (channel_stats is not None):
+            channel_stats.attach(decoder)
+        return decoder
+
+    def write_stats():
+        if (stats is not None):
+            if ('-' == args.stats_file):
+                stats.write(sys.stderr)
+            else:
+                with open(args.stats_file, 'w') as stats_file:
+                    json.dump(stats.to_dict(), stats_file, indent=4, sort_keys=True)
+        if ((timing is not None) and ('-' != args.timing_file)):
+            with open(args.timing_file, 'w') as timing_file:
+                json.dump(timing.to_dict(), timing_file, indent=4, sort_keys=True)
+        if ((mode_timeline is not None) and ('-' != args.modes_file)):
+            with open(args.modes_file, 'w') as modes_file:
+                json.dump(mode_timeline.to_dict(), modes_file, indent=4, sort_keys=True)
+        if ((channel_stats is not None) and ('-' != args.channels_file)):
+            with open(args.channels_file, 'w') as channels_file:
+                json.dump(channel_stats.to_dict(), channels_file, indent=4, sort_keys=True)
+
+    cache = None
+    if (args.cache_dir is not None):
+        cache = TransactionCache(args.cache_dir, (args.cache_size << 20))
+
+    # With --filter, decoding stops at the end of the filter's ranges, but the
+    # summary and the statistics have to cover the whole file. They are then
+    # collected by a second pass instead.
+    summarize_all = ((transaction_filter is not None) and
+                     (args.summary or (args.uesb_file is not None) or (stats is not None) or
+                      (timing is not None) or (mode_timeline is not None) or
+                      (channel_stats is not None)))
+
+    def summarize_source():
+        if (timing is None):
+            return summarize_file(source, cache, new_decoder(SummaryDecode))
+        # TimingStats needs the deltas that only a Decode logs.
+        decoder = new_decoder()
+        for transaction in iter_records(source, decoder, cache):
+            pass
+        return decoder
+
+    if (args.batch):
+        file_names = _iter_batch_files(args.input_file_name)
+        if (not file_names):
+            sys.stderr.write('ERROR: No input files found\r\n')
+            sys.exit(-1)
+        if ((args.output_file_name is not None) and
+                (not os.path.isdir(args.output_file_name))):
+            os.makedirs(args.output_file_name)
+
+        start = time.time()
+        results = list(iter_decode_batch(file_names, args.output_file_name, args.jobs,
+                                         args.cache_dir, (args.cache_size << 20)))
+        failed_count = _write_batch_report(sys.stdout, results, (time.time() - start))
+        if (failed_count):
+            sys.exit(-1)
+        sys.exit(0)
+
+    if (args.demux):
+        if (args.output_file_name is None):
+            sys.stderr.write('ERROR: --demux requires an output directory (-o)\r\n')
+            sys.exit(-1)
+        if (not os.path.isdir(args.output_file_name)):
+            os.makedirs(args.output_file_name)
+
+        start = time.time()
+        try:
+            results = list(iter_decode_devices(args.input_file_name, args.output_file_name,
+                                               DeviceMap(args.devices), args.jobs))
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+        failed_count = _write_batch_report(sys.stdout, results, (time.time() - start))
+        if (failed_count):
+            sys.exit(-1)
+        sys.exit(0)
+
+    if (args.jobs is None):
+        args.jobs = 1
+
+    if (args.follow):
+        refresh_requested = [False]
+
+        def refresh(decoder=None):
+            if (decoder is None):
+                return refresh_requested[0]
+            refresh_requested[0] = False
+            _write_summary(sys.stderr, decoder)
+            if (args.uesb_file is not None):
+                with open(args.uesb_file, 'wb') as out_file:
+                    out_file.write(decoder.get_uesb_config())
+
+        def request_refresh(signum, frame):
+            refresh_requested[0] = True
+
+        if (hasattr(signal, 'SIGUSR1')):
+            signal.signal(signal.SIGUSR1, request_refresh)
+
+        if ('-' == args.input_file_name):
+            in_file = sys.stdin
+        else:
+            in_file = open(args.input_file_name)
+        if (args.output_file_name is None):
+            out_file = sys.stdout
+        else:
+            out_file = open(args.output_file_name, 'wb')
+
+        decoder = new_decoder()
+        try:
+            follow(in_file, out_file, decoder, refresh)
+        except KeyboardInterrupt:
+            pass
+
+        out_file.flush()
+        _write_summary(sys.stderr, decoder)
+        if (args.uesb_file is not None):
+            with open(args.uesb_file, 'wb') as uesb_file:
+                uesb_file.write(decoder.get_uesb_config())
+        write_stats()
+        sys.exit(0)
+
+    if ((args.state_at is not None) or (args.state_at_time is not None)):
+        try:
+            if ((args.state_index_file is not None) and os.path.exists(args.state_index_file)):
+                state_index = StateIndex.load(args.state_index_file)
+            else:
+                state_index = StateIndex()
+                parse_file(source, state_index, cache)
+                if (args.state_index_file is not None):
+                    state_index.save(args.state_index_file)
+
+            decoder = state_index.state_at(args.state_at, args.state_at_time)
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+        _write_registers(sys.stdout, decoder)
+        _write_summary(sys.stdout, decoder)
+        sys.exit(0)
+
+    if (args.checkpoint_file is not None):
+        try:
+            decoder = resume_file(args.input_file_name, args.output_file_name,
+                                  (args.checkpoint_file or None))
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+    elif (args.export_file_name is not None):
+        if (summarize_all):
+            decoder = Decode()
+        else:
+            decoder = new_decoder()
+        try:
+            export_file(source, args.export_file_name, args.export_format,
+                        decoder, cache, transaction_filter, seek_index)
+        except DecodeError as e:
+            sys.stderr.write(str(e) + '\r\n')
+            sys.exit(-1)
+
+        if (summarize_all):
+            decoder = summarize_source()
+    elif (transaction_filter is not None):
+        if (args.output_file_name is None):
+            out_file = sys.stdout
+        else:
+            out_file = open(args.output_file_name, 'wb')
+            _write_header(out_file, args.input_file_name)
+            out_file.write('-' * 80 + os.linesep)
+
+        if (summarize_all):
+            decoder = Decode()
+        else:
+            decoder = new_decoder()
+        for msg in iter_decode(source, decoder, cache, transaction_filter,
+                               seek_index, args.collapse):
+            out_file.write(msg + os.linesep)
+        if (out_file is not sys.stdout):
+            out_file.close()
+
+        if (summarize_all):
+            decoder = summarize_source()
+    elif ((args.output_file_name is None) and (args.state_index_file is None) and
+            (timing is None)):
+        # Nothing has to be rendered.
+        decoder = summarize_file(source, cache, new_decoder(SummaryDecode))
+    elif (args.jobs > 1):
+        decoder = Decode()
+        texts = iter_decode_parallel(args.input_file_name, decoder, args.jobs)
+        if (args.output_file_name is None):
+            for text in texts:
+                pass
+        elif (args.stream):
+            with open(args.output_file_name, 'wb') as out_file:
+                _write_header(out_file, args.input_file_name)
+                out_file.write('-' * 80 + os.linesep)
+                for text in texts:
+                    out_file.write(text)
+                _write_summary(out_file, decoder)
+        else:
+            # The summary comes first so the output has to be collected.
+            texts = list(texts)
+            with open(args.output_file_name, 'wb') as out_file:
+                _write_header(out_file, args.input_file_name)
+                _write_summary(out_file, decoder)
+                if (texts):
+                    texts[-1] = texts[-1][:-len(os.linesep)]
+                for text in texts:
+                    out_file.write(text)
+    elif (args.stream and (args.output_file_name is not None)):
+        state_index = None
+        if (args.state_index_file is not None):
+            state_index = StateIndex()
+
+        decoder = new_decoder()
+        with open(args.output_file_name, 'wb') as out_file:
+            _write_header(out_file, args.input_file_name)
+            out_file.write('-' * 80 + os.linesep)
+            for msg in iter_decode(source, decoder, cache, collapse=args.collapse,
+                                   state_index=state_index):
+                out_file.write(msg + os.linesep)
+            _write_summary(out_file, decoder)
+
+        if (state_index is not None):
+            state_index.save(args.state_index_file)
+    else:
+        state_index = None
+        if (args.state_index_file is not None):
+            state_index = StateIndex()
+
+        decoder = parse_file(source, state_index, cache, new_decoder())
+
+        if (state_index is not None):
+            state_index.save(args.state_index_file)
+
+        if (args.output_file_name is not None):
+            with open(args.output_file_name, 'wb') as out_file:
+                _write_header(out_file, args.input_file_name)
+                _write_summary(out_file, decoder)
+                out_file.write(os.linesep.join(decoder.iter_messages(args.collapse)))
+
+    if (args.summary):
+        _write_summary(sys.stdout, decoder)
 
     if (args.uesb_file is not None):
         with open(args.uesb_file, 'wb') as out_file:
             out_file.write(decoder.get_uesb_config())
 
+    write_stats()
     sys.exit(0)